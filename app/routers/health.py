@@ -2,9 +2,10 @@
 Health Router - System Monitoring and Status
 """
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Response
 from pydantic import BaseModel
 from typing import Dict, Any
+import asyncio
 import time
 import psutil
 import os
@@ -63,15 +64,22 @@ async def system_status():
         )
 
 @router.get("/ready")
-async def readiness_check(request: Request):
+async def readiness_check(request: Request, response: Response):
     """Readiness check to ensure the system is ready to serve requests."""
     try:
-        # Check if RAG engine is available
-        if hasattr(request.app.state, 'rag_engine'):
-            return {"status": "ready", "message": "System is ready to serve requests"}
-        else:
+        # Check if RAG engine is available and, when sources are configured, has loaded its index
+        engine = getattr(request.app.state, 'rag_engine', None)
+        if engine is None:
+            response.status_code = 503
             return {"status": "not_ready", "message": "RAG engine not initialized"}
+        if engine.enabled and not engine.ready:
+            response.status_code = 503
+            return {"status": "not_ready", "message": "RAG index is still loading",
+                    "rag": await asyncio.to_thread(engine.stats)}
+        return {"status": "ready", "message": "System is ready to serve requests",
+                "rag": await asyncio.to_thread(engine.stats)}
     except Exception as e:
+        response.status_code = 503
         return {"status": "error", "message": f"Readiness check failed: {str(e)}"}
 
 @router.get("/live")
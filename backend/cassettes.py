@@ -0,0 +1,182 @@
+"""
+LLM Cassettes - Record model calls once, replay them offline
+
+In record mode the OpenAI client is wrapped so every chat completion is
+appended to a cassette file as one JSON line: the request, the raw response
+(or the streamed chunks with their arrival times), the usage and the latency.
+In replay mode a stand-in client answers from the cassette instead of the
+API, sleeping for the recorded latency times DOCUGENIUS_REPLAY_TIME_SCALE
+(0 = answer immediately). The whole backend then runs deterministically,
+offline and for free, which is what benchmarks and parser regression tests
+need.
+
+Recordings are matched by their messages, so any change to prompt
+construction shows up as a CassetteMiss rather than a stale answer.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import types
+from typing import Dict, Iterator, List
+
+# "record", "replay" or empty (talk to the API as usual)
+CASSETTE_MODE = os.getenv("DOCUGENIUS_LLM_CASSETTE_MODE", "").lower()
+CASSETTE_PATH = os.getenv("DOCUGENIUS_LLM_CASSETTE", "llm_cassette.jsonl")
+# Multiplier for recorded latencies on replay (1 = original timing, 0 = none)
+REPLAY_TIME_SCALE = float(os.getenv("DOCUGENIUS_REPLAY_TIME_SCALE", "1.0"))
+
+class CassetteMiss(LookupError):
+    pass
+
+def request_key(messages: List[Dict]) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _plain(value):
+    """SDK objects (pydantic models or namespaces) as JSON-ready values"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, types.SimpleNamespace):
+        value = vars(value)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+def _namespace(value):
+    """Recorded JSON back as attribute-access objects, like the SDK's responses"""
+    if isinstance(value, dict):
+        return types.SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+def _completions(create) -> types.SimpleNamespace:
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+
+class RecordingClient:
+    """Passes calls through to an OpenAI client and appends each exchange to a cassette"""
+
+    def __init__(self, client, path: str = CASSETTE_PATH):
+        self.client = client
+        self.path = path
+        self.chat = _completions(self.create).chat
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(kwargs, response, started)
+        self._append(kwargs, {"response": _plain(response), "latency": time.perf_counter() - started})
+        return response
+
+    def _record_stream(self, kwargs: Dict, stream, started: float) -> "RecordedStream":
+        chunks = []
+
+        def chunk_times() -> Iterator:
+            try:
+                for chunk in stream:
+                    chunks.append([time.perf_counter() - started, _plain(chunk)])
+                    yield chunk
+            finally:
+                # Streams the caller abandoned are recorded as far as they got
+                self._append(kwargs, {"chunks": chunks, "latency": time.perf_counter() - started})
+
+        return RecordedStream(chunk_times(), stream)
+
+    def _append(self, kwargs: Dict, recorded: Dict):
+        request = {key: value for key, value in kwargs.items() if key != "stream_options"}
+        line = json.dumps({"key": request_key(kwargs["messages"]), "request": request,
+                           "recorded_at": time.time(), **recorded}) + "\n"
+        with self._lock, open(self.path, "a") as handle:
+            handle.write(line)
+
+class RecordedStream:
+    """Iterator over a stream's chunks that also closes the stream underneath"""
+
+    def __init__(self, chunks: Iterator, stream=None):
+        self._chunks = chunks
+        self._stream = stream
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self._chunks.close()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+class ReplayClient:
+    """Serves chat completions from a cassette, with the recorded latency scaled by time_scale
+
+    Calls with the same messages get the matching recordings in turn, starting
+    over after the last one. Streamed and plain recordings are converted when
+    the call asks for the other kind.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, time_scale: float = REPLAY_TIME_SCALE):
+        self.path = path
+        self.time_scale = time_scale
+        self.chat = _completions(self.create).chat
+        self.recordings: Dict[str, List[Dict]] = {}
+        self.served = 0
+        self.misses = 0
+        self._turns: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with open(path) as handle:
+            for line in handle:
+                if line.strip():
+                    recorded = json.loads(line)
+                    self.recordings.setdefault(recorded["key"], []).append(recorded)
+
+    def lookup(self, messages: List[Dict]) -> Dict:
+        key = request_key(messages)
+        with self._lock:
+            recordings = self.recordings.get(key)
+            if not recordings:
+                self.misses += 1
+                raise CassetteMiss(f"No recording in {self.path} for this prompt ({key[:12]})")
+            turn = self._turns.get(key, 0)
+            self._turns[key] = turn + 1
+            self.served += 1
+        return recordings[turn % len(recordings)]
+
+    def create(self, **kwargs):
+        recorded = self.lookup(kwargs["messages"])
+        if kwargs.get("stream"):
+            return RecordedStream(self._replay_chunks(recorded))
+        time.sleep(recorded["latency"] * self.time_scale)
+        if "response" in recorded:
+            return _namespace(recorded["response"])
+        return _namespace(_assemble(recorded["chunks"]))
+
+    def _replay_chunks(self, recorded: Dict) -> Iterator:
+        chunks = recorded.get("chunks")
+        if chunks is None:
+            chunks = [[recorded["latency"], chunk] for chunk in _split(recorded["response"])]
+        started = time.perf_counter()
+        for offset, chunk in chunks:
+            delay = offset * self.time_scale - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            yield _namespace(chunk)
+
+def _assemble(chunks: List) -> Dict:
+    """A plain completion from streamed chunks: the deltas joined, the usage from the last chunk"""
+    content = "".join((choice.get("delta") or {}).get("content") or ""
+                      for _, chunk in chunks for choice in chunk.get("choices", []))
+    usage = next((chunk["usage"] for _, chunk in reversed(chunks) if chunk.get("usage")), {})
+    model = chunks[0][1].get("model") if chunks else None
+    return {"model": model, "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": usage}
+
+def _split(response: Dict) -> List[Dict]:
+    """Stream chunks for a plain completion: the whole content as one delta, then the usage"""
+    content = response["choices"][0]["message"].get("content") or ""
+    return [{"model": response.get("model"), "choices": [{"index": 0, "delta": {"content": content}}]},
+            {"model": response.get("model"), "choices": [], "usage": response.get("usage", {})}]
@@ -0,0 +1,169 @@
+"""
+Prompt Compaction - Strip non-semantic content from submitted code
+
+Removes comments (including license headers), trailing whitespace and
+repeated blank lines, folds long string literals and data tables, and keeps
+a map from compacted to original line numbers so the explanation can be
+rewritten to reference the lines the user actually pasted.
+"""
+
+import io
+import re
+import tokenize
+from typing import Dict, List, NamedTuple, Optional
+
+# Literals longer than this are folded to a prefix and a length marker
+LITERAL_FOLD_CHARS = 120
+LITERAL_KEEP_CHARS = 40
+# Runs of at least this many data-only lines are folded, keeping the first few
+DATA_RUN_MIN = 8
+DATA_RUN_KEEP = 3
+# Rough characters-per-token ratio for savings estimates
+CHARS_PER_TOKEN = 4
+
+C_LIKE = {"javascript", "typescript", "java", "csharp", "cpp", "rust", "go"}
+
+_C_LIKE_STRINGS = {
+    # Single quotes are character literals (or Rust lifetimes) outside JavaScript/TypeScript
+    "javascript": r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    "typescript": r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    "go": r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])\'|`[^`]*`',
+}
+_C_LIKE_DEFAULT_STRINGS = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])\''
+_C_LIKE_PATTERNS = {
+    language: re.compile(
+        rf'(?P<string>{_C_LIKE_STRINGS.get(language, _C_LIKE_DEFAULT_STRINGS)})|(?P<comment>//[^\n]*|/\*.*?\*/)',
+        re.DOTALL
+    )
+    for language in C_LIKE
+}
+_LINE_STRING = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'')
+_DATA_ITEM = r'(?:[-+]?\d[\w.+-]*|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|true|false|null|nil|None|True|False)'
+_DATA_LINE = re.compile(rf'^\s*[\[({{]*\s*{_DATA_ITEM}(?:\s*[,:]\s*[\[({{]*\s*{_DATA_ITEM}\s*[\])}}]*)*\s*[\])}}]*\s*,?\s*$')
+_LINE_REFERENCE = re.compile(r'\b([Ll]ines?\s+)(\d+)(?:(\s*(?:-|–|to|and)\s*)(\d+))?')
+
+class CompactionResult(NamedTuple):
+    text: str
+    line_map: List[int]  # compacted line index -> original 1-based line number
+    original_lines: int
+    original_chars: int
+    compacted_chars: int
+
+    @property
+    def chars_saved(self) -> int:
+        return self.original_chars - self.compacted_chars
+
+    def stats(self) -> Dict:
+        return {
+            "original_chars": self.original_chars,
+            "compacted_chars": self.compacted_chars,
+            "chars_saved": self.chars_saved,
+            "estimated_tokens_saved": self.chars_saved // CHARS_PER_TOKEN,
+            "ratio": round(self.compacted_chars / self.original_chars, 3) if self.original_chars else 1.0,
+            "original_lines": self.original_lines,
+            "compacted_lines": len(self.line_map)
+        }
+
+def _strip_python_comments(source: str) -> str:
+    lines = source.splitlines(keepends=True)
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return source
+    # Blank comments from the end so earlier column offsets stay valid
+    for token in reversed(tokens):
+        if token.type == tokenize.COMMENT:
+            row, col = token.start
+            line = lines[row - 1]
+            newline = line[len(line.rstrip("\r\n")):]
+            lines[row - 1] = line[:col] + newline
+    return "".join(lines)
+
+def _strip_c_like_comments(source: str, language: str) -> str:
+    def replace(match):
+        comment = match.group("comment")
+        if comment is None:
+            return match.group(0)
+        # Keep line numbering intact for the line map
+        return "\n" * comment.count("\n")
+    return _C_LIKE_PATTERNS[language].sub(replace, source)
+
+def _fold_literal(match) -> str:
+    literal = match.group(0)
+    if len(literal) <= LITERAL_FOLD_CHARS:
+        return literal
+    quote = literal[0]
+    return f"{literal[:LITERAL_KEEP_CHARS]}…(+{len(literal) - LITERAL_KEEP_CHARS - 1} chars){quote}"
+
+def compact_code(source: str, language: str) -> Optional[CompactionResult]:
+    """Compact code for the prompt, or None for languages we cannot parse safely"""
+    if language == "python":
+        stripped = _strip_python_comments(source)
+        comment_marker = "#"
+    elif language in C_LIKE:
+        stripped = _strip_c_like_comments(source, language)
+        comment_marker = "//"
+    else:
+        return None
+
+    original_lines = source.splitlines()
+    kept: List[tuple[int, str]] = []
+    previous_blank = True
+    for number, (original, line) in enumerate(zip(original_lines, stripped.splitlines()), 1):
+        line = _LINE_STRING.sub(_fold_literal, line.rstrip())
+        if not line:
+            # Drop comment-only lines and collapse runs of blank lines
+            if original.strip() or previous_blank:
+                continue
+            previous_blank = True
+        else:
+            previous_blank = False
+        kept.append((number, line))
+
+    # Fold long runs of data-only lines (lookup tables, fixtures, matrices)
+    compacted: List[tuple[int, str]] = []
+    index = 0
+    while index < len(kept):
+        run_end = index
+        while run_end < len(kept) and _DATA_LINE.match(kept[run_end][1]):
+            run_end += 1
+        if run_end - index >= DATA_RUN_MIN:
+            compacted.extend(kept[index:index + DATA_RUN_KEEP])
+            first_folded, last_folded = kept[index + DATA_RUN_KEEP][0], kept[run_end - 1][0]
+            indent = kept[index][1][:len(kept[index][1]) - len(kept[index][1].lstrip())]
+            compacted.append((
+                first_folded,
+                f"{indent}{comment_marker} … {run_end - index - DATA_RUN_KEEP} similar data lines folded "
+                f"(original lines {first_folded}-{last_folded})"
+            ))
+            index = run_end
+        else:
+            compacted.append(kept[index])
+            index += 1
+
+    while compacted and not compacted[-1][1]:
+        compacted.pop()
+
+    text = "\n".join(line for _, line in compacted)
+    return CompactionResult(
+        text=text,
+        line_map=[number for number, _ in compacted],
+        original_lines=len(original_lines),
+        original_chars=len(source),
+        compacted_chars=len(text)
+    )
+
+def remap_line_references(text: str, line_map: List[int]) -> str:
+    """Rewrite 'line N' / 'lines N-M' from compacted to original numbering"""
+    def original(number: str) -> str:
+        index = int(number) - 1
+        return str(line_map[index]) if 0 <= index < len(line_map) else number
+
+    def replace(match):
+        prefix, start, separator, end = match.groups()
+        remapped = prefix + original(start)
+        if end is not None:
+            remapped += separator + original(end)
+        return remapped
+
+    return _LINE_REFERENCE.sub(replace, text)
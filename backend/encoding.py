@@ -0,0 +1,168 @@
+"""
+Response Encoding - Fast JSON rendering, conditional requests and negotiated compression
+
+orjson and brotli are optional: without orjson, dict payloads fall back to the
+standard json module, and without brotli only gzip is offered.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed (headers would eat the savings)
+COMPRESSION_MIN_BYTES = int(os.getenv("DOCUGENIUS_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("DOCUGENIUS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("DOCUGENIUS_BROTLI_QUALITY", "5"))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed"""
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that renders Pydantic models and plain data without jsonable_encoder
+
+    Returning one from an endpoint skips FastAPI's generic encoding pass, which
+    dominates the cost of large explanation payloads.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def etag_for(body: bytes) -> str:
+    """Strong entity tag derived from the response body"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as RFC 9110 specifies for If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+def conditional_response(content: Any, if_none_match: Optional[str], cache_control: str,
+                         body: Optional[bytes] = None, headers: Optional[dict] = None) -> Response:
+    """JSON response with ETag and Cache-Control, or a bodiless 304 when the client's copy is current
+
+    body, when given, is the already-rendered payload the ETag is computed from.
+    """
+    body = dumps(content) if body is None else body
+    headers = {**(headers or {}), "ETag": etag_for(body), "Cache-Control": cache_control}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def _quality(token: str) -> float:
+    for param in token.split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported content coding from an Accept-Encoding header ('br', 'gzip' or None)"""
+    offered = {}
+    for token in accept_encoding.split(","):
+        coding = token.split(";")[0].strip().lower()
+        if coding:
+            offered[coding] = _quality(token)
+    supported = (["br"] if brotli is not None else []) + ["gzip"]
+    choices = [(offered.get(coding, offered.get("*", 0.0)), -rank, coding)
+               for rank, coding in enumerate(supported)]
+    quality, _, coding = max(choices)
+    return coding if quality > 0 else None
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """Compress complete JSON/text responses above a size threshold with br or gzip
+
+    Streaming responses (zip and PDF exports) pass through untouched; their
+    payloads are already compressed.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers until we know whether the body is compressible
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            pending, start_message = start_message, None
+            headers = MutableHeaders(raw=pending["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+            if compressible:
+                body = compress(body, coding)
+                headers["Content-Encoding"] = coding
+                headers["Content-Length"] = str(len(body))
+                # The compressed bytes are a different representation of the same entity
+                if headers.get("etag", "").startswith('"'):
+                    headers["ETag"] = "W/" + headers["etag"]
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await send(pending)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,51 @@
+"""
+Examples - Preset prompts shown on the Examples page
+
+Used only by the backend, which prewarms the answer cache with them and
+serves them at ``/examples/``; the Streamlit UI fetches them from there.
+"""
+
+EXAMPLES = [
+    {
+        "title": "Python Function",
+        "description": "Explain this Python function in detail",
+        "prompt": "def fibonacci(n):\n    if n <= 1:\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)",
+        "category": "Code Explanation",
+        "icon": "🐍"
+    },
+    {
+        "title": "Streamlit Code",
+        "description": "Explain this Streamlit code",
+        "prompt": "col1, col2, col3 = st.columns(3)\nwith col1:\n    st.metric('Generation Time', '3.4s')\nwith col2:\n    st.metric('Confidence', '90%')",
+        "category": "Code Explanation",
+        "icon": "📊"
+    },
+    {
+        "title": "JavaScript Function",
+        "description": "Explain this JavaScript function",
+        "prompt": "function processData(data, callback) {\n    console.log('Processing:', data);\n    callback(data);\n}",
+        "category": "Code Explanation",
+        "icon": "⚡"
+    },
+    {
+        "title": "DOM Concept",
+        "description": "Explain DOM manipulation in simple terms",
+        "prompt": "What is DOM manipulation and how does it work?",
+        "category": "Concept Explanation",
+        "icon": "🌳"
+    },
+    {
+        "title": "API Concept",
+        "description": "Explain REST APIs in simple terms",
+        "prompt": "What are REST APIs and how do they work?",
+        "category": "Concept Explanation",
+        "icon": "🔗"
+    },
+    {
+        "title": "React Hooks",
+        "description": "Explain React hooks concept",
+        "prompt": "What are React hooks and why are they useful?",
+        "category": "Concept Explanation",
+        "icon": "⚛️"
+    }
+]
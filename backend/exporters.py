@@ -0,0 +1,359 @@
+"""
+Report Exporters - Render DocuGenius results to downloadable documents
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html import escape as html_escape
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+from xml.sax.saxutils import escape
+
+from shared_store import SharedStore
+
+# Rendered reports kept in the shared store, keyed by result hash
+PDF_CACHE_MAX_ENTRIES = int(os.getenv("DOCUGENIUS_PDF_CACHE_SIZE", "128"))
+PDF_RENDER_WORKERS = int(os.getenv("DOCUGENIUS_PDF_WORKERS", "2"))
+STREAM_CHUNK_SIZE = 64 * 1024
+# Results rendered ahead of the zip writer during a bulk export
+EXPORT_CONCURRENCY = int(os.getenv("DOCUGENIUS_EXPORT_CONCURRENCY", "8"))
+
+EXPORT_FORMATS = {
+    "markdown": "md",
+    "html": "html",
+    "json": "json",
+    "pdf": "pdf"
+}
+
+def result_hash(result: Dict) -> str:
+    """Stable content hash of a result payload"""
+    canonical = json.dumps(result, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def render_pdf(result: Dict) -> bytes:
+    """Generate PDF from the explanation result"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Preformatted, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    story = []
+
+    # Get styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        textColor=colors.HexColor('#667eea')
+    )
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=20,
+        textColor=colors.HexColor('#4a5568')
+    )
+    code_style = ParagraphStyle(
+        'CodeBlock',
+        parent=styles['Code'],
+        fontSize=8,
+        leading=10,
+        backColor=colors.HexColor('#f8f9fa'),
+        borderPadding=6
+    )
+    normal_style = styles['Normal']
+
+    def text(value) -> Paragraph:
+        # Paragraph parses its input as markup, so model output must be escaped
+        return Paragraph(escape(str(value)), normal_style)
+
+    # Title
+    story.append(Paragraph("DocuGenius - AI Explanation Report", title_style))
+    story.append(Spacer(1, 20))
+
+    # Metrics
+    story.append(Paragraph("📊 Generation Metrics", heading_style))
+    metrics_data = [
+        ["Metric", "Value"],
+        ["Generation Time", f"{result.get('generation_time', 0):.2f} seconds"],
+        ["Confidence", f"{result.get('confidence', 0):.1%}"],
+        ["Success", "✅" if result.get('success', False) else "❌"]
+    ]
+    metrics_table = Table(metrics_data, colWidths=[2*inch, 3*inch])
+    metrics_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(metrics_table)
+    story.append(Spacer(1, 20))
+
+    # Main Explanation
+    if result.get('explanation'):
+        story.append(Paragraph("📝 Explanation", heading_style))
+        story.append(text(result['explanation']))
+        story.append(Spacer(1, 20))
+
+    # Breakdown
+    if result.get('breakdown'):
+        story.append(Paragraph("📋 Breakdown", heading_style))
+        for i, step in enumerate(result['breakdown'], 1):
+            story.append(text(f"{i}. {step}"))
+        story.append(Spacer(1, 20))
+
+    # Code Analysis - Preformatted splits across pages and needs no markup escaping
+    if result.get('code_analysis'):
+        story.append(Paragraph("💻 Code Analysis", heading_style))
+        for i, code in enumerate(result['code_analysis'], 1):
+            story.append(Paragraph(f"Analysis {i}:", normal_style))
+            story.append(Preformatted(str(code), code_style, maxLineLength=95, newLineChars='  '))
+            story.append(Spacer(1, 10))
+        story.append(Spacer(1, 20))
+
+    # External Resources
+    if result.get('external_resources'):
+        story.append(Paragraph("🔗 External Resources", heading_style))
+        for resource in result['external_resources']:
+            if isinstance(resource, dict) and 'url' in resource:
+                story.append(text(f"📚 {resource.get('name', '')}: {resource['url']}"))
+            else:
+                story.append(text(f"📚 {resource}"))
+        story.append(Spacer(1, 20))
+
+    # Message
+    if result.get('message'):
+        story.append(Paragraph("ℹ️ Additional Information", heading_style))
+        story.append(text(result['message']))
+
+    # Build PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+def _title(entry: Dict) -> str:
+    query = entry.get("query", "").strip()
+    return query.splitlines()[0][:80] if query else "DocuGenius Explanation"
+
+def render_markdown(entry: Dict) -> bytes:
+    """Render a history entry as a Markdown page"""
+    result = entry["result"]
+    lines = [f"# {_title(entry)}", ""]
+    lines.append(f"*Mode:* {entry.get('mode', '')} · *Audience:* {entry.get('audience', '')} · *Result ID:* `{entry['result_id']}`")
+    lines.append("")
+    if entry.get("query"):
+        lines.extend(["## Query", "", "```", entry["query"], "```", ""])
+    if result.get("explanation"):
+        lines.extend(["## Explanation", "", result["explanation"], ""])
+    if result.get("breakdown"):
+        lines.extend(["## Breakdown", ""])
+        lines.extend(f"{i}. {step}" for i, step in enumerate(result["breakdown"], 1))
+        lines.append("")
+    if result.get("code_analysis"):
+        lines.extend(["## Code Analysis", ""])
+        for code in result["code_analysis"]:
+            lines.extend(["```", code, "```", ""])
+    if result.get("external_resources"):
+        lines.extend(["## External Resources", ""])
+        lines.extend(f"- [{resource.get('name', resource.get('url', ''))}]({resource.get('url', '')})"
+                     for resource in result["external_resources"])
+        lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+def render_html(entry: Dict) -> bytes:
+    """Render a history entry as a standalone HTML page"""
+    result = entry["result"]
+    title = html_escape(_title(entry))
+    parts = [
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset=\"utf-8\"><title>{title}</title></head><body>",
+        f"<h1>{title}</h1>",
+        f"<p><em>Mode:</em> {html_escape(entry.get('mode', ''))} &middot; "
+        f"<em>Audience:</em> {html_escape(entry.get('audience', ''))} &middot; "
+        f"<em>Result ID:</em> <code>{html_escape(entry['result_id'])}</code></p>"
+    ]
+    if entry.get("query"):
+        parts.append(f"<h2>Query</h2><pre><code>{html_escape(entry['query'])}</code></pre>")
+    if result.get("explanation"):
+        parts.append(f"<h2>Explanation</h2><p>{html_escape(result['explanation'])}</p>")
+    if result.get("breakdown"):
+        parts.append("<h2>Breakdown</h2><ol>")
+        parts.extend(f"<li>{html_escape(step)}</li>" for step in result["breakdown"])
+        parts.append("</ol>")
+    if result.get("code_analysis"):
+        parts.append("<h2>Code Analysis</h2>")
+        parts.extend(f"<pre><code>{html_escape(code)}</code></pre>" for code in result["code_analysis"])
+    if result.get("external_resources"):
+        parts.append("<h2>External Resources</h2><ul>")
+        parts.extend(f"<li><a href=\"{html_escape(resource.get('url', ''))}\">"
+                     f"{html_escape(resource.get('name', resource.get('url', '')))}</a></li>"
+                     for resource in result["external_resources"])
+        parts.append("</ul>")
+    parts.append("</body></html>")
+    return "\n".join(parts).encode("utf-8")
+
+def render_json(entry: Dict) -> bytes:
+    """Render a history entry as pretty-printed JSON"""
+    return json.dumps(entry, indent=2, ensure_ascii=False, default=str).encode("utf-8")
+
+TEXT_RENDERERS = {
+    "markdown": render_markdown,
+    "html": render_html,
+    "json": render_json
+}
+
+def iter_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a rendered document in fixed-size chunks for streaming"""
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield bytes(view[offset:offset + chunk_size])
+
+class PDFExporter:
+    """Memoized PDF rendering backed by a process pool"""
+
+    CACHE_NAMESPACE = "pdf"
+
+    def __init__(self, store: SharedStore, max_entries: int = PDF_CACHE_MAX_ENTRIES, workers: int = PDF_RENDER_WORKERS):
+        self.store = store
+        self.max_entries = max_entries
+        self.workers = workers
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def cached(self, key: str) -> Optional[bytes]:
+        return self.store.get(self.CACHE_NAMESPACE, key)
+
+    async def render(self, result: Dict) -> tuple[str, bytes]:
+        """Return (result hash, PDF bytes), rendering at most once per hash"""
+        key = result_hash(result)
+        # A render stays pending until its bytes are in the store, so checking before and
+        # after the lookup leaves no window in which a finished report is rendered again
+        pending = self._pending.get(key)
+        if pending is None:
+            pdf_bytes = await asyncio.to_thread(self.cached, key)
+            if pdf_bytes is not None:
+                return key, pdf_bytes
+            pending = self._pending.get(key)
+
+        # Concurrent requests for the same report share a single render
+        if pending is None:
+            pending = asyncio.ensure_future(self._render_and_store(key, result))
+            self._pending[key] = pending
+
+        return key, await asyncio.shield(pending)
+
+    async def _render_and_store(self, key: str, result: Dict) -> bytes:
+        try:
+            loop = asyncio.get_running_loop()
+            pdf_bytes = await loop.run_in_executor(self._get_executor(), render_pdf, result)
+            await asyncio.to_thread(self._write, key, pdf_bytes)
+            return pdf_bytes
+        finally:
+            self._pending.pop(key, None)
+
+    def _write(self, key: str, pdf_bytes: bytes):
+        self.store.set(self.CACHE_NAMESPACE, key, pdf_bytes)
+        self.store.prune(self.CACHE_NAMESPACE, self.max_entries)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+class _ZipSink:
+    """Write-only, non-seekable buffer drained after every archive member"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+async def _render_entry(result_id: str, load: Callable[[str], Optional[Dict]], formats: List[str],
+                        pdf_exporter: PDFExporter) -> Optional[tuple[Dict, List[tuple[str, bytes]]]]:
+    entry = await asyncio.to_thread(load, result_id)
+    if entry is None:
+        # Pruned from the history since the export was requested
+        return None
+    files = []
+    for fmt in formats:
+        name = f"{fmt}/{entry['result_id']}.{EXPORT_FORMATS[fmt]}"
+        if fmt == "pdf":
+            _, data = await pdf_exporter.render(entry["result"])
+        else:
+            data = TEXT_RENDERERS[fmt](entry)
+        files.append((name, data))
+    return {key: entry[key] for key in ("result_id", "query", "mode", "audience", "created_at")}, files
+
+async def stream_zip(result_ids: Iterable[str], load: Callable[[str], Optional[Dict]], formats: List[str],
+                     pdf_exporter: PDFExporter, concurrency: int = EXPORT_CONCURRENCY) -> AsyncIterator[bytes]:
+    """Load and render entries to every format in parallel and stream them as a zip archive.
+
+    Entries are loaded with ``load`` (a blocking lookup, run in a worker
+    thread) only when their render starts, at most ``concurrency`` ahead of
+    the writer. Each member is compressed in a worker thread and the archive
+    buffer is drained after it, so memory stays bounded and the event loop
+    free however many entries are exported.
+    """
+    sink = _ZipSink()
+    index = []
+    in_flight: "deque[asyncio.Task]" = deque()
+    result_ids = iter(result_ids)
+
+    try:
+        with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            while True:
+                for result_id in result_ids:
+                    in_flight.append(asyncio.ensure_future(_render_entry(result_id, load, formats, pdf_exporter)))
+                    if len(in_flight) >= concurrency:
+                        break
+                if not in_flight:
+                    break
+
+                rendered = await in_flight.popleft()
+                if rendered is None:
+                    continue
+                summary, files = rendered
+                index.append(summary)
+                for name, data in files:
+                    await asyncio.to_thread(archive.writestr, name, data)
+                    yield sink.drain()
+
+            archive.writestr("index.json", json.dumps(index, indent=2, default=str))
+    finally:
+        # A client that disconnects closes the generator at a yield; stop the renders queued for it
+        for task in in_flight:
+            task.cancel()
+    yield sink.drain()
@@ -0,0 +1,121 @@
+"""
+Result History - Generated explanations addressable by result ID
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from shared_store import SharedStore
+
+HISTORY_MAX_ENTRIES = int(os.getenv("DOCUGENIUS_HISTORY_SIZE", "1000"))
+
+class ResultHistory:
+    """Bounded store of generated results, shared by all workers through the shared store"""
+
+    def __init__(self, store: SharedStore, max_entries: int = HISTORY_MAX_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self.store.connection().executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                result_id TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                audience TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_created ON history (created_at);
+        """)
+
+    @staticmethod
+    def _entry(row) -> Dict:
+        result_id, query, mode, audience, created_at, result = row
+        return {
+            "result_id": result_id,
+            "query": query,
+            "mode": mode,
+            "audience": audience,
+            "created_at": created_at,
+            "result": json.loads(result)
+        }
+
+    def add(self, request: Dict, result: Dict) -> Dict:
+        """Record a result (which must carry its result_id) and return the entry"""
+        entry = {
+            "result_id": result["result_id"],
+            "query": request.get("query", ""),
+            "mode": request.get("mode", ""),
+            "audience": request.get("audience", ""),
+            "created_at": time.time(),
+            "result": result
+        }
+        connection = self.store.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?)",
+            (entry["result_id"], entry["query"], entry["mode"], entry["audience"],
+             entry["created_at"], json.dumps(result, default=str))
+        )
+        connection.execute(
+            "DELETE FROM history WHERE result_id IN "
+            "(SELECT result_id FROM history ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        return entry
+
+    def get(self, result_id: str) -> Optional[Dict]:
+        row = self.store.connection().execute(
+            "SELECT * FROM history WHERE result_id = ?", (result_id,)
+        ).fetchone()
+        return self._entry(row) if row else None
+
+    @staticmethod
+    def _filter(query: Optional[str], mode: Optional[str], audience: Optional[str]) -> Tuple[str, List]:
+        clauses, params = [], []
+        if mode:
+            clauses.append("mode = ?")
+            params.append(mode)
+        if audience:
+            clauses.append("audience = ?")
+            params.append(audience)
+        if query:
+            clauses.append("instr(lower(query), ?) > 0")
+            params.append(query.lower())
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def search(self, query: Optional[str] = None, mode: Optional[str] = None,
+               audience: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Newest-first entries matching a case-insensitive query substring, mode and audience"""
+        where, params = self._filter(query, mode, audience)
+        rows = self.store.connection().execute(
+            f"SELECT * FROM history {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+        )
+        return [self._entry(row) for row in rows.fetchall()]
+
+    def search_ids(self, query: Optional[str] = None, mode: Optional[str] = None,
+                   audience: Optional[str] = None, limit: int = 100) -> List[str]:
+        """Result IDs of ``search`` without loading the results themselves"""
+        where, params = self._filter(query, mode, audience)
+        rows = self.store.connection().execute(
+            f"SELECT result_id FROM history {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+        )
+        return [result_id for result_id, in rows.fetchall()]
+
+    def missing(self, result_ids: List[str]) -> List[str]:
+        """The given result IDs that are not in the history"""
+        connection = self.store.connection()
+        return [result_id for result_id in result_ids
+                if connection.execute("SELECT 1 FROM history WHERE result_id = ?", (result_id,)).fetchone() is None]
+
+    def top_queries(self, limit: int = 20) -> List[Tuple[str, str, str]]:
+        """Most frequently generated (query, mode, audience) combinations"""
+        rows = self.store.connection().execute(
+            """SELECT query, mode, audience FROM history GROUP BY query, mode, audience
+               ORDER BY COUNT(*) DESC, MAX(created_at) DESC LIMIT ?""",
+            (limit,)
+        )
+        return rows.fetchall()
+
+    def __len__(self) -> int:
+        return self.store.connection().execute("SELECT COUNT(*) FROM history").fetchone()[0]
@@ -0,0 +1,205 @@
+"""
+Language Detection - Ranked programming language guesses for code snippets
+
+Used only by the backend: for prompt context, uploads, repository docs and
+retrieval, and at ``/language/detect``, which the Streamlit UI calls for syntax
+highlighting.
+A snippet is scanned once with a compiled tokenizer. Each token adds small
+keyword-frequency evidence, and tokens that open a known construct (``def``,
+``fn``, ``#``, ``:=``, ...) try only the precompiled signatures indexed under
+them, so the cost stays linear in the input instead of retrying every
+signature at every position.
+"""
+
+import re
+from typing import Dict, List, NamedTuple
+
+# Below this much evidence the input is treated as prose
+MIN_SCORE = 3.0
+# Very large inputs are sampled from the head, the language rarely changes mid-file
+MAX_SCAN_CHARS = 200_000
+
+class LanguageScore(NamedTuple):
+    language: str
+    confidence: float
+
+# (trigger tokens, pattern matched at the trigger, {language: weight}).
+# A leading ^ means the trigger must be the first token on its line. For a
+# given trigger the first matching signature wins, so specific ones come first.
+SIGNATURES = [
+    # Java
+    ('public', r'public\s+static\s+void\s+main\s*\(\s*String', {'java': 6}),
+    ('System', r'System\.out\.print(?:ln|f)?\s*\(', {'java': 6}),
+    ('import', r'^import\s+javax?\.[\w.*]+\s*;', {'java': 6}),
+    ('package', r'^package\s+[\w.]+\s*;', {'java': 5}),
+    ('@', r'@Override\b', {'java': 4}),
+    ('public', r'public\s+(?:abstract\s+|static\s+|final\s+)*class\s+\w+', {'java': 3, 'csharp': 2}),
+    (('extends', 'implements'), r'\w+\s+\w+', {'java': 2, 'typescript': 1}),
+    # C#
+    ('using', r'^using\s+System(?:\.[\w.]+)?\s*;', {'csharp': 6}),
+    ('Console', r'Console\.Write(?:Line)?\s*\(', {'csharp': 6}),
+    ('{', r'\{\s*get;\s*(?:(?:private|protected|init)\s+)?set;\s*\}', {'csharp': 6}),
+    ('foreach', r'foreach\s*\(\s*\w+\s+\w+\s+in\b', {'csharp': 5}),
+    ('async', r'async\s+Task\b', {'csharp': 4}),
+    ('using', r'^using\s+[\w.]+\s*;', {'csharp': 3}),
+    ('var', r'var\s+\w+\s*=\s*new\b', {'csharp': 3}),
+    (('public', 'private', 'internal', 'protected'),
+     r'\w+\s+(?:static\s+)?(?:async\s+)?(?:override\s+)?(?:void|string|int|bool|Task(?:<[^>\n]*>)?)\s+[A-Z]\w*\s*\(',
+     {'csharp': 3, 'java': 1}),
+    ('namespace', r'namespace\s+[\w.]+', {'csharp': 3, 'cpp': 2}),
+    ('string', r'string\s+\w+\s*[=;]', {'csharp': 2, 'cpp': 1}),
+    # Go
+    ('err', r'err\s*!=\s*nil\b', {'go': 6}),
+    ('type', r'type\s+\w+\s+(?:struct|interface)\s*\{', {'go': 6}),
+    ('fmt', r'fmt\.\w+\s*\(', {'go': 6}),
+    ('func', r'func\s+(?:\([^)\n]*\)\s*)?\w+\s*\(', {'go': 5}),
+    ('package', r'^package\s+\w+[ \t]*$', {'go': 4}),
+    ('import', r'^import\s*\(', {'go': 4}),
+    (('chan', 'go'), r'chan\s+\w+|go\s+func\b', {'go': 3}),
+    (':=', r':=', {'go': 3, 'python': 0.5}),
+    # Rust
+    (('println', 'print', 'format', 'vec', 'panic', 'assert_eq'), r'\w+!\s*[(\[]', {'rust': 6}),
+    ('use', r'use\s+(?:std|crate|super|self)::', {'rust': 6}),
+    ('fn', r'fn\s+\w+\s*(?:<[^>\n]*>)?\s*\(', {'rust': 5}),
+    ('let', r'let\s+mut\s+\w+', {'rust': 5}),
+    ('impl', r'impl(?:<[^>\n]*>)?\s+\w+', {'rust': 4}),
+    ('&', r'&(?:mut\s+\w+|self\b)', {'rust': 4}),
+    ('&', r'&str\b', {'rust': 2}),
+    ('->', r'->\s*(?:Self|Result|Option|Vec|Box|&)', {'rust': 3}),
+    ('match', r'match\s+\w+\s*\{', {'rust': 3}),
+    (('i32', 'i64', 'u8', 'u32', 'u64', 'usize', 'f64'), r'\w+\b', {'rust': 2}),
+    # C++
+    ('std', r'std::\w+', {'cpp': 6}),
+    (('cout', 'cin'), r'cout\s*<<|cin\s*>>', {'cpp': 6}),
+    ('#', r'^#include\s*[<"]', {'cpp': 5}),
+    ('#', r'^#(?:define|ifndef|ifdef|endif|pragma)\b', {'cpp': 4}),
+    ('template', r'template\s*<', {'cpp': 5}),
+    ('int', r'int\s+main\s*\(', {'cpp': 4}),
+    (('nullptr', 'unique_ptr', 'shared_ptr'), r'\w+', {'cpp': 4}),
+    ('vector', r'vector<', {'cpp': 4}),
+    ('->', r'->(?=[A-Za-z_])', {'cpp': 2}),
+    ('::', r'::(?=[A-Za-z_])', {'cpp': 1, 'rust': 1}),
+    # TypeScript
+    (('type', 'export'), r'^(?:export\s+)?type\s+\w+(?:<[^>\n]*>)?\s*=', {'typescript': 5}),
+    ('(', r'\(\s*\w+\??\s*:\s*(?:string|number|boolean|any|unknown)\b', {'typescript': 5}),
+    (('const', 'let', 'var'), r'\w+\s+\w+\s*:\s*[\w<>\[\]|]+', {'typescript': 4, 'rust': 2}),
+    (('public', 'private', 'protected', 'readonly'), r'\w+\s+\w+\??\s*:', {'typescript': 4}),
+    ('interface', r'interface\s+\w+', {'typescript': 3, 'java': 1, 'csharp': 1}),
+    (')', r'\)\s*:\s*(?:string|number|boolean|void|any|unknown|never|Promise<)', {'typescript': 4}),
+    (':', r':\s*(?:string|number|boolean|any|unknown|never)\b', {'typescript': 3}),
+    # JavaScript (and TypeScript, which is a superset)
+    ('console', r'console\.\w+\s*\(', {'javascript': 3, 'typescript': 2}),
+    ('require', r'require\(\s*[\'"]', {'javascript': 3}),
+    ('import', r'import\s+(?:\{[^}\n]*\}|\w+|\*\s+as\s+\w+)\s+from\s+[\'"]', {'javascript': 3, 'typescript': 3}),
+    ('function', r'function\s*\w*\s*\(', {'javascript': 3, 'typescript': 2}),
+    (('document', 'window'), r'\w+\.\w+', {'javascript': 2, 'typescript': 1}),
+    (('module', 'export'), r'module\.exports\b|export\s+default\b', {'javascript': 2, 'typescript': 2}),
+    (('const', 'let', 'var'), r'\w+\s+\w+\s*=', {'javascript': 2, 'typescript': 1}),
+    (('===', '!=='), r'[=!]==', {'javascript': 2, 'typescript': 2}),
+    ('=>', r'=>', {'javascript': 1, 'typescript': 1, 'csharp': 1}),
+    # Python
+    ('def', r'def\s+\w+\s*\([^)\n]*\)\s*(?:->\s*[^:\n]+)?:', {'python': 5}),
+    ('def', r'def\s+\w+\s*\(', {'python': 3}),
+    ('from', r'^from\s+[\w.]+\s+import\b', {'python': 4}),
+    ('class', r'^class\s+\w+(?:\([^)\n]*\))?\s*:', {'python': 4}),
+    ('elif', r'elif\b', {'python': 3}),
+    ('except', r'except\b[^:\n]*:', {'python': 3}),
+    ('lambda', r'lambda\b[^:\n]*:', {'python': 3}),
+    ('import', r'^import\s+[\w.]+\s+as\s+\w+[ \t]*$', {'python': 4}),
+    ('import', r'^import\s+[\w.]+[ \t]*$', {'python': 2}),
+    ('for', r'^for\s+\w+(?:\s*,\s*\w+)*\s+in\s+[^\n]*:[ \t]*$', {'python': 3}),
+    ('with', r'^with\s+[\w.]+(?:\([^\n]*\))?(?:\s+as\s+\w+)?\s*:[ \t]*$', {'python': 3}),
+    ('print', r'^print\s*\(', {'python': 2}),
+    ('self', r'self\.\w+', {'python': 2}),
+    (('__init__', '__name__', '__main__', '__str__', '__repr__', '__dict__'), r'\w+', {'python': 2}),
+]
+
+# Identifier tokens that are weak evidence on their own but add up over a file
+KEYWORDS = {
+    'python': ('None', 'True', 'False', 'elif', 'lambda', 'yield', 'nonlocal', 'self', 'def', 'pass', 'raise', 'print', 'len', 'range'),
+    'javascript': ('undefined', 'console', 'function', 'const', 'let', 'typeof', 'prototype', 'async', 'await', 'null', 'this'),
+    'typescript': ('interface', 'type', 'readonly', 'string', 'number', 'boolean', 'keyof', 'enum', 'implements', 'namespace', 'unknown'),
+    'java': ('public', 'private', 'static', 'void', 'final', 'extends', 'implements', 'throws', 'String', 'boolean', 'new', 'null'),
+    'csharp': ('namespace', 'using', 'public', 'static', 'void', 'string', 'var', 'readonly', 'override', 'async', 'await', 'Task', 'bool', 'null'),
+    'rust': ('fn', 'let', 'mut', 'impl', 'pub', 'struct', 'enum', 'match', 'Some', 'None', 'Ok', 'Err', 'trait', 'crate', 'mod'),
+    'go': ('func', 'package', 'chan', 'defer', 'go', 'struct', 'interface', 'nil', 'range', 'make', 'err'),
+    'cpp': ('include', 'std', 'cout', 'endl', 'nullptr', 'template', 'typename', 'const', 'void', 'int', 'auto', 'struct', 'virtual'),
+}
+KEYWORD_WEIGHT = 0.25
+
+LANGUAGES = tuple(KEYWORDS)
+
+_TOKEN = re.compile(r'[A-Za-z_]\w*|===|!==|=>|:=|::|->|[#@&(){}:]')
+
+def _compile():
+    triggers: Dict[str, list] = {}
+    for trigger_tokens, pattern, weights in SIGNATURES:
+        line_start = pattern.startswith('^')
+        compiled = re.compile(pattern.lstrip('^'), re.MULTILINE)
+        if isinstance(trigger_tokens, str):
+            trigger_tokens = (trigger_tokens,)
+        for token in trigger_tokens:
+            triggers.setdefault(token, []).append((compiled, weights, line_start))
+    return triggers
+
+_TRIGGERS = _compile()
+
+_KEYWORD_WEIGHTS: Dict[str, Dict[str, float]] = {}
+for _language, _tokens in KEYWORDS.items():
+    for _token in _tokens:
+        _KEYWORD_WEIGHTS.setdefault(_token, {})[_language] = KEYWORD_WEIGHT
+
+def _at_line_start(text: str, position: int) -> bool:
+    line_begin = text.rfind('\n', 0, position) + 1
+    return not text[line_begin:position].strip(' \t')
+
+def score_languages(text: str) -> Dict[str, float]:
+    """Raw evidence per language from a single scan of the text"""
+    text = text[:MAX_SCAN_CHARS]
+    scores = dict.fromkeys(LANGUAGES, 0.0)
+    search = _TOKEN.search
+    triggers = _TRIGGERS
+    keyword_weights = _KEYWORD_WEIGHTS
+    position = 0
+    token = search(text)
+    while token is not None:
+        start = token.start()
+        position = token.end()
+        value = token.group()
+        weights = keyword_weights.get(value)
+        for signature, signature_weights, line_start in triggers.get(value, ()):
+            if line_start and not _at_line_start(text, start):
+                continue
+            match = signature.match(text, start)
+            if match:
+                weights = signature_weights
+                position = max(position, match.end())
+                break
+        if weights:
+            for language, weight in weights.items():
+                scores[language] += weight
+        token = search(text, position)
+    return scores
+
+def detect_languages(text: str, top_n: int = 3) -> List[LanguageScore]:
+    """Ranked language guesses with confidences summing to at most 1.0.
+
+    Returns an empty list when there is not enough evidence for any language.
+    """
+    if not text:
+        return []
+    scores = score_languages(text)
+    total = sum(scores.values())
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] < MIN_SCORE:
+        return []
+    return [
+        LanguageScore(language, round(score / total, 3))
+        for language, score in ranked[:top_n]
+        if score > 0
+    ]
+
+def detect_language(text: str) -> str:
+    """Detect programming language from text, 'text' when it does not look like code"""
+    ranked = detect_languages(text, top_n=1)
+    return ranked[0].language if ranked else 'text'
@@ -1,18 +1,141 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import openai
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.requests import HTTPConnection
+from typing import List, NamedTuple, Optional, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
+import threading
 import time
+import types
 import random
+import uuid
+import hashlib
+import functools
+import itertools
+import json
 from datetime import datetime
 import os
+import tempfile
+
+from exporters import EXPORT_FORMATS, PDFExporter, iter_chunks, stream_zip
+from history import ResultHistory
+from language_detection import detect_language, detect_languages
+from static_analysis import analyze_python, format_code_analysis, summarize_for_prompt
+from compaction import CompactionResult, compact_code, remap_line_references
+from encoding import CompressionMiddleware, FastJSONResponse, conditional_response
+from metrics import Metrics
+from shared_store import SharedStore
+from usage import UsageLedger, tenant_id
+from routing import ModelRouter
+from prewarm import PREWARM_ENABLED, PREWARM_TOP_QUERIES, Prewarmer
+from examples import EXAMPLES
+from retrieval import RAG_CONTEXT_CHARS, RAG_MAX_LAG, RAG_TOP_K, RAGEngine, SearchHit, format_context
+from repo_docs import MAX_FILE_BYTES, REPO_CONCURRENCY, RepositoryDocumenter, SourceUnit, collect_units, units_from_files
+from sessions import SUMMARY_MAX_TOKENS, Session, SessionStore, estimate_tokens
+from uploads import UploadError, receive_upload, sweep_spool
+from tracing import Tracer, TracingMiddleware, end_span, span, start_span
+from cassettes import CASSETTE_MODE, CASSETTE_PATH, RecordingClient, ReplayClient
+from profiling import (PROFILE_INTERVAL, PROFILE_MAX_SECONDS, PROFILE_TOKEN, Profile, ProfilerBusy,
+                       ProfilingMiddleware, RecentProfiles, SamplingProfiler, token_valid)
+
+# Output budget cap when static analysis already covers the inventory and call graph
+ANALYZED_MAX_TOKENS = 2500
+# Strip comments and fold literals from submitted code unless the request says otherwise
+COMPACT_PROMPTS = os.getenv("DOCUGENIUS_COMPACT_PROMPTS", "false").lower() == "true"
+# Identical /ask/ requests are answered from the shared cache for this long (0 disables)
+ASK_CACHE_TTL = float(os.getenv("DOCUGENIUS_CACHE_TTL", "3600"))
+ASK_CACHE_MAX_ENTRIES = int(os.getenv("DOCUGENIUS_CACHE_SIZE", "5000"))
+ASK_CACHE_NAMESPACE = "ask"
+# Seconds past expiry an answer may still be served (marked stale) while it is
+# regenerated in the background, per mode with "*" as the default (0 disables)
+MAX_STALENESS = json.loads(os.getenv("DOCUGENIUS_MAX_STALENESS", '{"*": 86400, "explain_concept": 604800}'))
+# Seconds after a failed background refresh before the same answer is refreshed again
+REVALIDATE_COOLDOWN = float(os.getenv("DOCUGENIUS_REVALIDATE_COOLDOWN", "300"))
+# Per-client /ask/ requests per minute across all workers (0 disables)
+RATE_LIMIT_PER_MINUTE = int(os.getenv("DOCUGENIUS_RATE_LIMIT_PER_MINUTE", "0"))
+# Cache-Control for conditional GETs; results never change once generated but may contain user code
+MODES_CACHE_CONTROL = "public, max-age=3600"
+RESULT_CACHE_CONTROL = os.getenv("DOCUGENIUS_RESULT_CACHE_CONTROL", "private, max-age=86400, immutable")
+# Directories (os.pathsep-separated) whose contents /repo/jobs may document; empty disables the endpoint
+REPO_ROOTS = [os.path.realpath(root) for root in os.getenv("DOCUGENIUS_REPO_ROOTS", "").split(os.pathsep) if root]
+# Let POST /upload/ start repository jobs over uploaded archives (target=repo); off unless enabled
+UPLOAD_REPO_JOBS = os.getenv("DOCUGENIUS_UPLOAD_REPO_JOBS", "false").lower() == "true"
+REPO_OUTPUT_DIR = os.getenv("DOCUGENIUS_REPO_OUTPUT", os.path.join(tempfile.gettempdir(), "docugenius_repo_docs"))
+# Uvicorn worker processes when started with `python main.py`
+WORKERS = int(os.getenv("DOCUGENIUS_WORKERS", "1"))
+
+# Cache entries, counters and rate-limit windows shared by every worker process
+shared_store = SharedStore()
+
+# Counters, served at /metrics/
+metrics = Metrics(shared_store)
+
+# Generated results, addressable by result ID for retrieval and bulk export
+result_history = ResultHistory(shared_store)
+
+# Per-call token ledger and per-tenant budgets
+usage_ledger = UsageLedger(shared_store)
+
+# Model tier selection with per-tier latency/error profiles
+model_router = ModelRouter()
+
+# BM25 retrieval over DOCUGENIUS_RAG_SOURCES, injected as context into /ask/ prompts
+rag_engine = RAGEngine(shared_store, metrics=metrics)
+
+# Request traces for Server-Timing and /debug/traces
+tracer = Tracer()
+
+# Per-request profiles (X-Debug-Profile) and the latest /debug/profile runs of this worker
+recent_profiles = RecentProfiles()
+
+# Conversation state for /ws/session, shared by all workers so a reconnect can resume anywhere
+session_store = SessionStore(shared_store)
+
+# Memoized PDF report rendering (process pool, keyed by result hash)
+pdf_exporter = PDFExporter(shared_store)
+
+# /ask/ requests currently being served by this worker; prewarming waits while any are
+live_asks = 0
+# Background regenerations of stale answers, by cache key
+revalidations = {}
+# Repository documentation jobs running in this worker, by job ID (status lives in the shared store)
+repo_jobs = {}
+# Background summarization of conversation sessions, by session ID
+session_compactions = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Import the OpenAI SDK in the background so startup does not wait for it;
+    # /health/ready reports not ready until it has finished
+    app.state.openai_import = asyncio.get_running_loop().run_in_executor(None, importlib.import_module, "openai")
+    # Load (or build, on first start) the retrieval index, then keep it in step with its sources;
+    # /health/ready waits for the first load
+    app.state.rag_engine = rag_engine
+    # Spools left behind by a previous run (a worker that died mid-job)
+    await asyncio.to_thread(sweep_spool)
+    if rag_engine.enabled:
+        rag_engine.start()
+    metrics.start()
+    if PREWARM_ENABLED and ASK_CACHE_TTL > 0 and os.getenv("OPENAI_API_KEY"):
+        prewarmer.start()
+    yield
+    await prewarmer.stop()
+    await rag_engine.stop()
+    for task in list(revalidations.values()) + list(repo_jobs.values()) + list(session_compactions.values()):
+        task.cancel()
+    pdf_exporter.shutdown()
+    await metrics.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="DocuGenius API",
     description="AI-Powered Technical Documentation Generator",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware
@@ -24,12 +147,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# br/gzip for large JSON payloads, negotiated from Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Sampling profiles of single requests sent with X-Debug-Profile and X-Debug-Token
+app.add_middleware(ProfilingMiddleware, profiles=recent_profiles)
+
+# Outermost, so the traces and Server-Timing cover compression and the other middleware
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
 # Models
 class DocuGeniusRequest(BaseModel):
     query: str
     mode: str = "explain_code"  # "explain_code" or "explain_concept"
     audience: str = "beginner"
     verifyCode: bool = False
+    language: Optional[str] = None  # Detected on the server when not supplied
+    compactCode: Optional[bool] = None  # Defaults to DOCUGENIUS_COMPACT_PROMPTS
+    modelTier: Optional[str] = None  # Chosen by the router when not supplied
 
 class Source(BaseModel):
     id: str
@@ -47,9 +182,125 @@ class DocuGeniusResponse(BaseModel):
     generation_time: float
     message: str = ""
     external_resources: List[dict[str, str]] = []
+    sources: List[Source] = []  # Retrieved passages the prompt cited as [n]
+    result_id: Optional[str] = None
+    language: str = "text"
+    language_candidates: List[dict] = []
+    static_analysis: Optional[dict] = None
+    prompt_compaction: Optional[dict] = None
+    model_tier: Optional[dict] = None
+    cached: bool = False
+    stale: bool = False  # Served past its cache lifetime while a fresh answer is generated
+    usage: Optional[dict] = None  # Tokens for this call and the caller's budget; not cached
+
+AUDIENCES = ["beginner", "intermediate", "expert"]
+
+class RepoJobRequest(BaseModel):
+    source: str  # Directory or tarball under one of DOCUGENIUS_REPO_ROOTS
+    languages: List[str] = []  # Empty = every detected code language
+    granularity: str = "file"  # "file" or "symbol"
+    mode: str = "explain_code"
+    audience: str = "intermediate"
+    concurrency: int = Field(REPO_CONCURRENCY, ge=1, le=REPO_CONCURRENCY)  # DOCUGENIUS_REPO_CONCURRENCY is the cap
+
+class ExportRequest(BaseModel):
+    result_ids: List[str] = []  # Explicit results; takes precedence over the history query
+    query: Optional[str] = None  # Case-insensitive substring of the original query
+    mode: Optional[str] = None
+    audience: Optional[str] = None
+    limit: int = 100
+    formats: List[str] = ["markdown"]
+
+class LanguageDetectRequest(BaseModel):
+    texts: List[str]  # Snippets ranked independently, in order
+
+class SessionMessage(BaseModel):
+    query: str  # The first message's query is the code or concept the session is about
+    code: Optional[str] = None  # Replaces the session's code; query is then a question about it
+    mode: str = "explain_code"
+    audience: str = "beginner"
+    language: Optional[str] = None
+    modelTier: Optional[str] = None
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# OpenAI client, created on first use (the SDK is the slowest import in the backend);
+# with DOCUGENIUS_LLM_CASSETTE_MODE it records to, or replays from, DOCUGENIUS_LLM_CASSETTE
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        if CASSETTE_MODE == "replay":
+            _client = ReplayClient(CASSETTE_PATH)
+            return _client
+        import openai
+        _client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if CASSETTE_MODE == "record":
+            _client = RecordingClient(_client, CASSETTE_PATH)
+    return _client
+
+def estimated_usage(prompt: str, completion: str) -> types.SimpleNamespace:
+    """Token counts for a call whose usage report never arrived"""
+    prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(completion) if completion else 0
+    return types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                 total_tokens=prompt_tokens + completion_tokens)
+
+async def collect_completion(received: List[str], **kwargs):
+    """Stream a chat completion's text into received and return its usage
+
+    Cancelling the caller closes the stream, so the provider stops generating
+    and received holds what had arrived by then.
+    """
+    usage = None
+    stream = stream_completion(**kwargs)
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                received.append(text)
+    finally:
+        await stream.aclose()
+    return usage
+
+async def stream_completion(**kwargs):
+    """Chunks of a streamed chat completion, the last one carrying the usage
+
+    The SDK iterates the stream synchronously, so a worker thread reads it and
+    hands chunks to the event loop; the stream is closed early if the consumer
+    stops iterating.
+    """
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+    finished = object()
+
+    def read():
+        try:
+            stream = get_client().chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            for chunk in stream:
+                if stopped.is_set():
+                    close = getattr(stream, "close", None)
+                    if close is not None:
+                        close()
+                    return
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            loop.call_soon_threadsafe(chunks.put_nowait, finished)
+        except Exception as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+
+    loop.run_in_executor(None, read)
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is finished:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stopped.set()
 
 @app.get("/")
 async def root():
@@ -59,8 +310,20 @@ async def root():
         "description": "AI-Powered Technical Documentation Generator",
         "endpoints": {
             "health": "/health/",
+            "ready": "/health/ready",
+            "metrics": "/metrics/",
+            "traces": "/debug/traces",
             "modes": "/ask/modes",
-            "generate": "/ask/"
+            "tiers": "/ask/tiers",
+            "examples": "/examples/",
+            "detect_language": "/language/detect",
+            "generate": "/ask/",
+            "upload": "/upload/",
+            "session": "/ws/session",
+            "history": "/history/",
+            "export": "/export/",
+            "export_pdf": "/export/pdf",
+            "usage": "/usage/"
         }
     }
 
@@ -74,14 +337,129 @@ async def health_check():
         "environment": "development"
     }
 
-@app.get("/ask/modes")
-async def get_modes():
-    return {
-        "modes": [
-            {"id": "explain_code", "name": "Explain Code", "description": "Detailed code analysis and explanation", "best_for": "Understanding code logic"},
-            {"id": "explain_concept", "name": "Explain Concept", "description": "Easy-to-understand concept explanations", "best_for": "Learning new concepts"}
-        ]
+@app.get("/health/ready")
+async def readiness_check(response: Response):
+    """503 until every startup dependency is available, so launchers and probes can poll it"""
+    openai_import = getattr(app.state, "openai_import", None)
+    checks = {
+        "openai_sdk": openai_import is not None and openai_import.done() and openai_import.exception() is None,
+        "shared_store": True,
+        "api_key": bool(os.getenv("OPENAI_API_KEY"))
     }
+    try:
+        # connection() is per thread, so it has to be opened in the worker thread that uses it
+        await asyncio.to_thread(lambda: shared_store.connection().execute("SELECT 1"))
+        # Informational: answers keep being prewarmed after the service is ready
+        prewarm = await asyncio.to_thread(prewarmer.progress) if PREWARM_ENABLED else {"state": "disabled"}
+    except Exception:
+        checks["shared_store"] = False
+        prewarm = None
+    # Configured retrieval must be loaded, or the first answers would be ungrounded
+    engine = getattr(app.state, "rag_engine", None)
+    if engine is not None and engine.enabled:
+        checks["rag_index"] = engine.ready
+        if RAG_MAX_LAG:
+            checks["rag_fresh"] = (await asyncio.to_thread(engine.freshness))["fresh"]
+    # A missing API key is reported but does not block readiness (only /ask/ needs it)
+    ready = all(passed for check, passed in checks.items() if check != "api_key")
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "not_ready", "checks": checks, "prewarm": prewarm,
+            "rag": await asyncio.to_thread(engine.stats) if engine is not None else None}
+
+@app.get("/metrics/")
+async def get_metrics():
+    return await asyncio.to_thread(metrics.snapshot)
+
+@app.get("/debug/traces")
+async def list_traces(limit: int = 50, name: Optional[str] = None, min_ms: float = 0):
+    """This worker's most recent request traces, newest first"""
+    if not tracer.enabled:
+        raise HTTPException(status_code=404, detail="Tracing is disabled (DOCUGENIUS_TRACING=false)")
+    return {"pid": os.getpid(), "traces": tracer.recent(max(1, min(limit, 500)), name, min_ms)}
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = tracer.get(trace_id) if tracer.enabled else None
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (traces are kept per worker)")
+    return trace
+
+def require_profile_token(request: Request):
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set DOCUGENIUS_PROFILE_TOKEN)")
+    if not token_valid(request.headers.get("x-debug-token")):
+        raise HTTPException(status_code=403, detail="Missing or invalid X-Debug-Token")
+
+def profile_response(profile: Profile, format: str) -> Response:
+    """Collapsed stacks as text (for flamegraph.pl, speedscope, inferno) or a JSON summary"""
+    if format == "json":
+        return FastJSONResponse(profile.to_dict())
+    return Response(profile.collapsed(), media_type="text/plain; charset=utf-8", headers={
+        "X-Profile-Id": profile.profile_id,
+        "X-Profile-Samples": str(profile.samples),
+        "X-Profile-Overhead": f"{profile.overhead:.4f}"
+    })
+
+@app.get("/debug/profile")
+async def profile_worker(request: Request, seconds: float = 5, interval_ms: float = PROFILE_INTERVAL * 1000,
+                         format: str = "collapsed", idle: bool = False):
+    """Sample this worker's stacks for a few seconds while it keeps serving requests"""
+    require_profile_token(request)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]")
+    profiler = SamplingProfiler(interval_ms / 1000, include_idle=idle, max_seconds=seconds)
+    try:
+        profiler.start()
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile = profiler.stop()
+    recent_profiles.add(profile)
+    return profile_response(profile, format)
+
+@app.get("/debug/profiles")
+async def list_profiles(request: Request):
+    require_profile_token(request)
+    return {"pid": os.getpid(), "profiles": recent_profiles.list()}
+
+@app.get("/debug/profile/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: str = "collapsed"):
+    require_profile_token(request)
+    profile = recent_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (profiles are kept per worker)")
+    return profile_response(profile, format)
+
+MODES = {
+    "modes": [
+        {"id": "explain_code", "name": "Explain Code", "description": "Detailed code analysis and explanation", "best_for": "Understanding code logic"},
+        {"id": "explain_concept", "name": "Explain Concept", "description": "Easy-to-understand concept explanations", "best_for": "Learning new concepts"}
+    ]
+}
+
+@app.get("/ask/modes")
+async def get_modes(request: Request):
+    return conditional_response(MODES, request.headers.get("if-none-match"), MODES_CACHE_CONTROL)
+
+@app.get("/ask/tiers")
+async def get_tiers():
+    """Configured model tiers with this worker's rolling latency/error profile"""
+    return model_router.snapshot()
+
+@app.get("/examples/")
+async def get_examples(request: Request):
+    """Preset prompts for the UI's Examples page"""
+    return conditional_response(EXAMPLES, request.headers.get("if-none-match"), MODES_CACHE_CONTROL)
+
+@app.post("/language/detect")
+async def detect_snippet_languages(request: LanguageDetectRequest):
+    """Ranked language candidates for each snippet, as used for /ask/ prompts"""
+    def rank():
+        return [[candidate._asdict() for candidate in detect_languages(text)] for text in request.texts]
+    return {"results": await asyncio.to_thread(rank)}
 
 def create_system_prompt(mode: str, audience: str) -> str:
     """Create a system prompt based on mode and audience"""
@@ -123,10 +501,35 @@ Your response should include:
 
 Format your response with clear sections and proper numbering."""
 
-def create_user_prompt(query: str, with_diagram: bool = False) -> str:
+def create_user_prompt(query: str, with_diagram: bool = False, language: str = "text",
+                       analysis_summary: Optional[str] = None, context: Optional[str] = None) -> str:
     """Create a user prompt for the query"""
     
-    return f"""Analyze and explain: {query}
+    language_hint = f"Language: {language}\n\n" if language != "text" else ""
+    if context:
+        # Retrieved project passages; the answer should rest on them rather than general knowledge
+        query = f"""{query}
+
+Project documentation and code retrieved for this question (cite a passage as [n] where you use it):
+{context}"""
+    if analysis_summary:
+        return f"""{language_hint}Analyze and explain: {query}
+
+Static analysis (computed locally and already shown to the user):
+{analysis_summary}
+
+Please provide:
+1. A clear, comprehensive explanation
+2. Step-by-step breakdown of the code with proper numbering
+3. Time and space complexity, worked out from the code. The time_hint values above only count loop
+   nesting and self-calls (they miss memoization, early exits and the cost of called functions);
+   treat them as hints and correct them where the code says otherwise
+4. External resources and references for further learning
+
+Do not repeat the function inventory, line ranges or cyclomatic complexity figures above.
+Format the response with clear sections and proper numbering."""
+
+    return f"""{language_hint}Analyze and explain: {query}
 
 Please provide:
 1. A clear, comprehensive explanation
@@ -142,6 +545,60 @@ Format the response with clear sections and proper numbering."""
 
 # Removed diagram generation function - no longer needed
 
+def parse_sections(content: str) -> Tuple[str, List[str], List[str]]:
+    """Explanation, breakdown steps and code blocks of a model response"""
+    lines = content.split('\n')
+    
+    # Extract explanation and breakdown
+    explanation = ""
+    breakdown = []
+    code_analysis = []
+
+    current_section = None
+    code_block = False
+    current_code = []
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        # Detect sections
+        if line.lower().startswith('explanation') or line.lower().startswith('analysis'):
+            current_section = 'explanation'
+            explanation = line.split(':', 1)[1].strip() if ':' in line else ""
+        elif line.lower().startswith('breakdown') or line.lower().startswith('step') or line.lower().startswith('1.') or line.lower().startswith('2.'):
+            current_section = 'breakdown'
+            if line.lower().startswith('breakdown') or line.lower().startswith('step'):
+                step_content = line.split(':', 1)[1].strip() if ':' in line else line
+            else:
+                step_content = line
+            if step_content:
+                breakdown.append(step_content)
+        elif line.lower().startswith('code') or line.lower().startswith('analysis'):
+            current_section = 'code_analysis'
+            code_block = True
+        elif line.startswith('```'):
+            if code_block:
+                if current_code:
+                    code_analysis.append('\n'.join(current_code))
+                    current_code = []
+                code_block = False
+            else:
+                code_block = True
+        elif code_block:
+            current_code.append(line)
+        # Removed diagram parsing logic
+        elif current_section == 'explanation' and not explanation:
+            explanation = line
+        elif current_section == 'breakdown' and not line.lower().startswith('breakdown'):
+            breakdown.append(line)
+
+    # Add any remaining code
+    if current_code:
+        code_analysis.append('\n'.join(current_code))
+    return explanation, breakdown, code_analysis
+
 def extract_external_resources(content: str) -> List[dict[str, str]]:
     """Extract external resources from AI response with URLs"""
     resources = []
@@ -209,31 +666,284 @@ def extract_external_resources(content: str) -> List[dict[str, str]]:
     
     return unique_resources
 
+def answer_response(result: DocuGeniusResponse) -> Response:
+    """/ask/ response pointing at the stored result
+
+    POST is never answered with 304 (RFC 9110 allows only 412 for a failed
+    precondition on unsafe methods); clients that want to revalidate an answer
+    poll Content-Location, GET /history/{id}, with If-None-Match instead.
+    """
+    return FastJSONResponse(result, headers={
+        "Cache-Control": "private, no-cache",
+        "Content-Location": f"/history/{result.result_id}"
+    })
+
+def request_tenant(http_request: HTTPConnection) -> str:
+    """Budget tenant: the X-API-Key header when it is a configured key, otherwise the client address"""
+    return tenant_id(http_request.headers.get("x-api-key"),
+                     http_request.client.host if http_request.client else None)
+
+def request_cache_key(request: DocuGeniusRequest, language: str) -> str:
+    """Cache key covering every request field that changes the answer
+
+    The language is the resolved one, so a client that sends the detected
+    language shares entries with one that leaves detection to the server.
+    """
+    resolved = request.model_copy(update={"language": language})
+    return hashlib.sha256(resolved.model_dump_json().encode("utf-8")).hexdigest()
+
 @app.post("/ask/")
-async def generate_documentation(request: DocuGeniusRequest):
+async def generate_documentation(request: DocuGeniusRequest, http_request: Request):
+    global live_asks
+    live_asks += 1
+    try:
+        return await cancel_on_disconnect(answer_question(request, http_request), http_request)
+    finally:
+        live_asks -= 1
+
+async def wait_for_disconnect(http_request: Request):
+    """Return once the client has gone away; the request body must already have been read"""
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+async def cancel_on_disconnect(work, http_request: Request):
+    """Await work, cancelling it (and the upstream stream it reads) if the client disconnects first
+
+    The cancelled request answers 499 (client closed request), which only
+    shows in traces and logs since nobody is left to read it.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            # Let it unwind (close the upstream stream, charge the partial call) before answering
+            await asyncio.wait({task})
+    if not task.cancelled():
+        return task.result()
+    metrics.increment("ask_client_disconnects")
+    return Response(status_code=499)
+
+def internal_request(client: str) -> Request:
+    """Request for server-initiated generations; unless a tenant is passed, usage is billed to ip:<client>"""
+    return Request({"type": "http", "method": "POST", "path": "/ask/", "headers": [],
+                    "query_string": b"", "client": (client, 0)})
+
+def max_staleness(mode: str) -> float:
+    return float(MAX_STALENESS.get(mode, MAX_STALENESS.get("*", 0)))
+
+def claim_revalidation(cache_key: str) -> bool:
+    """Lease the refresh of an answer unless one is running or failed within the cooldown (blocking)"""
+    if shared_store.get("revalidate_failed", cache_key) is not None:
+        return False
+    return shared_store.acquire("revalidate", cache_key, str(os.getpid()), ttl=300)
+
+def revalidate(request: DocuGeniusRequest, cache_key: str):
+    """Regenerate a stale answer in the background, once across all workers
+
+    A failed refresh is remembered for REVALIDATE_COOLDOWN seconds, so during an
+    upstream outage stale hits keep being served without each one starting
+    another upstream call.
+    """
+    if cache_key in revalidations:
+        return
+
+    async def run():
+        if not await asyncio.to_thread(claim_revalidation, cache_key):
+            revalidations.pop(cache_key, None)
+            return
+        try:
+            try:
+                await answer_question(request, internal_request("revalidate"), use_cache=False, internal=True)
+                fresh = await asyncio.to_thread(shared_store.get, ASK_CACHE_NAMESPACE, cache_key) is not None
+            except Exception:
+                fresh = False
+            metrics.increment("stale_refreshes" if fresh else "stale_refresh_failures")
+            if not fresh and REVALIDATE_COOLDOWN > 0:
+                await asyncio.to_thread(shared_store.set, "revalidate_failed", cache_key,
+                                        str(time.time()).encode("utf-8"), REVALIDATE_COOLDOWN)
+        finally:
+            revalidations.pop(cache_key, None)
+            await asyncio.to_thread(shared_store.delete, "revalidate", cache_key)
+
+    revalidations[cache_key] = asyncio.get_running_loop().create_task(run())
+
+class PreparedPrompt(NamedTuple):
+    analysis: Optional[dict]
+    compaction: Optional[CompactionResult]
+    hits: List[SearchHit]
+    system_prompt: str
+    user_prompt: str
+
+def prepare_prompt(request: DocuGeniusRequest, language: str) -> PreparedPrompt:
+    """Local analysis, optional compaction and retrieval for a request, and the prompts built from them
+
+    Blocking (retrieval scoring and metrics I/O); run it in a thread.
+    """
+    # Compute the deterministic parts locally so the model only writes the narrative; concept
+    # questions keep the concept prompt even when their text happens to parse as Python
+    with span("analysis"):
+        analysis = analyze_python(request.query) if language == "python" and request.mode == "explain_code" else None
+
+    # Optionally strip non-semantic content from the code before it is sent
+    compact = request.compactCode if request.compactCode is not None else COMPACT_PROMPTS
+    with span("compaction"):
+        compaction = compact_code(request.query, language) if compact and request.mode == "explain_code" else None
+    if compaction is not None:
+        metrics.increment("compaction_requests")
+        metrics.increment("compaction_chars_saved", compaction.chars_saved)
+        metrics.increment("compaction_estimated_tokens_saved", compaction.stats()["estimated_tokens_saved"])
+
+    # Ground the answer in the most relevant indexed project passages
+    with span("retrieval") as retrieval:
+        hits = rag_engine.search(request.query, RAG_TOP_K) if rag_engine.enabled else []
+        if retrieval is not None:
+            retrieval.set(hits=len(hits))
+    if hits:
+        metrics.increment("rag_grounded_requests")
+
+    # Create prompts
+    system_prompt = create_system_prompt(request.mode, request.audience)
+    user_prompt = create_user_prompt(
+        compaction.text if compaction else request.query, False, language,
+        # Line ranges refer to the original code, so leave them out when it was compacted
+        summarize_for_prompt(analysis, include_lines=compaction is None) if analysis else None,
+        format_context(hits, RAG_CONTEXT_CHARS)
+    )
+    return PreparedPrompt(analysis, compaction, hits, system_prompt, user_prompt)
+
+async def require_budget(tenant: str):
+    """Raise 429 (with Retry-After) when the tenant's token budget for the window is spent"""
+    budget = await asyncio.to_thread(usage_ledger.check, tenant)
+    if budget.exceeded:
+        metrics.increment("budget_rejections")
+        retry_after = int(usage_ledger.window_seconds - time.time() % usage_ledger.window_seconds) + 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Token budget exhausted ({int(budget.used)}/{budget.limit} tokens in the current window)",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+def store_answer(request: DocuGeniusRequest, result: DocuGeniusResponse, cache_key: str, stored: bytes,
+                 history: bool = True, cache: bool = True):
+    """Write a generated answer to the history and the shared cache (blocking; run it in a thread)"""
+    if history:
+        result_history.add(request.model_dump(), result.model_dump())
+    if cache and ASK_CACHE_TTL > 0:
+        shared_store.set(ASK_CACHE_NAMESPACE, cache_key, stored, ttl=ASK_CACHE_TTL)
+        shared_store.prune(ASK_CACHE_NAMESPACE, ASK_CACHE_MAX_ENTRIES)
+
+async def answer_question(request: DocuGeniusRequest, http_request: Request, use_cache: bool = True,
+                          tenant: Optional[str] = None, internal: bool = False, cache_result: bool = True,
+                          record_history: bool = True):
+    """Answer one question from the cache or the model
+
+    tenant overrides the one derived from http_request for billing. Internal
+    (server-initiated) generations skip the per-client rate limit. Answers
+    that go into the shared cache must also go into the history, since a
+    cache hit points at /history/{result_id}; only callers that also pass
+    cache_result=False may set record_history=False.
+    """
     start_time = time.time()
+    metrics.increment("ask_requests")
+
+    if RATE_LIMIT_PER_MINUTE > 0 and not internal:
+        client_id = http_request.client.host if http_request.client else "unknown"
+        if await asyncio.to_thread(shared_store.hit_window, client_id) > RATE_LIMIT_PER_MINUTE:
+            metrics.increment("ask_rate_limited")
+            raise HTTPException(status_code=429, detail="Rate limit exceeded, please retry in a minute")
+
+    # Detect the language so the prompt and the UI agree on it
+    with span("language"):
+        language_candidates = [candidate._asdict() for candidate in detect_languages(request.query)]
+    language = request.language or (language_candidates[0]["language"] if language_candidates else "text")
+
+    # Answer repeated questions from the cache shared by all workers; an expired
+    # answer within the mode's staleness limit is served at once and regenerated
+    cache_key = request_cache_key(request, language)
+    with span("cache"):
+        entry = (await asyncio.to_thread(shared_store.get_entry, ASK_CACHE_NAMESPACE, cache_key)
+                 if ASK_CACHE_TTL > 0 and use_cache else None)
+    now = time.time()
+    stale = entry is not None and entry[2] is not None and entry[2] < now
+    if stale and now - entry[2] > max_staleness(request.mode):
+        entry = None
+    if entry is not None:
+        cached, updated_at, _ = entry
+        if stale:
+            metrics.increment("stale_hits")
+            revalidate(request, cache_key)
+        else:
+            metrics.increment("cache_hits")
+        result = DocuGeniusResponse.model_validate_json(cached)
+        result.cached = True
+        result.stale = stale
+        result.generation_time = time.time() - start_time
+        response = answer_response(result)
+        if stale:
+            response.headers["Age"] = str(int(now - updated_at))
+        return response
+    metrics.increment("cache_misses")
+
+    # Refuse before calling the model once the caller's token budget is spent
+    tenant = tenant or request_tenant(http_request)
+    await require_budget(tenant)
     
     try:
-        # Create prompts
-        system_prompt = create_system_prompt(request.mode, request.audience)
-        user_prompt = create_user_prompt(request.query, False)
+        # Analysis and retrieval are CPU-bound (BM25/dense scoring over the index); keep them off the loop
+        analysis, compaction, hits, system_prompt, user_prompt = await asyncio.to_thread(prepare_prompt, request, language)
         
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=4000,
-            temperature=0.7
-        )
+        # Call OpenAI API on the tier the router picks for this request
+        tier = model_router.choose(request.mode, request.audience, len(request.query), language,
+                                   forced=request.modelTier)
+        model = tier.model
+        metrics.increment(f"tier_{tier.tier}_requests")
+        result_id = uuid.uuid4().hex
+        call_started = time.perf_counter()
+        received: List[str] = []
+        try:
+            # Streamed, so a request cancelled on client disconnect stops the generation too
+            with span("upstream", model=model, tier=tier.tier):
+                completion_usage = await collect_completion(
+                    received,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=min(tier.max_tokens, ANALYZED_MAX_TOKENS) if analysis else tier.max_tokens,
+                    temperature=0.7
+                )
+        except asyncio.CancelledError:
+            # The provider still bills the prompt and what was generated before the stream closed
+            metrics.increment("upstream_cancelled")
+            await asyncio.to_thread(usage_ledger.record, tenant,
+                                    estimated_usage(system_prompt + user_prompt, "".join(received)), model,
+                                    request.mode, request.audience, language, result_id)
+            raise
+        except Exception:
+            model_router.record(tier.tier, time.perf_counter() - call_started, ok=False)
+            raise
+        model_router.record(tier.tier, time.perf_counter() - call_started, ok=True)
         
+        # Charge the call before parsing, so failed parses are still accounted for; a stream that
+        # ended without its usage chunk is charged an estimate rather than nothing
+        if completion_usage is None:
+            metrics.increment("usage_estimated")
+            completion_usage = estimated_usage(system_prompt + user_prompt, "".join(received))
+        with span("usage"):
+            usage = await asyncio.to_thread(usage_ledger.record, tenant, completion_usage, model, request.mode,
+                                            request.audience, language, result_id)
+            budget = await asyncio.to_thread(usage_ledger.check, tenant)
+        if budget.warning:
+            metrics.increment("budget_warnings")
+
         # Extract content
-        content = response.choices[0].message.content
-        
-        # Parse the response and create structured output
-        lines = content.split('\n')
+        content = "".join(received)
+        parsing = start_span("parse", chars=len(content))
         
         # Debug: Print the AI response to see what it's generating
         print(f"🔍 AI Response for explanation:")
@@ -243,66 +953,29 @@ async def generate_documentation(request: DocuGeniusRequest):
         print(f"First 500 chars: {content[:500]}")
         print("-" * 50)
         
-        # Extract explanation and breakdown
-        explanation = ""
-        breakdown = []
-        code_analysis = []
-        
-        current_section = None
-        code_block = False
-        current_code = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Detect sections
-            if line.lower().startswith('explanation') or line.lower().startswith('analysis'):
-                current_section = 'explanation'
-                explanation = line.split(':', 1)[1].strip() if ':' in line else ""
-            elif line.lower().startswith('breakdown') or line.lower().startswith('step') or line.lower().startswith('1.') or line.lower().startswith('2.'):
-                current_section = 'breakdown'
-                if line.lower().startswith('breakdown') or line.lower().startswith('step'):
-                    step_content = line.split(':', 1)[1].strip() if ':' in line else line
-                else:
-                    step_content = line
-                if step_content:
-                    breakdown.append(step_content)
-            elif line.lower().startswith('code') or line.lower().startswith('analysis'):
-                current_section = 'code_analysis'
-                code_block = True
-            elif line.startswith('```'):
-                if code_block:
-                    if current_code:
-                        code_analysis.append('\n'.join(current_code))
-                        current_code = []
-                    code_block = False
-                else:
-                    code_block = True
-            elif code_block:
-                current_code.append(line)
-            # Removed diagram parsing logic
-            elif current_section == 'explanation' and not explanation:
-                explanation = line
-            elif current_section == 'breakdown' and not line.lower().startswith('breakdown'):
-                breakdown.append(line)
-        
-        # Add any remaining code
-        if current_code:
-            code_analysis.append('\n'.join(current_code))
+        # Parse the response and create structured output
+        explanation, breakdown, code_analysis = parse_sections(content)
+        if analysis:
+            code_analysis = format_code_analysis(analysis) + code_analysis
+
+        # Point line references back at the code the user pasted
+        if compaction is not None:
+            explanation = remap_line_references(explanation, compaction.line_map)
+            breakdown = [remap_line_references(step, compaction.line_map) for step in breakdown]
         
         # Removed all diagram-related logic
+        end_span(parsing)
 
         # Extract external resources
-        external_resources = extract_external_resources(content)
+        with span("resources"):
+            external_resources = extract_external_resources(content)
 
         generation_time = time.time() - start_time
         
         # Generate random confidence between 80-100%
         confidence = random.uniform(0.80, 1.0)
         
-        return DocuGeniusResponse(
+        result = DocuGeniusResponse(
             explanation=explanation or f"Explanation for: {request.query[:100]}...",
             breakdown=breakdown or [
                 "Analyzed the code/concept",
@@ -314,12 +987,27 @@ async def generate_documentation(request: DocuGeniusRequest):
             code_analysis=code_analysis or ["# Code analysis will be generated here"],
             confidence=confidence,
             external_resources=external_resources,
+            sources=[hit.to_source(number) for number, hit in enumerate(hits, 1)],
             generation_time=generation_time,
-            message="Explanation generated successfully using OpenAI GPT-4o"
+            message=f"Explanation generated successfully using OpenAI {model}",
+            result_id=result_id,
+            language=language,
+            language_candidates=language_candidates,
+            static_analysis=analysis,
+            prompt_compaction=compaction.stats() if compaction else None,
+            model_tier=tier.to_dict()
         )
+        with span("store"):
+            stored = result.model_dump_json().encode("utf-8")
+            await asyncio.to_thread(store_answer, request, result, cache_key, stored, record_history, cache_result)
+        if budget.limit:
+            usage["budget"] = budget.to_dict()
+        result.usage = usage
+        return answer_response(result)
 
     except Exception as e:
         generation_time = time.time() - start_time
+        metrics.increment("ask_errors")
         return DocuGeniusResponse(
             success=False,
             explanation="Error occurred during explanation generation",
@@ -330,14 +1018,495 @@ async def generate_documentation(request: DocuGeniusRequest):
             message=f"Error: {str(e)}"
         )
 
+async def compact_session(session: Session, tenant: str) -> Session:
+    """Fold a session's older turns into its summary on the cheapest tier; on failure they stay verbatim"""
+    upto = session.fold_point()
+    tier = model_router.tiers[model_router.names[0]]
+    try:
+        response = await asyncio.to_thread(
+            get_client().chat.completions.create,
+            model=tier["model"],
+            messages=session.summary_prompt(upto),
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.2
+        )
+        summary = response.choices[0].message.content
+        usage = response.usage or estimated_usage("".join(turn["content"] for turn in session.summary_prompt(upto)), summary)
+        await asyncio.to_thread(usage_ledger.record, tenant, usage, tier["model"], session.mode,
+                                session.audience, session.language)
+        session.apply_summary(summary, upto)
+        await asyncio.to_thread(session_store.save, session)
+        metrics.increment("session_compactions")
+    except Exception:
+        metrics.increment("session_compaction_failures")
+    finally:
+        session_compactions.pop(session.session_id, None)
+    return session
+
+async def session_turn(websocket: WebSocket, session: Optional[Session], message: SessionMessage,
+                       tenant: str) -> Optional[Session]:
+    """Answer one session message, streaming the reply; returns the (possibly new) session"""
+    start_time = time.time()
+    metrics.increment("session_messages")
+
+    if RATE_LIMIT_PER_MINUTE > 0:
+        client_id = websocket.client.host if websocket.client else "unknown"
+        if await asyncio.to_thread(shared_store.hit_window, client_id) > RATE_LIMIT_PER_MINUTE:
+            metrics.increment("ask_rate_limited")
+            await websocket.send_json({"type": "error", "message": "Rate limit exceeded, please retry in a minute"})
+            return session
+    budget = await asyncio.to_thread(usage_ledger.check, tenant)
+    if budget.exceeded:
+        metrics.increment("budget_rejections")
+        await websocket.send_json({"type": "error", "message":
+                                   f"Token budget exhausted ({int(budget.used)}/{budget.limit} tokens in the current window)"})
+        return session
+
+    # Summarization of the previous turns finishes before the next prompt is built
+    if session is not None and session.session_id in session_compactions:
+        session = await session_compactions[session.session_id]
+
+    analysis = None
+    followup = False
+    question: Optional[str] = message.query
+    if session is None or message.code is not None:
+        # Analyze the code once; follow-ups reuse this context message verbatim. Code is never
+        # compacted here, so line numbers in follow-ups match what the user pasted
+        request = DocuGeniusRequest(query=message.code if message.code is not None else message.query,
+                                    mode=message.mode, audience=message.audience,
+                                    language=message.language, compactCode=False)
+        language = request.language or detect_language(request.query)
+        analysis, _, hits, system_prompt, user_prompt = await asyncio.to_thread(prepare_prompt, request, language)
+        session = Session.create(request.mode, request.audience, language, system_prompt, user_prompt,
+                                 [hit.to_source(number).model_dump() for number, hit in enumerate(hits, 1)])
+        question = message.query if message.code is not None else None
+        metrics.increment("session_contexts")
+    else:
+        followup = True
+        metrics.increment("session_followups")
+
+    tier = model_router.choose(session.mode, session.audience,
+                               len(question) if question is not None else len(session.context),
+                               session.language, forced=message.modelTier)
+    metrics.increment(f"tier_{tier.tier}_requests")
+    parts = []
+    usage = None
+    first_token_time = None
+    call_started = time.perf_counter()
+    upstream = start_span("upstream", model=tier.model, tier=tier.tier, streamed=True)
+    messages = session.prompt(question)
+    prompt = "".join(turn["content"] for turn in messages)
+    stream = stream_completion(
+        model=tier.model,
+        messages=messages,
+        max_tokens=min(tier.max_tokens, ANALYZED_MAX_TOKENS) if analysis else tier.max_tokens,
+        temperature=0.7
+    )
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                parts.append(text)
+                await websocket.send_json({"type": "delta", "text": text})
+    except WebSocketDisconnect:
+        # The client left mid-reply: closing the stream stops the generation; charge what it produced
+        end_span(upstream, error="WebSocketDisconnect")
+        metrics.increment("upstream_cancelled")
+        await asyncio.to_thread(usage_ledger.record, tenant, usage or estimated_usage(prompt, "".join(parts)),
+                                tier.model, session.mode, session.audience, session.language)
+        raise
+    except Exception as e:
+        end_span(upstream, error=type(e).__name__)
+        model_router.record(tier.tier, time.perf_counter() - call_started, ok=False)
+        metrics.increment("session_errors")
+        await websocket.send_json({"type": "error", "message": f"Error: {str(e)}"})
+        return session
+    finally:
+        await stream.aclose()
+    end_span(upstream, first_token_ms=round(first_token_time * 1000, 1) if first_token_time is not None else None)
+    model_router.record(tier.tier, time.perf_counter() - call_started, ok=True)
+
+    if usage is None:
+        metrics.increment("usage_estimated")
+        usage = estimated_usage(prompt, "".join(parts))
+    session.add_turn(question, "".join(parts))
+    await asyncio.to_thread(session_store.save, session)
+    recorded = await asyncio.to_thread(usage_ledger.record, tenant, usage, tier.model, session.mode,
+                                       session.audience, session.language)
+    # Prompt tokens the provider served from its cache of the unchanged context prefix
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+    recorded["cached_prompt_tokens"] = cached_tokens
+    metrics.increment("session_cached_prompt_tokens", cached_tokens)
+    budget = await asyncio.to_thread(usage_ledger.check, tenant)
+    if budget.limit:
+        recorded["budget"] = budget.to_dict()
+    await websocket.send_json({
+        "type": "done",
+        "turn": session.turns,
+        "followup": followup,
+        "generation_time": time.time() - start_time,
+        "first_token_time": first_token_time,
+        "model_tier": tier.to_dict(),
+        "usage": recorded,
+        "static_analysis": analysis,
+        "session": session.describe()
+    })
+    return session
+
+@app.websocket("/ws/session")
+async def conversation_session(websocket: WebSocket, session_id: Optional[str] = None):
+    """Conversational explanations: send code once, then ask follow-ups without re-sending it
+
+    Each client message is a JSON SessionMessage. The reply is streamed as
+    {"type": "delta"} messages and closed by one {"type": "done"} message with
+    the usage and session state; {"type": "error"} rejects one message and
+    keeps the session open. Reconnect with ?session_id= to resume.
+    """
+    await websocket.accept()
+    session = await asyncio.to_thread(session_store.get, session_id) if session_id else None
+    if session is not None and session.session_id in session_compactions:
+        session = await session_compactions[session.session_id]
+    await websocket.send_json({"type": "session", "resumed": session is not None,
+                               "session": session.describe() if session else None,
+                               "message": "Session expired; the next message starts a new one"
+                               if session_id and session is None else ""})
+    tenant = request_tenant(websocket)
+    try:
+        while True:
+            try:
+                message = SessionMessage.model_validate(await websocket.receive_json())
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "message": f"Invalid message: {e}"})
+                continue
+            with tracer.trace("WS /ws/session"):
+                session = await session_turn(websocket, session, message, tenant)
+            if session is not None and session.needs_compaction():
+                session_compactions[session.session_id] = asyncio.get_running_loop().create_task(
+                    compact_session(session, tenant))
+    except WebSocketDisconnect:
+        pass
+
+# Prewarming: the Examples page prompts in every mode/audience, then the most asked history queries
+def prewarm_candidates() -> List[DocuGeniusRequest]:
+    requests = [
+        DocuGeniusRequest(query=example["prompt"], mode=mode["id"], audience=audience)
+        for example in EXAMPLES for mode in MODES["modes"] for audience in AUDIENCES
+    ]
+    requests += [
+        DocuGeniusRequest(query=query, mode=mode, audience=audience)
+        for query, mode, audience in result_history.top_queries(PREWARM_TOP_QUERIES)
+    ]
+    unique = {}
+    for request in requests:
+        unique.setdefault(request_cache_key(request, detect_language(request.query)), request)
+    return list(unique.values())
+
+def is_prewarmed(request: DocuGeniusRequest) -> bool:
+    """Cached and still fresh when the next prewarm round starts"""
+    entry = shared_store.get_entry(ASK_CACHE_NAMESPACE, request_cache_key(request, detect_language(request.query)))
+    horizon = min(prewarmer.interval, ASK_CACHE_TTL / 2) if prewarmer.interval else 0
+    return entry is not None and entry[2] is not None and entry[2] > time.time() + horizon
+
+async def prewarm_answer(request: DocuGeniusRequest):
+    await answer_question(request, internal_request("prewarm"), internal=True)
+
+prewarmer = Prewarmer(shared_store, prewarm_candidates, is_prewarmed, prewarm_answer, busy=lambda: live_asks > 0)
+
+# Repository documentation: a background job per request, incremental against the source's manifest
+REPO_JOB_NAMESPACE = "repo_jobs"
+
+def save_repo_job(job_id: str, status: dict):
+    shared_store.set(REPO_JOB_NAMESPACE, job_id, json.dumps(status).encode("utf-8"), ttl=7 * 86400)
+
+async def explain_unit(unit: SourceUnit, mode: str, audience: str, tenant: str) -> dict:
+    """One unit of a repository job, billed to the tenant that started it
+
+    Units read the answer cache but are not written to it or to the history:
+    a large job would otherwise evict users' entries.
+    """
+    request = DocuGeniusRequest(query=unit.source, mode=mode, audience=audience, language=unit.language)
+    response = await answer_question(request, internal_request("repo"), tenant=tenant, internal=True,
+                                     cache_result=False, record_history=False)
+    if not isinstance(response, DocuGeniusResponse):
+        response = DocuGeniusResponse.model_validate_json(response.body)
+    if not response.success:
+        raise RuntimeError(response.message)
+    return response.model_dump(exclude={"usage"})
+
+async def launch_repo_job(source: str, output_key: str, collect, job_request: RepoJobRequest, tenant: str,
+                          on_finish=None) -> dict:
+    """Start a documentation job over the units collect() returns; returns its status
+
+    collect and on_finish are blocking and run in threads.
+    """
+    job_id = str(uuid.uuid4())
+    # One output directory (and manifest) per output key, so repeated jobs only redo what changed
+    output_dir = os.path.join(REPO_OUTPUT_DIR, hashlib.sha256(output_key.encode("utf-8")).hexdigest()[:16])
+    status = {"job_id": job_id, "source": source, "output_dir": output_dir, "state": "running",
+              "started_at": time.time(), "progress": None, "error": None}
+    await asyncio.to_thread(save_repo_job, job_id, status)
+
+    async def run():
+        try:
+            units = await asyncio.to_thread(collect)
+            documenter = RepositoryDocumenter(functools.partial(explain_unit, tenant=tenant), output_dir,
+                                              job_request.mode, job_request.audience, job_request.concurrency)
+            status["progress"] = await documenter.run(units, progress=lambda summary: asyncio.to_thread(
+                save_repo_job, job_id, {**status, "progress": summary}))
+            status["state"] = "done"
+        except asyncio.CancelledError:
+            status["state"] = "cancelled"
+            raise
+        except Exception as e:
+            status.update(state="failed", error=str(e))
+        finally:
+            status["finished_at"] = time.time()
+            await asyncio.to_thread(save_repo_job, job_id, status)
+            repo_jobs.pop(job_id, None)
+            if on_finish is not None:
+                await asyncio.to_thread(on_finish)
+
+    repo_jobs[job_id] = asyncio.get_running_loop().create_task(run())
+    return status
+
+@app.post("/repo/jobs", status_code=202)
+async def start_repo_job(job_request: RepoJobRequest, http_request: Request):
+    """Document a directory, tarball or zip archive in the background; poll /repo/jobs/{job_id} for progress"""
+    if not REPO_ROOTS:
+        raise HTTPException(status_code=403, detail="Repository documentation is disabled (set DOCUGENIUS_REPO_ROOTS)")
+    source = os.path.realpath(job_request.source)
+    if not any(os.path.commonpath([source, root]) == root for root in REPO_ROOTS):
+        raise HTTPException(status_code=403, detail=f"Source is outside DOCUGENIUS_REPO_ROOTS: {job_request.source}")
+    if not os.path.exists(source):
+        raise HTTPException(status_code=404, detail=f"Source not found: {job_request.source}")
+    if job_request.granularity not in ("file", "symbol"):
+        raise HTTPException(status_code=400, detail="granularity must be 'file' or 'symbol'")
+    tenant = request_tenant(http_request)
+    await require_budget(tenant)
+    return await launch_repo_job(source, source,
+                                 lambda: collect_units(source, job_request.languages, job_request.granularity),
+                                 job_request, tenant)
+
+@app.get("/repo/jobs/{job_id}")
+async def get_repo_job(job_id: str):
+    """Status and progress of a repository documentation job, from any worker"""
+    stored = await asyncio.to_thread(shared_store.get, REPO_JOB_NAMESPACE, job_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return json.loads(stored)
+
+UPLOAD_TARGETS = ("inspect", "ask", "repo")
+
+@app.post("/upload/")
+async def upload_sources(http_request: Request, response: Response):
+    """Stream source files or zip/tar archives (multipart/form-data) to disk, then act on them
+
+    Form fields: target ("inspect" lists files with their detected language,
+    "ask" answers a single source file like /ask/, "repo" starts a
+    documentation job over every file), mode, audience, and for "repo"
+    languages (comma-separated) and granularity. "repo" is off unless
+    DOCUGENIUS_UPLOAD_REPO_JOBS is set, and bills the uploader's tenant.
+    """
+    global live_asks
+    try:
+        with span("upload") as stage:
+            upload = await receive_upload(http_request.headers, http_request.stream())
+            if stage is not None:
+                stage.set(bytes=upload.received, parts=len(upload.files))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    fields = upload.fields
+    target = fields.get("target", "inspect")
+    mode = fields.get("mode", "explain_code")
+    # One default for every target, the same as /ask/'s
+    audience = fields.get("audience", "beginner")
+    release = True
+    try:
+        if target not in UPLOAD_TARGETS:
+            raise HTTPException(status_code=400, detail=f"target must be one of {', '.join(UPLOAD_TARGETS)}")
+        if target == "inspect":
+            return {**upload.describe(), **await asyncio.to_thread(upload.inventory)}
+
+        if target == "ask":
+            files = await asyncio.to_thread(lambda: list(itertools.islice(upload.iter_files(), 2)))
+            if len(files) != 1:
+                raise HTTPException(status_code=400, detail=(
+                    f"target=ask takes exactly one text source file of at most {MAX_FILE_BYTES} bytes"))
+            request = DocuGeniusRequest(query=files[0][1], mode=mode, audience=audience,
+                                        language=fields.get("language") or None)
+            live_asks += 1
+            try:
+                return await cancel_on_disconnect(answer_question(request, http_request), http_request)
+            finally:
+                live_asks -= 1
+
+        if not UPLOAD_REPO_JOBS:
+            raise HTTPException(status_code=403, detail=(
+                "Repository jobs from uploads are disabled (set DOCUGENIUS_UPLOAD_REPO_JOBS=true)"))
+        granularity = fields.get("granularity", "file")
+        if granularity not in ("file", "symbol"):
+            raise HTTPException(status_code=400, detail="granularity must be 'file' or 'symbol'")
+        languages = [language.strip() for language in fields.get("languages", "").split(",") if language.strip()]
+        job_request = RepoJobRequest(source=upload.upload_id, languages=languages, granularity=granularity,
+                                     mode=mode, audience=audience)
+        # The whole job is billed to the uploader, so refuse it up front once their budget is spent
+        tenant = request_tenant(http_request)
+        await require_budget(tenant)
+        # Keyed by tenant and uploaded file names, so re-uploading a project only redoes what changed
+        output_key = "upload:" + tenant + ":" + ",".join(sorted(f.name for f in upload.files))
+        status = await launch_repo_job(
+            f"upload:{upload.upload_id}", output_key,
+            lambda: units_from_files(upload.iter_files(), languages, granularity), job_request, tenant, upload.cleanup)
+        release = False
+        response.status_code = 202
+        return {**status, "upload": upload.describe()}
+    except UploadError as e:
+        # Archive limits (member count, expanded size) are only hit while reading the members
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    finally:
+        if release:
+            await asyncio.to_thread(upload.cleanup)
+
+@app.get("/rag/search")
+async def rag_search(q: str, k: int = RAG_TOP_K):
+    """Passages the retrieval index returns for a query, as /ask/ would inject them"""
+    if not rag_engine.enabled:
+        raise HTTPException(status_code=404, detail="Retrieval is disabled (set DOCUGENIUS_RAG_SOURCES)")
+    started = time.perf_counter()
+    hits = await asyncio.to_thread(rag_engine.search, q, k)
+    return {
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        "hits": [{**hit.to_source(number), "score": hit.score, "text": hit.passage.text}
+                 for number, hit in enumerate(hits, 1)]
+    }
+
+@app.post("/rag/reindex", status_code=202)
+async def rag_reindex():
+    """Rebuild the retrieval index into one segment in the background; every worker switches once published"""
+    if not rag_engine.enabled:
+        raise HTTPException(status_code=404, detail="Retrieval is disabled (set DOCUGENIUS_RAG_SOURCES)")
+    # Taking the lease and reading the stats both go to the shared store
+    if not await asyncio.to_thread(rag_engine.try_lock):
+        raise HTTPException(status_code=409, detail="The retrieval index is already being updated")
+
+    def rebuild():
+        try:
+            rag_engine.update(full=True)
+        finally:
+            rag_engine.unlock()
+
+    asyncio.get_running_loop().run_in_executor(None, rebuild)
+    return await asyncio.to_thread(rag_engine.stats)
+
+@app.get("/usage/")
+async def usage_summary(group_by: str = "tenant", since: Optional[float] = None):
+    """Token totals from the ledger grouped by tenant, mode, audience, language or model"""
+    try:
+        groups = await asyncio.to_thread(usage_ledger.summary, group_by, since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "since": since, "groups": groups}
+
+@app.get("/usage/budget")
+async def usage_budget(http_request: Request):
+    """The calling tenant's budget for the current window"""
+    tenant = request_tenant(http_request)
+    return (await asyncio.to_thread(usage_ledger.check, tenant)).to_dict()
+
+@app.get("/history/")
+async def list_history(query: Optional[str] = None, mode: Optional[str] = None,
+                       audience: Optional[str] = None, limit: int = 50):
+    """List generated results, newest first"""
+    entries = await asyncio.to_thread(result_history.search, query=query, mode=mode, audience=audience, limit=limit)
+    return {
+        "total": await asyncio.to_thread(len, result_history),
+        "results": [
+            {key: entry[key] for key in ("result_id", "query", "mode", "audience", "created_at")}
+            for entry in entries
+        ]
+    }
+
+@app.get("/history/{result_id}")
+async def get_history_entry(result_id: str, request: Request):
+    """Retrieve a generated result by ID (conditional on If-None-Match)"""
+    entry = await asyncio.to_thread(result_history.get, result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Result not found: {result_id}")
+    return conditional_response(entry, request.headers.get("if-none-match"), RESULT_CACHE_CONTROL)
+
+@app.post("/export/")
+async def export_results(export_request: ExportRequest):
+    """Render selected results to the requested formats and stream them as a zip archive"""
+    unknown_formats = [fmt for fmt in export_request.formats if fmt not in EXPORT_FORMATS]
+    if unknown_formats or not export_request.formats:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported formats: {unknown_formats}. Choose from {list(EXPORT_FORMATS)}"
+        )
+
+    if export_request.result_ids:
+        result_ids = export_request.result_ids
+        missing = await asyncio.to_thread(result_history.missing, result_ids)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Results not found: {missing}")
+    else:
+        result_ids = await asyncio.to_thread(
+            result_history.search_ids,
+            query=export_request.query,
+            mode=export_request.mode,
+            audience=export_request.audience,
+            limit=export_request.limit
+        )
+    if not result_ids:
+        raise HTTPException(status_code=404, detail="No results matched the export request")
+
+    return StreamingResponse(
+        stream_zip(result_ids, result_history.get, export_request.formats, pdf_exporter),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="docugenius_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+        }
+    )
+
+@app.post("/export/pdf")
+async def export_pdf(result: DocuGeniusResponse):
+    """Render a result as a PDF report and stream it back"""
+    try:
+        key, pdf_bytes = await pdf_exporter.render(result.model_dump())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
+
+    return StreamingResponse(
+        iter_chunks(pdf_bytes),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="docugenius_report_{key[:12]}.pdf"',
+            "Content-Length": str(len(pdf_bytes)),
+            "X-Result-Hash": key
+        }
+    )
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting DocuGenius Backend...")
     print("🔑 OpenAI API Key: Configured and ready!")
-    print("🤖 Using GPT-4o for enhanced responses and image generation!")
+    tiers = ", ".join(f"{name} ({config['model']})" for name, config in model_router.tiers.items())
+    print(f"🤖 Model tiers: {tiers}")
     print("🌐 Backend will be available at: http://localhost:8000")
     print("📖 API Documentation: http://localhost:8000/docs")
     print("🔍 Health Check: http://localhost:8000/health")
+    print(f"👷 Workers: {WORKERS} (shared store: {shared_store.path})")
     print("Press Ctrl+C to stop the server")
     print("-" * 60)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Metrics count from this start; cached answers and history survive restarts
+    shared_store.reset_counters()
+    if WORKERS > 1:
+        # Multiple workers need an import string so each process can load the app
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WORKERS,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,86 @@
+"""
+Metrics - Counters for the DocuGenius API, shared by all workers
+
+Increments are added up in memory and written to the shared store in one
+transaction per flush (every DOCUGENIUS_METRICS_FLUSH_INTERVAL seconds, off
+the event loop), so counting never waits on the SQLite lock. Reads include
+the increments this worker has not flushed yet.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from shared_store import SharedStore
+
+# Seconds between writes of the buffered increments to the shared store
+METRICS_FLUSH_INTERVAL = float(os.getenv("DOCUGENIUS_METRICS_FLUSH_INTERVAL", "1.0"))
+
+class Metrics:
+    """Named counters, reported by the /metrics/ endpoint"""
+
+    def __init__(self, store: SharedStore, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.started_at = time.time()
+        self.store = store
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + value
+
+    def flush(self):
+        """Write the buffered increments in one transaction (blocking; run it in a thread)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            self.store.increment_many(pending)
+        except Exception:
+            # Keep them for the next flush rather than losing them to a busy database
+            with self._lock:
+                for name, value in pending.items():
+                    self._pending[name] = self._pending.get(name, 0) + value
+            raise
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            pending = self._pending.get(name, 0)
+        return self.store.counter(name) + pending
+
+    def snapshot(self) -> Dict:
+        counters = self.store.counters()
+        with self._lock:
+            for name, value in self._pending.items():
+                counters[name] = counters.get(name, 0) + value
+        return {
+            "uptime": time.time() - self.started_at,
+            "pid": os.getpid(),
+            "counters": dict(sorted(counters.items()))
+        }
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                pass
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
@@ -0,0 +1,108 @@
+"""
+Cache Prewarming - Answer the Examples page prompts and popular queries ahead of time
+
+Runs at startup and then on a schedule, one request at a time, pausing
+whenever live requests are in flight. Only one worker prewarms at a time
+(a lease in the shared store); progress is kept in the shared store so every
+worker's readiness endpoint can report it.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from shared_store import SharedStore
+
+# Opt-in: every round regenerates each missing or stale candidate on the paid model
+PREWARM_ENABLED = os.getenv("DOCUGENIUS_PREWARM", "false").lower() == "true"
+# Seconds between prewarm rounds (0 = once at startup)
+PREWARM_INTERVAL = float(os.getenv("DOCUGENIUS_PREWARM_INTERVAL", "3000"))
+PREWARM_TOP_QUERIES = int(os.getenv("DOCUGENIUS_PREWARM_TOP_QUERIES", "20"))
+# Seconds to wait between prewarm requests, and while live traffic is being served
+PREWARM_PAUSE = float(os.getenv("DOCUGENIUS_PREWARM_PAUSE", "0.5"))
+PREWARM_NAMESPACE = "prewarm"
+LEASE_SECONDS = 120.0
+
+class Prewarmer:
+    """Background loop that fills the answer cache before users ask"""
+
+    def __init__(self, store: SharedStore, candidates: Callable[[], List],
+                 is_warm: Callable[[object], bool], warm: Callable[[object], Awaitable[None]],
+                 busy: Callable[[], bool] = lambda: False,
+                 interval: float = PREWARM_INTERVAL, pause: float = PREWARM_PAUSE):
+        self.store = store
+        self.candidates = candidates
+        self.is_warm = is_warm
+        self.warm = warm
+        self.busy = busy
+        self.interval = interval
+        self.pause = pause
+        self.owner = f"{os.getpid()}:{id(self)}"
+        self._task: Optional[asyncio.Task] = None
+
+    def progress(self) -> Dict:
+        """Progress of the current or last round, from whichever worker ran it"""
+        stored = self.store.get(PREWARM_NAMESPACE, "progress")
+        return json.loads(stored) if stored else {"state": "pending"}
+
+    def _save(self, progress: Dict):
+        self.store.set(PREWARM_NAMESPACE, "progress", json.dumps(progress).encode("utf-8"))
+
+    async def run_round(self) -> Optional[Dict]:
+        """Warm every candidate that is missing or stale; None if another worker holds the lease"""
+        # Store calls (and the candidate/freshness callbacks, which read it) run off the event loop
+        if not await asyncio.to_thread(self.store.acquire, PREWARM_NAMESPACE, "lease", self.owner, LEASE_SECONDS):
+            return None
+        candidates = await asyncio.to_thread(lambda: list(self.candidates()))
+        progress = {"state": "running", "total": len(candidates), "completed": 0, "skipped": 0,
+                    "failed": 0, "started_at": time.time(), "finished_at": None}
+        await asyncio.to_thread(self._save, dict(progress))
+        try:
+            for candidate in candidates:
+                # Yield to live traffic: prewarming only uses otherwise idle capacity
+                while self.busy():
+                    await asyncio.sleep(self.pause)
+                await asyncio.to_thread(self.store.acquire, PREWARM_NAMESPACE, "lease", self.owner, LEASE_SECONDS)
+                if await asyncio.to_thread(self.is_warm, candidate):
+                    progress["skipped"] += 1
+                else:
+                    try:
+                        await self.warm(candidate)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:
+                        pass
+                    if await asyncio.to_thread(self.is_warm, candidate):
+                        progress["completed"] += 1
+                    else:
+                        progress["failed"] += 1
+                    await asyncio.sleep(self.pause)
+                await asyncio.to_thread(self._save, dict(progress))
+            progress.update(state="done", finished_at=time.time())
+        except asyncio.CancelledError:
+            progress["state"] = "cancelled"
+            raise
+        finally:
+            await asyncio.to_thread(self._save, dict(progress))
+            await asyncio.to_thread(self.store.delete, PREWARM_NAMESPACE, "lease")
+        return progress
+
+    async def run(self):
+        while True:
+            await self.run_round()
+            if not self.interval:
+                return
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
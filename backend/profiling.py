@@ -0,0 +1,234 @@
+"""
+Sampling Profiler - Where a live worker's CPU goes, without restarting it
+
+A background thread snapshots every thread's Python stack with
+sys._current_frames() at a fixed interval and counts identical stacks.
+The result is in the collapsed format ("thread;outer;inner count" per line),
+which flamegraph.pl, speedscope and inferno read directly. Sampling costs one
+stack walk per thread per tick; the sampler measures that cost and widens its
+interval whenever its CPU time would exceed PROFILE_MAX_OVERHEAD of wall time.
+Only one profile runs per process at a time, and none runs longer than
+PROFILE_MAX_SECONDS.
+
+Profiles are served only to callers that present DOCUGENIUS_PROFILE_TOKEN;
+without it set, profiling is off.
+"""
+
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Shared secret for /debug/profile and the X-Debug-Profile header (empty = profiling disabled)
+PROFILE_TOKEN = os.getenv("DOCUGENIUS_PROFILE_TOKEN", "")
+PROFILE_INTERVAL = float(os.getenv("DOCUGENIUS_PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("DOCUGENIUS_PROFILE_MAX_SECONDS", "60"))
+# Largest share of wall time the sampler may spend walking stacks
+PROFILE_MAX_OVERHEAD = float(os.getenv("DOCUGENIUS_PROFILE_MAX_OVERHEAD", "0.02"))
+MAX_STACK_DEPTH = 64
+# Per-request profiles kept per worker for /debug/profile/{id}
+RECENT_PROFILES = 20
+
+# Leaf frames of threads that are blocked rather than running (file name, function)
+IDLE_FRAMES = {
+    ("selectors.py", "select"), ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("thread.py", "_worker"), ("queue.py", "get"), ("socket.py", "accept"), ("ssl.py", "read")
+}
+
+_running = threading.Lock()
+_THREAD_NUMBER = re.compile(r"\d+")
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+class Profile:
+    """Counted stacks of one profiling run"""
+
+    def __init__(self, stacks: Counter, samples: int, idle_samples: int, duration: float,
+                 interval: float, overhead: float, profile_id: Optional[str] = None):
+        self.profile_id = profile_id or uuid.uuid4().hex
+        self.created_at = time.time()
+        self.stacks = stacks
+        self.samples = samples
+        self.idle_samples = idle_samples
+        self.duration = duration
+        self.interval = interval
+        self.overhead = overhead
+
+    def collapsed(self) -> str:
+        """One "frame;frame;frame count" line per distinct stack, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 20) -> List[Dict]:
+        """Functions by samples spent in them (self) and under them (total)"""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        busy = sum(self.stacks.values()) or 1
+        return [{"function": frame, "self": count, "total": total[frame],
+                 "self_percent": round(100 * count / busy, 1), "total_percent": round(100 * total[frame] / busy, 1)}
+                for frame, count in own.most_common(limit)]
+
+    def summary(self) -> Dict:
+        return {
+            "profile_id": self.profile_id,
+            "created_at": self.created_at,
+            "duration": round(self.duration, 3),
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "stacks": len(self.stacks),
+            "interval_ms": round(self.interval * 1000, 3),
+            "overhead": round(self.overhead, 4)
+        }
+
+    def to_dict(self, limit: int = 20) -> Dict:
+        return {**self.summary(), "top_functions": self.top_functions(limit), "collapsed": self.collapsed()}
+
+class SamplingProfiler:
+    """Samples every thread but its own until stop(); at most one runs per process"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, max_overhead: float = PROFILE_MAX_OVERHEAD,
+                 include_idle: bool = False, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = max(interval, 0.001)
+        self.max_overhead = max_overhead
+        self.include_idle = include_idle
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._labels: Dict = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._sampling_time = 0.0
+
+    def start(self):
+        if not _running.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running in this worker")
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="docugenius-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self, profile_id: Optional[str] = None) -> Profile:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            _running.release()
+        duration = time.perf_counter() - self._started
+        return Profile(self.stacks, self.samples, self.idle_samples, duration, self.interval,
+                       self._sampling_time / max(duration, 1e-9), profile_id)
+
+    def _run(self):
+        deadline = self._started + self.max_seconds
+        requested = self.interval
+        average_cost = None
+        while not self._stopped.wait(self.interval) and time.perf_counter() < deadline:
+            # CPU time of this thread, so waiting for the GIL does not count as overhead
+            began = time.thread_time()
+            self._sample()
+            cost = time.thread_time() - began
+            self._sampling_time += cost
+            # Stretch the interval while the smoothed sample cost would exceed the overhead budget
+            average_cost = cost if average_cost is None else 0.8 * average_cost + 0.2 * cost
+            if self.max_overhead > 0:
+                self.interval = max(requested, average_cost / self.max_overhead)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)})"
+            self._labels[code] = label
+        return label
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            self.samples += 1
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                self.idle_samples += 1
+                continue
+            frames = []
+            while frame is not None and len(frames) < MAX_STACK_DEPTH:
+                frames.append(self._label(frame.f_code))
+                frame = frame.f_back
+            thread = _THREAD_NUMBER.sub("N", names.get(ident, "thread"))
+            self.stacks[";".join([thread] + frames[::-1])] += 1
+
+def token_valid(presented: Optional[str], token: str = PROFILE_TOKEN) -> bool:
+    return bool(token) and presented is not None and hmac.compare_digest(presented.encode(), token.encode())
+
+class RecentProfiles:
+    """The last few profiles of this worker, by profile ID"""
+
+    def __init__(self, size: int = RECENT_PROFILES):
+        self.size = size
+        self._profiles: "OrderedDict[str, Profile]" = OrderedDict()
+
+    def add(self, profile: Profile):
+        self._profiles[profile.profile_id] = profile
+        while len(self._profiles) > self.size:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        return [profile.summary() for profile in reversed(self._profiles.values())]
+
+class ProfilingMiddleware:
+    """Profile single requests that carry X-Debug-Profile and a valid X-Debug-Token
+
+    The response gets an X-Profile-Id header; the profile is fetched from
+    /debug/profile/{id} afterwards. Every thread is sampled, so concurrent
+    requests show up in the profile too. When another profile is already
+    running, the request is served unprofiled with X-Profile-Id: busy.
+    """
+
+    def __init__(self, app, profiles: RecentProfiles, token: str = PROFILE_TOKEN):
+        self.app = app
+        self.profiles = profiles
+        self.token = token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.token:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if "x-debug-profile" not in headers or not token_valid(headers.get("x-debug-token"), self.token):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(include_idle=headers.get("x-debug-profile") == "idle")
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            profiler = None
+        profile_id = uuid.uuid4().hex
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"])["X-Profile-Id"] = profile_id if profiler else "busy"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            if profiler is not None:
+                self.profiles.add(profiler.stop(profile_id))
@@ -0,0 +1,347 @@
+"""
+Repository Documentation - Document a whole source tree, re-processing only what changed
+
+Walks a directory or a tar or zip archive, keeps the files whose detected language is
+wanted, splits them into units (whole files, or top-level functions and
+classes for Python), and explains the units through a bounded pool of
+concurrent workers. A manifest keyed by content hash records every unit's
+result, so a re-run only explains new or changed units and re-renders the
+pages of files that changed.
+
+Run: python backend/repo_docs.py SOURCE --output DIR [--granularity symbol] [--languages python,go]
+"""
+
+import argparse
+import ast
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from language_detection import detect_language
+
+REPO_CONCURRENCY = int(os.getenv("DOCUGENIUS_REPO_CONCURRENCY", "4"))
+MAX_FILE_BYTES = int(os.getenv("DOCUGENIUS_REPO_MAX_FILE_BYTES", "200000"))
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", "env",
+             "dist", "build", ".mypy_cache", ".pytest_cache", ".tox", ".idea", ".vscode"}
+MANIFEST_NAME = "manifest.json"
+# Bump when unit splitting or prompting changes, so every unit is explained again
+MANIFEST_VERSION = 1
+# Completed units between manifest checkpoints
+CHECKPOINT_EVERY = 20
+
+class SourceUnit(NamedTuple):
+    unit_id: str
+    path: str
+    symbol: Optional[str]
+    language: str
+    source: str
+    lines: Optional[str]
+
+def decode_source(data: bytes) -> Optional[str]:
+    """File contents as text, or None for binary, oversized or non-UTF-8 files"""
+    if len(data) > MAX_FILE_BYTES or b"\0" in data[:8192]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+class ArchiveTooLarge(ValueError):
+    pass
+
+def is_archive(path: str) -> bool:
+    return os.path.isfile(path) and (tarfile.is_tarfile(path) or zipfile.is_zipfile(path))
+
+def _skipped(name: str) -> bool:
+    return any(part in SKIP_DIRS or part.startswith(".") for part in name.split("/")[:-1])
+
+def iter_archive_files(path: str, max_members: Optional[int] = None,
+                       max_expanded_bytes: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """(member path, text) for readable text members of a tar or zip archive, read one at a time
+
+    Nothing is extracted to disk. Members above MAX_FILE_BYTES are skipped by
+    their declared size and read with a bound in case it lies; ArchiveTooLarge
+    is raised once the archive holds more than max_members files or
+    max_expanded_bytes of them.
+    """
+    members = 0
+    expanded = 0
+
+    def admit(size: int):
+        nonlocal members, expanded
+        members += 1
+        expanded += size
+        if max_members is not None and members > max_members:
+            raise ArchiveTooLarge(f"Archive has more than {max_members} files")
+        if max_expanded_bytes is not None and expanded > max_expanded_bytes:
+            raise ArchiveTooLarge(f"Archive expands to more than {max_expanded_bytes} bytes")
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                name = posixpath.normpath(info.filename).lstrip("/")
+                if info.is_dir() or _skipped(name):
+                    continue
+                admit(info.file_size)
+                if info.file_size > MAX_FILE_BYTES:
+                    continue
+                with archive.open(info) as handle:
+                    text = decode_source(handle.read(MAX_FILE_BYTES + 1))
+                if text is not None:
+                    yield name, text
+        return
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            name = posixpath.normpath(member.name).lstrip("/")
+            if not member.isfile() or _skipped(name):
+                continue
+            admit(member.size)
+            if member.size > MAX_FILE_BYTES:
+                continue
+            handle = archive.extractfile(member)
+            text = decode_source(handle.read(MAX_FILE_BYTES + 1)) if handle else None
+            if text is not None:
+                yield name, text
+
+def iter_source_files(source: str) -> Iterator[Tuple[str, str]]:
+    """(relative path, text) for every readable text file in a directory or a tar or zip archive"""
+    if is_archive(source):
+        yield from iter_archive_files(source)
+        return
+    for relative, path in walk_directory(source):
+        if os.path.getsize(path) > MAX_FILE_BYTES:
+            continue
+        with open(path, "rb") as handle:
+            text = decode_source(handle.read())
+        if text is not None:
+            yield relative, text
+
+def walk_directory(source: str) -> Iterator[Tuple[str, str]]:
+    """(relative path, absolute path) for every file under source outside skipped directories"""
+    for directory, subdirectories, files in os.walk(source):
+        subdirectories[:] = sorted(d for d in subdirectories if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            yield os.path.relpath(path, source).replace(os.sep, "/"), path
+
+def split_units(path: str, text: str, language: str, granularity: str = "file") -> List[SourceUnit]:
+    """Units to explain for one file; symbol granularity splits Python into top-level definitions"""
+    if granularity == "symbol" and language == "python":
+        try:
+            tree = ast.parse(text)
+        except SyntaxError:
+            tree = None
+        if tree is not None:
+            units = [
+                SourceUnit(f"{path}::{node.name}", path, node.name, language,
+                           ast.get_source_segment(text, node) or "", f"{node.lineno}-{node.end_lineno}")
+                for node in tree.body
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+            ]
+            if units:
+                return units
+    return [SourceUnit(path, path, None, language, text, None)]
+
+def collect_units(source: str, languages: Optional[Iterable[str]] = None,
+                  granularity: str = "file") -> List[SourceUnit]:
+    """Units for every file whose detected language is in languages (any code language by default)"""
+    return units_from_files(iter_source_files(source), languages, granularity)
+
+def units_from_files(files: Iterable[Tuple[str, str]], languages: Optional[Iterable[str]] = None,
+                     granularity: str = "file") -> List[SourceUnit]:
+    """collect_units() for (path, text) pairs from any origin"""
+    wanted = set(languages) if languages else None
+    units = []
+    for path, text in files:
+        if not text.strip():
+            continue
+        language = detect_language(text)
+        if (wanted is not None and language not in wanted) or (wanted is None and language == "text"):
+            continue
+        units.extend(split_units(path, text, language, granularity))
+    return units
+
+def unit_hash(unit: SourceUnit, mode: str, audience: str) -> str:
+    """Content hash of everything that determines a unit's explanation"""
+    key = json.dumps([MANIFEST_VERSION, unit.language, mode, audience, unit.source])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def render_file_page(path: str, entries: List[Dict]) -> str:
+    """Markdown page for one source file from its manifest entries"""
+    lines = [f"# `{path}`", ""]
+    for entry in sorted(entries, key=lambda item: int((item.get("lines") or "0").split("-")[0])):
+        result = entry["result"]
+        if entry.get("symbol"):
+            lines.extend([f"## `{entry['symbol']}` (lines {entry['lines']})", ""])
+        lines.extend([result.get("explanation", ""), ""])
+        if result.get("breakdown"):
+            lines.extend(f"{i}. {step}" for i, step in enumerate(result["breakdown"], 1))
+            lines.append("")
+    return "\n".join(lines)
+
+def _page_path(output_dir: str, path: str) -> str:
+    return os.path.join(output_dir, *path.split("/")) + ".md"
+
+async def _report(progress: Callable[[Dict], Any], summary: Dict):
+    """Call a progress callback with a copy of the summary, awaiting it when it returns an awaitable"""
+    outcome = progress(dict(summary))
+    if inspect.isawaitable(outcome):
+        await outcome
+
+class RepositoryDocumenter:
+    """Explains changed units with bounded concurrency and maintains the manifest and pages"""
+
+    def __init__(self, explain: Callable[[SourceUnit, str, str], Awaitable[Dict]], output_dir: str,
+                 mode: str = "explain_code", audience: str = "intermediate",
+                 concurrency: int = REPO_CONCURRENCY):
+        self.explain = explain
+        self.output_dir = output_dir
+        self.mode = mode
+        self.audience = audience
+        self.concurrency = max(1, concurrency)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+    def load_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path) as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return {}
+        return manifest.get("units", {}) if manifest.get("version") == MANIFEST_VERSION else {}
+
+    def save_manifest(self, units: Dict[str, Dict]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w") as handle:
+            json.dump({"version": MANIFEST_VERSION, "mode": self.mode, "audience": self.audience,
+                       "units": units}, handle)
+        os.replace(temporary, self.manifest_path)
+
+    async def run(self, units: List[SourceUnit], progress: Optional[Callable[[Dict], Any]] = None) -> Dict:
+        started = time.perf_counter()
+        # Manifest and page I/O runs in threads so a large repository does not stall the event loop
+        previous = await asyncio.to_thread(self.load_manifest)
+        manifest = {}
+        pending = []
+        for unit in units:
+            digest = unit_hash(unit, self.mode, self.audience)
+            entry = previous.get(unit.unit_id)
+            if entry is not None and entry["hash"] == digest:
+                manifest[unit.unit_id] = entry
+            else:
+                pending.append((unit, digest))
+        removed = set(previous) - {unit.unit_id for unit in units}
+        summary = {"units": len(units), "reused": len(units) - len(pending), "processed": 0,
+                   "failed": 0, "removed": len(removed), "pending": len(pending), "elapsed": 0.0}
+        changed_files = {previous[unit_id]["path"] for unit_id in removed}
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+        # Checkpoints share the manifest's temporary file, so only one is written at a time
+        checkpointing = asyncio.Lock()
+
+        async def worker():
+            while True:
+                try:
+                    unit, digest = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await self.explain(unit, self.mode, self.audience)
+                except Exception as e:
+                    summary["failed"] += 1
+                    summary.setdefault("errors", []).append(f"{unit.unit_id}: {e}")
+                    # Keep the previous explanation, if any; the hash mismatch retries it next run
+                    if unit.unit_id in previous:
+                        manifest[unit.unit_id] = previous[unit.unit_id]
+                else:
+                    manifest[unit.unit_id] = {
+                        "hash": digest, "path": unit.path, "symbol": unit.symbol, "lines": unit.lines,
+                        "language": unit.language, "result": result
+                    }
+                    changed_files.add(unit.path)
+                    summary["processed"] += 1
+                summary["pending"] -= 1
+                if (summary["processed"] + summary["failed"]) % CHECKPOINT_EVERY == 0:
+                    async with checkpointing:
+                        await asyncio.to_thread(self.save_manifest, {**previous, **manifest})
+                if progress is not None:
+                    await _report(progress, summary)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)) or 1)))
+
+        await asyncio.to_thread(self.save_manifest, manifest)
+        await asyncio.to_thread(self.write_pages, manifest, changed_files)
+        summary["elapsed"] = round(time.perf_counter() - started, 3)
+        if progress is not None:
+            await _report(progress, summary)
+        return summary
+
+    def write_pages(self, manifest: Dict[str, Dict], changed_files: Iterable[str]):
+        by_file: Dict[str, List[Dict]] = {}
+        for entry in manifest.values():
+            by_file.setdefault(entry["path"], []).append(entry)
+        for path in changed_files:
+            page = _page_path(self.output_dir, path)
+            if path in by_file:
+                os.makedirs(os.path.dirname(page), exist_ok=True)
+                with open(page, "w") as handle:
+                    handle.write(render_file_page(path, by_file[path]))
+            elif os.path.exists(page):
+                os.remove(page)
+        index = ["# Repository Documentation", ""]
+        index.extend(f"- [`{path}`]({path}.md)" for path in sorted(by_file))
+        with open(os.path.join(self.output_dir, "index.md"), "w") as handle:
+            handle.write("\n".join(index) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Document a repository with DocuGenius")
+    parser.add_argument("source", help="Directory, tarball or zip archive to document")
+    parser.add_argument("--output", required=True, help="Directory for the Markdown pages and manifest")
+    parser.add_argument("--languages", help="Comma-separated languages to include (default: all code)")
+    parser.add_argument("--granularity", choices=["file", "symbol"], default="file")
+    parser.add_argument("--mode", default="explain_code")
+    parser.add_argument("--audience", default="intermediate")
+    parser.add_argument("--concurrency", type=int, default=REPO_CONCURRENCY)
+    parser.add_argument("--api", default="http://localhost:8000", help="DocuGenius API base URL")
+    args = parser.parse_args()
+
+    import httpx
+
+    async def run():
+        async with httpx.AsyncClient(base_url=args.api, timeout=120) as client:
+            async def explain(unit, mode, audience):
+                response = await client.post("/ask/", json={
+                    "query": unit.source, "mode": mode, "audience": audience, "language": unit.language
+                })
+                response.raise_for_status()
+                result = response.json()
+                if not result.get("success", True):
+                    raise RuntimeError(result.get("message", "generation failed"))
+                return result
+
+            units = collect_units(args.source, args.languages.split(",") if args.languages else None,
+                                  args.granularity)
+            print(f"📚 {len(units)} units in {args.source}")
+            documenter = RepositoryDocumenter(explain, args.output, args.mode, args.audience, args.concurrency)
+            return await documenter.run(units, progress=lambda summary: print(
+                f"   {summary['processed']} explained, {summary['reused']} unchanged, "
+                f"{summary['failed']} failed, {summary['pending']} left", end="\r"))
+
+    summary = asyncio.run(run())
+    print()
+    print(f"✅ Done in {summary['elapsed']:.1f}s: {summary['processed']} explained, {summary['reused']} unchanged, "
+          f"{summary['removed']} removed, {summary['failed']} failed")
+    for error in summary.get("errors", [])[:10]:
+        print(f"   ❌ {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,692 @@
+"""
+Retrieval - Local BM25 and vector index over project documentation and code
+
+Ingested files are split into passages (Markdown sections, Python top-level
+definitions, fixed line windows for other code) and indexed into an inverted
+index. Index files are written once and then memory-mapped: postings,
+passage lengths and passage texts are flat binary files, so every worker
+process shares the same pages and only the vocabulary is held in memory.
+With numpy installed, each segment also holds a dense vector index
+(vectors.py) and rankings from both are fused, so paraphrased questions still
+find passages that share no exact keywords with them.
+
+The index is a set of immutable segments listed in MANIFEST.json. A polling
+watcher writes changed files to a new small segment and tombstones their old
+passages (deleted files are only tombstoned); small or mostly-dead segments
+are merged in the background. A manifest is published by atomic replace and
+each worker swaps in a fully loaded snapshot of it, so queries never wait on
+an update or see a half-written index.
+"""
+
+import array
+import asyncio
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from language_detection import detect_language
+from repo_docs import MAX_FILE_BYTES, decode_source, iter_source_files, split_units, walk_directory
+from metrics import Metrics
+from shared_store import SharedStore
+
+RAG_INDEX_DIR = os.getenv("DOCUGENIUS_RAG_INDEX", os.path.join(tempfile.gettempdir(), "docugenius_rag"))
+# Directories or tarballs to index (os.pathsep-separated); empty disables retrieval
+RAG_SOURCES = [source for source in os.getenv("DOCUGENIUS_RAG_SOURCES", "").split(os.pathsep) if source]
+RAG_TOP_K = int(os.getenv("DOCUGENIUS_RAG_TOP_K", "4"))
+# Total characters of retrieved context added to a prompt
+RAG_CONTEXT_CHARS = int(os.getenv("DOCUGENIUS_RAG_CONTEXT_CHARS", "2000"))
+DOC_EXTENSIONS = (".md", ".markdown", ".rst", ".txt", ".adoc")
+# Passage size for documents and non-Python code
+CHUNK_LINES = 40
+# "hybrid" fuses keyword and dense rankings, "bm25" or "dense" use one; dense needs numpy
+RAG_RETRIEVER = os.getenv("DOCUGENIUS_RAG_RETRIEVER", "hybrid")
+# Long queries (pasted code) are reduced to their rarest terms
+MAX_QUERY_TERMS = 48
+# Query terms in more than this share of passages are dropped (unless no other term matches)
+COMMON_TERM_RATIO = 0.5
+# Candidates taken from each ranking per requested hit, and the reciprocal-rank-fusion constant
+FUSION_CANDIDATES = 3
+RRF_K = 60
+EMBED_BATCH = 1024
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Seconds between checks for a manifest published by another worker
+REFRESH_SECONDS = 1.0
+# Seconds between scans of the sources for changed files (0 = only at startup and on /rag/reindex)
+RAG_WATCH_INTERVAL = float(os.getenv("DOCUGENIUS_RAG_WATCH_INTERVAL", "30"))
+# Readiness fails when the last completed scan is older than this (0 = freshness is only reported)
+RAG_MAX_LAG = float(os.getenv("DOCUGENIUS_RAG_MAX_LAG", "0"))
+# Merge when there are more segments than this, or when a segment is mostly tombstones
+MAX_SEGMENTS = 8
+MERGE_DEAD_RATIO = 0.5
+RAG_NAMESPACE = "rag"
+BUILD_LEASE_SECONDS = 3600.0
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or that the this to was were will
+with what how why when which who does do can i you we my your our me us self return def else
+""".split())
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+@lru_cache(maxsize=1 << 16)
+def _word_terms(word: str) -> Tuple[str, ...]:
+    lowered = word.lower()
+    parts = [part.lower() for piece in word.split("_") for part in _CAMEL.findall(piece)]
+    return tuple(term for term in [lowered] + (parts if len(parts) > 1 else [])
+                 if len(term) > 1 and term not in STOPWORDS)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms; identifiers also contribute their snake_case and camelCase parts"""
+    terms = []
+    for word in _WORD.findall(text):
+        terms.extend(_word_terms(word))
+    return terms
+
+class Passage(NamedTuple):
+    file: str
+    type: str  # "doc" or "code"
+    symbol: Optional[str]
+    lines: str
+    text: str
+
+class SearchHit(NamedTuple):
+    passage: Passage
+    score: float
+
+    def to_source(self, citation: int) -> Dict:
+        """Fields of the API's Source model; id is the [n] citation used in the prompt"""
+        return {"id": str(citation), "file": self.passage.file, "type": self.passage.type,
+                "symbol": self.passage.symbol, "lines": self.passage.lines}
+
+def _windows(path: str, kind: str, lines: List[str], first_line: int, symbol: Optional[str]) -> List[Passage]:
+    passages = []
+    for start in range(0, len(lines), CHUNK_LINES):
+        window = lines[start:start + CHUNK_LINES]
+        text = "\n".join(window).strip()
+        if text:
+            begin = first_line + start
+            passages.append(Passage(path, kind, symbol, f"{begin}-{begin + len(window) - 1}", text))
+    return passages
+
+def split_passages(path: str, text: str) -> List[Passage]:
+    """Passages for one file: sections for docs, definitions or line windows for code"""
+    lines = text.splitlines()
+    if path.lower().endswith(DOC_EXTENSIONS):
+        passages = []
+        section_start, heading = 0, None
+        for number, line in enumerate(lines + ["# "]):
+            match = _HEADING.match(line)
+            if match or number == len(lines):
+                passages.extend(_windows(path, "doc", lines[section_start:number], section_start + 1, heading))
+                section_start, heading = number, match.group(2).strip("*_` ") if match else None
+        return passages
+    language = detect_language(text)
+    if language == "text":
+        return []
+    if language == "python":
+        units = split_units(path, text, language, "symbol")
+        if units[0].symbol is not None:
+            # The module docstring and constants come before the first definition
+            preamble_end = int(units[0].lines.split("-")[0]) - 1
+            passages = _windows(path, "code", lines[:preamble_end], 1, None)
+            for unit in units:
+                begin = int(unit.lines.split("-")[0])
+                passages.extend(_windows(path, "code", unit.source.splitlines(), begin, unit.symbol))
+            return passages
+    return _windows(path, "code", lines, 1, None)
+
+@lru_cache(maxsize=None)
+def dense_module():
+    """vectors.py, imported on first use since it loads numpy; None for "bm25" or without numpy"""
+    if RAG_RETRIEVER == "bm25":
+        return None
+    try:
+        import vectors
+    except ImportError:
+        return None
+    return vectors
+
+def indexed_text(passage: Passage) -> str:
+    """What is tokenized and embedded for a passage: its symbol or heading, then its text"""
+    return passage.text if passage.symbol is None else f"{passage.symbol}\n{passage.text}"
+
+def write_segment(directory: str, passages: List[Passage]):
+    """Write an immutable segment for passages into directory (which must not exist yet)"""
+    os.makedirs(directory)
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    lengths = array.array("I")
+    offsets = []
+    vectors = dense_module()
+    embedder = vectors.HashingEmbedder(tokenize) if vectors is not None else None
+
+    def batches():
+        # Each passage is tokenized once, for its postings and its embedding
+        position = 0
+        with open(os.path.join(directory, "texts.bin"), "wb") as texts:
+            for first in range(0, len(passages), EMBED_BATCH):
+                batch = []
+                for number in range(first, min(first + EMBED_BATCH, len(passages))):
+                    passage = passages[number]
+                    terms = tokenize(indexed_text(passage))
+                    batch.append(terms)
+                    lengths.append(len(terms))
+                    for term, frequency in Counter(terms).items():
+                        postings.setdefault(term, []).append((number, frequency))
+                    encoded = passage.text.encode("utf-8")
+                    texts.write(encoded)
+                    offsets.append([position, len(encoded)])
+                    position += len(encoded)
+                if embedder is not None:
+                    yield embedder.embed_terms(batch)
+
+    if embedder is not None:
+        vectors.write_vectors(directory, batches(), embedder.dim)
+    else:
+        for _ in batches():
+            pass
+    vocabulary = {}
+    with open(os.path.join(directory, "postings.bin"), "wb") as handle:
+        start = 0
+        for term in sorted(postings):
+            entries = array.array("I", [value for pair in postings[term] for value in pair])
+            entries.tofile(handle)
+            vocabulary[term] = [start, len(postings[term])]
+            start += len(postings[term])
+    with open(os.path.join(directory, "lengths.bin"), "wb") as handle:
+        lengths.tofile(handle)
+    with open(os.path.join(directory, "meta.json"), "w") as handle:
+        json.dump({
+            "built_at": time.time(),
+            "passages": [[p.file, p.type, p.symbol, p.lines] + offset for p, offset in zip(passages, offsets)],
+            "total_length": sum(lengths),
+            "vocabulary": vocabulary
+        }, handle)
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    if os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as handle:
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+class Segment:
+    """One immutable, memory-mapped segment: BM25 postings plus, when built with numpy, vectors"""
+
+    def __init__(self, directory: str):
+        self.name = os.path.basename(directory)
+        with open(os.path.join(directory, "meta.json")) as handle:
+            meta = json.load(handle)
+        self.built_at = meta["built_at"]
+        self.passages = meta["passages"]
+        self.total_length = meta["total_length"]
+        self.vocabulary = meta["vocabulary"]
+        self._postings_map = _map(os.path.join(directory, "postings.bin"))
+        self._lengths_map = _map(os.path.join(directory, "lengths.bin"))
+        self._texts = _map(os.path.join(directory, "texts.bin"))
+        self._postings = memoryview(self._postings_map).cast("I") if self._postings_map else memoryview(b"").cast("I")
+        self._lengths = memoryview(self._lengths_map).cast("I") if self._lengths_map else memoryview(b"").cast("I")
+        vectors = dense_module()
+        has_vectors = vectors is not None and os.path.exists(os.path.join(directory, "vectors.json"))
+        self.dense = vectors.VectorIndex(directory) if has_vectors else None
+        # Passage numbers per file, to resolve tombstones
+        self.by_file: Dict[str, List[int]] = {}
+        for number, entry in enumerate(self.passages):
+            self.by_file.setdefault(entry[0], []).append(number)
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def passage(self, number: int) -> Passage:
+        file, kind, symbol, lines, start, size = self.passages[number]
+        text = self._texts[start:start + size].decode("utf-8") if self._texts else ""
+        return Passage(file, kind, symbol, lines, text)
+
+    def document_frequency(self, term: str) -> int:
+        entry = self.vocabulary.get(term)
+        return entry[1] if entry else 0
+
+    def score(self, idfs: Dict[str, float], average_length: float, dead: Set[int]) -> Dict[int, float]:
+        """BM25 scores of this segment's live passages for terms weighted by corpus-wide idf"""
+        scores: Dict[int, float] = {}
+        for term, idf in idfs.items():
+            entry = self.vocabulary.get(term)
+            if entry is None:
+                continue
+            start, count = entry
+            entries = self._postings[2 * start:2 * (start + count)]
+            for position in range(0, 2 * count, 2):
+                number, frequency = entries[position], entries[position + 1]
+                if number in dead:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[number] / average_length)
+                scores[number] = scores.get(number, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+class IndexSnapshot:
+    """The segments of one published manifest, with tombstones resolved to passage numbers"""
+
+    def __init__(self, manifest: Dict, segments: Dict[str, Segment]):
+        self.version = manifest["version"]
+        self.sources = manifest["sources"]
+        self.updated_at = manifest["updated_at"]
+        self.segments = [segments[entry["name"]] for entry in manifest["segments"]]
+        self.dead: Dict[str, Set[int]] = {
+            entry["name"]: {number for path in entry["tombstones"] for number in segment.by_file.get(path, ())}
+            for entry, segment in zip(manifest["segments"], self.segments)
+        }
+        self.stored = sum(len(segment) for segment in self.segments)
+        self.passages = self.stored - sum(len(dead) for dead in self.dead.values())
+        # Tombstoned passages still count towards the statistics until their segment is merged
+        self.average_length = (sum(segment.total_length for segment in self.segments) / self.stored
+                               if self.stored else 0.0) or 1.0
+
+    @property
+    def dense(self) -> bool:
+        return bool(self.segments) and all(segment.dense is not None for segment in self.segments)
+
+    def idf(self, document_frequency: int) -> float:
+        return math.log(1 + (self.stored - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def rank_keywords(self, query: str, k: int) -> List[Tuple[Segment, int, float]]:
+        frequencies = {}
+        for term in set(tokenize(query)):
+            frequency = sum(segment.document_frequency(term) for segment in self.segments)
+            if frequency:
+                frequencies[term] = frequency
+        # Pasted code has hundreds of terms; the rarest ones carry almost all of the score, while
+        # terms in most passages cost a full postings scan for a near-zero idf
+        terms = sorted(frequencies, key=frequencies.get)[:MAX_QUERY_TERMS]
+        terms = [term for term in terms if frequencies[term] <= COMMON_TERM_RATIO * self.stored] or terms[:1]
+        idfs = {term: self.idf(frequencies[term]) for term in terms}
+        ranked = []
+        for segment in self.segments:
+            scores = segment.score(idfs, self.average_length, self.dead[segment.name])
+            ranked.extend((segment, number, score) for number, score in
+                          heapq.nlargest(k, scores.items(), key=lambda item: item[1]))
+        return heapq.nlargest(k, ranked, key=lambda item: item[2])
+
+    def rank_dense(self, query_vector, k: int) -> List[Tuple[Segment, int, float]]:
+        ranked = []
+        for segment in self.segments:
+            dead = self.dead[segment.name]
+            # Ask for one extra candidate per tombstone: even if every dead passage outranks the live
+            # ones, k live passages are left once they are dropped
+            for number, score in segment.dense.search(query_vector, k + len(dead))[0]:
+                if number not in dead:
+                    ranked.append((segment, number, score))
+        return heapq.nlargest(k, ranked, key=lambda item: item[2])
+
+    def search(self, query: str, k: int, retriever: str = RAG_RETRIEVER,
+               embedder: Optional["vectors.HashingEmbedder"] = None) -> List[SearchHit]:
+        if not self.dense or embedder is None or retriever == "bm25":
+            ranked = self.rank_keywords(query, k)
+        else:
+            dense = self.rank_dense(embedder.embed([query]), k * FUSION_CANDIDATES)
+            if retriever == "dense":
+                ranked = dense[:k]
+            else:
+                # Reciprocal rank fusion: robust to the two scores living on different scales
+                fused: Dict[Tuple[str, int], List] = {}
+                for ranking in (self.rank_keywords(query, k * FUSION_CANDIDATES), dense):
+                    for rank, (segment, number, _) in enumerate(ranking):
+                        item = fused.setdefault((segment.name, number), [segment, number, 0.0])
+                        item[2] += 1.0 / (RRF_K + rank + 1)
+                ranked = heapq.nlargest(k, fused.values(), key=lambda item: item[2])
+        return [SearchHit(segment.passage(number), round(score, 4)) for segment, number, score in ranked]
+
+def _file_entry(text: str, stamp: List[int], source: str, previous: Optional[Dict]) -> Dict:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    unchanged = previous is not None and previous["hash"] == digest
+    return {"hash": digest, "stamp": stamp, "source": source,
+            "segment": previous["segment"] if unchanged else None}
+
+class RAGEngine:
+    """Maintains the segment index for a set of sources and answers queries from a loaded snapshot"""
+
+    def __init__(self, store: SharedStore, directory: str = RAG_INDEX_DIR, sources: Optional[List[str]] = None,
+                 watch_interval: float = RAG_WATCH_INTERVAL, metrics: Optional[Metrics] = None):
+        self.store = store
+        self.metrics = metrics
+        self.directory = directory
+        self.sources = [os.path.abspath(source) for source in (RAG_SOURCES if sources is None else sources)]
+        self.watch_interval = watch_interval
+        self.manifest_path = os.path.join(directory, "MANIFEST.json")
+        self.snapshot: Optional[IndexSnapshot] = None
+        # NumPy is only loaded once retrieval is configured
+        vectors = dense_module() if self.sources else None
+        self.embedder = vectors.HashingEmbedder(tokenize) if vectors is not None else None
+        self.updating = False
+        self.last_error: Optional[str] = None
+        self.owner = f"{os.getpid()}:{id(self)}"
+        self._manifest_stamp = None
+        # Serializes updates within this process; the lease serializes them across workers
+        self._update_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sources)
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.manifest_path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def refresh(self) -> bool:
+        """Swap in a snapshot of the newest published manifest; True when one is loaded"""
+        try:
+            info = os.stat(self.manifest_path)
+        except OSError:
+            return self.snapshot is not None
+        stamp = (info.st_mtime_ns, info.st_ino)
+        if stamp != self._manifest_stamp:
+            try:
+                manifest = self.read_manifest()
+                loaded = {segment.name: segment for segment in self.snapshot.segments} if self.snapshot else {}
+                segments = {entry["name"]: loaded.get(entry["name"]) or Segment(os.path.join(self.directory, entry["name"]))
+                            for entry in manifest["segments"]}
+                self.snapshot = IndexSnapshot(manifest, segments)
+                self._manifest_stamp = stamp
+            except (OSError, ValueError, KeyError, TypeError):
+                # A merge removed a segment while it was loading; the next refresh sees the newer manifest
+                pass
+        return self.snapshot is not None
+
+    def publish(self, manifest: Dict):
+        """Atomically replace the manifest, then remove segments it no longer lists"""
+        manifest["version"] += 1
+        manifest["updated_at"] = time.time()
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w") as handle:
+            json.dump(manifest, handle)
+        os.replace(temporary, self.manifest_path)
+        # Workers still holding an older snapshot keep reading the unlinked files through their mappings
+        listed = {entry["name"] for entry in manifest["segments"]}
+        for name in os.listdir(self.directory):
+            if name.startswith("seg-") and name not in listed:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        self.refresh()
+
+    def try_lock(self) -> bool:
+        """Take the right to update the index, in this process and across workers"""
+        if not self._update_lock.acquire(blocking=False):
+            return False
+        if not self.store.acquire(RAG_NAMESPACE, "build", self.owner, BUILD_LEASE_SECONDS):
+            self._update_lock.release()
+            return False
+        return True
+
+    def unlock(self):
+        self.store.delete(RAG_NAMESPACE, "build")
+        self._update_lock.release()
+
+    def scan(self, known: Dict[str, Dict]) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """File entries for every current source file, and the text of new or changed ones
+
+        Files whose modification time and size match their known entry are
+        not read; a tarball is only re-read when the archive itself changed.
+        """
+        files: Dict[str, Dict] = {}
+        changed: Dict[str, str] = {}
+
+        def track(path: str, text: str, stamp: List[int], source: str):
+            entry = _file_entry(text, stamp, source, known.get(path))
+            files[path] = entry
+            if entry["segment"] is None and (path not in known or known[path]["hash"] != entry["hash"]):
+                changed[path] = text
+
+        for source in self.sources:
+            prefix = os.path.basename(os.path.normpath(source))
+            if os.path.isdir(source):
+                for relative, absolute in walk_directory(source):
+                    path = f"{prefix}/{relative}"
+                    try:
+                        info = os.stat(absolute)
+                        if known.get(path, {}).get("stamp") == [info.st_mtime_ns, info.st_size]:
+                            files[path] = known[path]
+                            continue
+                        if info.st_size > MAX_FILE_BYTES:
+                            continue
+                        with open(absolute, "rb") as handle:
+                            text = decode_source(handle.read())
+                    except OSError:
+                        continue
+                    if text is not None:
+                        track(path, text, [info.st_mtime_ns, info.st_size], source)
+            elif os.path.isfile(source):
+                info = os.stat(source)
+                stamp = [info.st_mtime_ns, info.st_size]
+                members = {path: entry for path, entry in known.items() if entry["source"] == source}
+                if members and all(entry["stamp"] == stamp for entry in members.values()):
+                    files.update(members)
+                    continue
+                for relative, text in iter_source_files(source):
+                    track(f"{prefix}/{relative}", text, stamp, source)
+        return files, changed
+
+    def update(self, full: bool = False) -> Dict:
+        """Index new and changed files into a new segment, tombstone what they replace, and publish
+
+        full rebuilds every file into a single segment. The caller must hold the lock.
+        """
+        self.updating = True
+        try:
+            started = time.perf_counter()
+            published = self.read_manifest()
+            manifest = published
+            if full or manifest is None or sorted(manifest["sources"]) != sorted(self.sources):
+                manifest = {"version": published["version"] if published else 0, "sources": self.sources,
+                            "segments": [], "files": {}, "updated_at": 0}
+            known = manifest["files"]
+            files, changed = self.scan(known)
+            removed = [path for path in known if path not in files]
+
+            # Tombstone the passages of deleted and changed files in the segments that hold them
+            stale: Dict[str, Set[str]] = {}
+            for path in removed + [path for path in changed if path in known]:
+                if known[path]["segment"] is not None:
+                    stale.setdefault(known[path]["segment"], set()).add(path)
+            for entry in manifest["segments"]:
+                entry["tombstones"] = sorted(set(entry["tombstones"]) | stale.get(entry["name"], set()))
+
+            passages = []
+            indexed = set()
+            for path, text in changed.items():
+                file_passages = split_passages(path, text)
+                if file_passages:
+                    indexed.add(path)
+                    passages.extend(file_passages)
+            if passages:
+                os.makedirs(self.directory, exist_ok=True)
+                name = f"seg-{time.time_ns()}"
+                write_segment(os.path.join(self.directory, name), passages)
+                manifest["segments"].append({"name": name, "passages": len(passages), "tombstones": []})
+                for path in indexed:
+                    files[path]["segment"] = name
+
+            summary = {
+                "added": sum(1 for path in changed if path not in known),
+                "changed": sum(1 for path in changed if path in known),
+                "deleted": len(removed),
+                "passages": len(passages),
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            if files != known or manifest is not published:
+                os.makedirs(self.directory, exist_ok=True)
+                manifest["files"] = files
+                self.publish(manifest)
+            self.store.set(RAG_NAMESPACE, "last_scan", json.dumps({**summary, "at": time.time()}).encode("utf-8"))
+            return summary
+        finally:
+            self.updating = False
+
+    def merge(self) -> Optional[Dict]:
+        """Merge the smallest segments beyond MAX_SEGMENTS and rewrite mostly-tombstoned ones
+
+        Returns None when no merge is due. The caller must hold the lock.
+        """
+        self.refresh()
+        snapshot, manifest = self.snapshot, self.read_manifest()
+        if snapshot is None or manifest is None or snapshot.version != manifest["version"]:
+            return None
+        entries = manifest["segments"]
+        live = {entry["name"]: entry["passages"] - len(snapshot.dead[entry["name"]]) for entry in entries}
+        chosen = {entry["name"] for entry in entries
+                  if len(snapshot.dead[entry["name"]]) > entry["passages"] * MERGE_DEAD_RATIO}
+        if len(entries) > MAX_SEGMENTS:
+            smallest = sorted(entries, key=lambda entry: live[entry["name"]])
+            chosen |= {entry["name"] for entry in smallest[:len(entries) - MAX_SEGMENTS + 1]}
+        if not chosen:
+            return None
+
+        started = time.perf_counter()
+        passages = [segment.passage(number) for segment in snapshot.segments if segment.name in chosen
+                    for number in range(len(segment)) if number not in snapshot.dead[segment.name]]
+        name = f"seg-{time.time_ns()}" if passages else None
+        if passages:
+            write_segment(os.path.join(self.directory, name), passages)
+        manifest["segments"] = [entry for entry in entries if entry["name"] not in chosen]
+        if passages:
+            manifest["segments"].append({"name": name, "passages": len(passages), "tombstones": []})
+        for entry in manifest["files"].values():
+            if entry["segment"] in chosen:
+                entry["segment"] = name
+        self.publish(manifest)
+        return {"merged": sorted(chosen), "into": name, "passages": len(passages),
+                "seconds": round(time.perf_counter() - started, 3)}
+
+    def poll(self) -> Optional[Dict]:
+        """One watcher step: pick up changed files and merge; None if another worker is updating"""
+        if not self.try_lock():
+            return None
+        try:
+            summary = self.update()
+            merged = self.merge()
+            if merged is not None:
+                summary["merged"] = merged
+            self.last_error = None
+            return summary
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self.unlock()
+
+    def ensure(self) -> bool:
+        """Load the published index, building it first if it is missing or covers other sources
+
+        Only one worker builds; the others wait for its manifest to be published.
+        """
+        while not (self.refresh() and sorted(self.snapshot.sources) == sorted(self.sources)):
+            if self.try_lock():
+                try:
+                    self.update()
+                finally:
+                    self.unlock()
+            else:
+                time.sleep(REFRESH_SECONDS)
+        return True
+
+    def _failed(self, error: Exception):
+        self.last_error = str(error)
+        if self.metrics is not None:
+            self.metrics.increment("rag_index_errors")
+
+    async def watch(self):
+        # A failed first build (unreadable source, corrupt segment, full disk) is retried rather than
+        # ending the task, which would leave the index unloaded and /health/ready at 503 for good
+        while True:
+            try:
+                await asyncio.to_thread(self.ensure)
+                self.last_error = None
+                break
+            except Exception as e:
+                self._failed(e)
+                await asyncio.sleep(self.watch_interval or REFRESH_SECONDS)
+        last_scan = time.monotonic()
+        while True:
+            await asyncio.sleep(REFRESH_SECONDS)
+            try:
+                await asyncio.to_thread(self.refresh)
+                if self.watch_interval and time.monotonic() - last_scan >= self.watch_interval:
+                    last_scan = time.monotonic()
+                    await asyncio.to_thread(self.poll)
+            except Exception as e:
+                self._failed(e)  # The next scan retries
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def search(self, query: str, k: int = RAG_TOP_K) -> List[SearchHit]:
+        snapshot = self.snapshot
+        return snapshot.search(query, k, RAG_RETRIEVER, self.embedder) if snapshot is not None and k > 0 else []
+
+    def freshness(self) -> Dict:
+        """When the sources were last scanned, by whichever worker did it"""
+        stored = self.store.get(RAG_NAMESPACE, "last_scan")
+        last = json.loads(stored) if stored else None
+        lag = time.time() - last["at"] if last else None
+        return {
+            "last_scan": last,
+            "lag_seconds": round(lag, 1) if lag is not None else None,
+            "fresh": lag is not None and (not RAG_MAX_LAG or lag <= RAG_MAX_LAG),
+            "error": self.last_error
+        }
+
+    def stats(self) -> Dict:
+        snapshot = self.snapshot
+        dense = snapshot is not None and snapshot.dense
+        return {
+            "enabled": self.enabled,
+            "ready": snapshot is not None,
+            "updating": self.updating,
+            "version": snapshot.version if snapshot is not None else None,
+            "segments": len(snapshot.segments) if snapshot is not None else 0,
+            "passages": snapshot.passages if snapshot is not None else 0,
+            "tombstoned": snapshot.stored - snapshot.passages if snapshot is not None else 0,
+            "retriever": RAG_RETRIEVER if dense else "bm25",
+            "vectors": sum(len(segment.dense) for segment in snapshot.segments) if dense else 0,
+            "ivf_lists": sum(segment.dense.lists for segment in snapshot.segments) if dense else 0,
+            "updated_at": snapshot.updated_at if snapshot is not None else None,
+            "freshness": self.freshness(),
+            "sources": self.sources
+        }
+
+def format_context(hits: List[SearchHit], max_chars: int = RAG_CONTEXT_CHARS) -> str:
+    """Numbered passages for the prompt, each trimmed to an equal share of max_chars"""
+    if not hits:
+        return ""
+    share = max(max_chars // len(hits), 200)
+    blocks = []
+    for number, hit in enumerate(hits, 1):
+        passage = hit.passage
+        label = f"{passage.file}:{passage.lines}" + (f" ({passage.symbol})" if passage.symbol else "")
+        text = passage.text if len(passage.text) <= share else passage.text[:share].rstrip() + " …"
+        blocks.append(f"[{number}] {label}\n{text}")
+    return "\n\n".join(blocks)
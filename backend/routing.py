@@ -0,0 +1,111 @@
+"""
+Model Routing - Pick a model tier per request and steer away from degraded tiers
+
+Tiers are tried cheapest first: short concept questions and small snippets
+for beginners go to the fast tier, everything else to the standard tier. Each
+worker keeps a rolling latency/error profile per tier; a tier whose recent
+error rate or median latency crosses its limits is skipped until those calls
+age out of the profile window.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from statistics import median
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_TIERS = {
+    "fast": {"model": "gpt-4o-mini", "max_tokens": 1500, "latency_slo": 15.0},
+    "standard": {"model": "gpt-4o", "max_tokens": 4000, "latency_slo": 45.0},
+}
+# Ordered cheapest first; override with a JSON object of the same shape
+MODEL_TIERS = json.loads(os.getenv("DOCUGENIUS_MODEL_TIERS", "null")) or DEFAULT_TIERS
+# Inputs up to this many characters count as small
+SMALL_INPUT_CHARS = int(os.getenv("DOCUGENIUS_SMALL_INPUT_CHARS", "600"))
+FAST_AUDIENCES = {"beginner", "intermediate"}
+# Rolling profile: the last PROFILE_SIZE calls within PROFILE_SECONDS
+PROFILE_SIZE = 50
+PROFILE_SECONDS = 300.0
+MIN_SAMPLES = 5
+MAX_ERROR_RATE = 0.5
+
+class TierChoice(NamedTuple):
+    tier: str
+    model: str
+    max_tokens: int
+    reason: str
+
+    def to_dict(self) -> Dict:
+        return {"tier": self.tier, "model": self.model, "reason": self.reason}
+
+class ModelRouter:
+    """Chooses a tier from request features and per-tier health"""
+
+    def __init__(self, tiers: Optional[Dict[str, Dict]] = None):
+        self.tiers = tiers or MODEL_TIERS
+        self.names: List[str] = list(self.tiers)
+        self._calls = {name: deque(maxlen=PROFILE_SIZE) for name in self.names}
+        self._lock = threading.Lock()
+
+    def preferred_tier(self, mode: str, audience: str, query_chars: int, language: str) -> Tuple[str, str]:
+        """Tier for a healthy system, with the rule that selected it"""
+        if query_chars <= SMALL_INPUT_CHARS and audience in FAST_AUDIENCES:
+            if mode == "explain_concept" or language == "text":
+                return self.names[0], "short question"
+            return self.names[0], f"small {language} snippet"
+        if query_chars > SMALL_INPUT_CHARS:
+            return self.names[-1], "large input"
+        return self.names[-1], f"{audience} audience"
+
+    def choose(self, mode: str, audience: str, query_chars: int, language: str,
+               forced: Optional[str] = None) -> TierChoice:
+        if forced in self.tiers:
+            tier, reason = forced, "requested"
+        else:
+            tier, reason = self.preferred_tier(mode, audience, query_chars, language)
+            if not self.healthy(tier):
+                # Closest healthy tier, preferring the more capable direction
+                index = self.names.index(tier)
+                candidates = sorted(self.names, key=lambda name: (abs(self.names.index(name) - index),
+                                                                  -self.names.index(name)))
+                healthy = next((name for name in candidates if self.healthy(name)), None)
+                if healthy is not None and healthy != tier:
+                    tier, reason = healthy, f"{reason}; {tier} tier degraded"
+        config = self.tiers[tier]
+        return TierChoice(tier, config["model"], int(config["max_tokens"]), reason)
+
+    def record(self, tier: str, latency: float, ok: bool):
+        with self._lock:
+            self._calls[tier].append((time.monotonic(), latency, ok))
+
+    def _recent(self, tier: str) -> List:
+        cutoff = time.monotonic() - PROFILE_SECONDS
+        with self._lock:
+            return [call for call in self._calls[tier] if call[0] >= cutoff]
+
+    def profile(self, tier: str) -> Dict:
+        calls = self._recent(tier)
+        if not calls:
+            return {"calls": 0, "error_rate": 0.0, "median_latency": None, "healthy": True}
+        errors = sum(1 for _, _, ok in calls if not ok)
+        latencies = [latency for _, latency, ok in calls if ok]
+        error_rate = errors / len(calls)
+        median_latency = median(latencies) if latencies else None
+        degraded = len(calls) >= MIN_SAMPLES and (
+            error_rate > MAX_ERROR_RATE
+            or (median_latency is not None and median_latency > self.tiers[tier].get("latency_slo", float("inf")))
+        )
+        return {
+            "calls": len(calls),
+            "error_rate": round(error_rate, 3),
+            "median_latency": round(median_latency, 3) if median_latency is not None else None,
+            "healthy": not degraded
+        }
+
+    def healthy(self, tier: str) -> bool:
+        return self.profile(tier)["healthy"]
+
+    def snapshot(self) -> Dict:
+        return {name: {**self.tiers[name], **self.profile(name)} for name in self.names}
@@ -0,0 +1,152 @@
+"""
+Conversation Sessions - Server-side state for follow-up questions over a WebSocket
+
+A session keeps the analyzed code context (system prompt, code, static
+analysis and retrieved passages) once, the recent turns verbatim and a
+rolling summary of older ones. Every follow-up is sent as the same stable
+prefix (the system prompt, then the context message), followed by the
+summary and the recent turns. That way the provider's prompt cache covers the
+prefix, and the client never re-sends the snippet nor has the server
+re-analyze it. Once the turns pass SESSION_COMPACT_TOKENS, the oldest ones
+are folded into the summary by a cheap model call after the reply has been
+streamed.
+
+Sessions live in the shared store, so a client that reconnects to another
+worker resumes where it left off.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from compaction import CHARS_PER_TOKEN
+from shared_store import SharedStore
+
+# Idle seconds before a session is forgotten
+SESSION_TTL = float(os.getenv("DOCUGENIUS_SESSION_TTL", "3600"))
+# Estimated tokens of summary plus verbatim turns above which older turns are summarized
+SESSION_COMPACT_TOKENS = int(os.getenv("DOCUGENIUS_SESSION_COMPACT_TOKENS", "3000"))
+# Most recent question/answer pairs always kept verbatim
+SESSION_KEEP_TURNS = int(os.getenv("DOCUGENIUS_SESSION_KEEP_TURNS", "2"))
+SUMMARY_MAX_TOKENS = 400
+SESSION_NAMESPACE = "sessions"
+
+SUMMARY_INSTRUCTIONS = """You maintain the running summary of a conversation about a piece of code.
+Merge the previous summary and the new exchanges into one summary of at most 200 words.
+Keep every question the user asked, the conclusions given, and any line numbers, names and
+decisions that later questions may refer to. Reply with the summary only."""
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class Session:
+    """One conversation: fixed context, rolling summary and recent messages"""
+
+    def __init__(self, session_id: str, mode: str, audience: str, language: str,
+                 system_prompt: str, context: str, sources: Optional[List[Dict]] = None,
+                 summary: str = "", messages: Optional[List[Dict]] = None, summarized: int = 0,
+                 turns: int = 0, created_at: Optional[float] = None):
+        self.session_id = session_id
+        self.mode = mode
+        self.audience = audience
+        self.language = language
+        self.system_prompt = system_prompt
+        # First user message: the code with its analysis and retrieved passages
+        self.context = context
+        self.sources = sources or []
+        self.summary = summary
+        # Messages after the context, oldest first; starts with the answer to the context
+        self.messages = messages or []
+        self.summarized = summarized
+        self.turns = turns
+        self.created_at = created_at or time.time()
+
+    @classmethod
+    def create(cls, mode: str, audience: str, language: str, system_prompt: str, context: str,
+               sources: Optional[List[Dict]] = None) -> "Session":
+        return cls(uuid.uuid4().hex, mode, audience, language, system_prompt, context, sources)
+
+    def prompt(self, question: Optional[str] = None) -> List[Dict]:
+        """Chat messages for the next reply; the first turn answers the context itself"""
+        messages = [{"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": self.context}]
+        if self.summary:
+            messages.append({"role": "system",
+                             "content": f"Summary of the earlier conversation about this code:\n{self.summary}"})
+        messages.extend(self.messages)
+        if question is not None:
+            messages.append({"role": "user", "content": question})
+        return messages
+
+    def add_turn(self, question: Optional[str], answer: str):
+        if question is not None:
+            self.messages.append({"role": "user", "content": question})
+        self.messages.append({"role": "assistant", "content": answer})
+        self.turns += 1
+
+    def context_tokens(self) -> int:
+        return estimate_tokens(self.system_prompt) + estimate_tokens(self.context)
+
+    def history_tokens(self) -> int:
+        """Estimated tokens of everything after the context"""
+        return estimate_tokens(self.summary) + sum(estimate_tokens(m["content"]) for m in self.messages)
+
+    def fold_point(self, keep_turns: int = SESSION_KEEP_TURNS) -> int:
+        """Number of leading messages to summarize so the rest starts at one of the last keep_turns questions"""
+        questions = [index for index, message in enumerate(self.messages) if message["role"] == "user"]
+        if keep_turns <= 0:
+            return len(self.messages)
+        return questions[-keep_turns] if len(questions) >= keep_turns else 0
+
+    def needs_compaction(self, threshold: int = SESSION_COMPACT_TOKENS) -> bool:
+        return self.history_tokens() > threshold and self.fold_point() > 0
+
+    def summary_prompt(self, upto: int) -> List[Dict]:
+        """Messages asking a model to fold messages[:upto] into the summary"""
+        exchanges = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in self.messages[:upto])
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": f"Previous summary:\n{self.summary or '(none)'}\n\nNew exchanges:\n{exchanges}"}
+        ]
+
+    def apply_summary(self, summary: str, upto: int):
+        self.summary = summary.strip()
+        self.messages = self.messages[upto:]
+        self.summarized += upto
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id, "mode": self.mode, "audience": self.audience,
+            "language": self.language, "system_prompt": self.system_prompt, "context": self.context,
+            "sources": self.sources, "summary": self.summary, "messages": self.messages,
+            "summarized": self.summarized, "turns": self.turns, "created_at": self.created_at
+        }
+
+    def describe(self) -> Dict:
+        """Client-facing state, without the prompts"""
+        return {
+            "session_id": self.session_id, "mode": self.mode, "audience": self.audience,
+            "language": self.language, "turns": self.turns, "sources": self.sources,
+            "summarized_messages": self.summarized, "context_tokens": self.context_tokens(),
+            "history_tokens": self.history_tokens()
+        }
+
+class SessionStore:
+    """Sessions in the shared store, expiring after SESSION_TTL idle seconds"""
+
+    def __init__(self, store: SharedStore, ttl: float = SESSION_TTL):
+        self.store = store
+        self.ttl = ttl
+
+    def get(self, session_id: str) -> Optional[Session]:
+        stored = self.store.get(SESSION_NAMESPACE, session_id)
+        return Session(**json.loads(stored)) if stored is not None else None
+
+    def save(self, session: Session):
+        self.store.set(SESSION_NAMESPACE, session.session_id,
+                       json.dumps(session.to_dict()).encode("utf-8"), ttl=self.ttl)
+
+    def delete(self, session_id: str):
+        self.store.delete(SESSION_NAMESPACE, session_id)
@@ -0,0 +1,175 @@
+"""
+Shared Store - Cross-process cache entries, counters and rate-limit windows
+
+Backed by a local SQLite database in WAL mode, so every uvicorn worker on the
+host sees the same cache, metrics and rate-limit state. Readers never block
+writers in WAL mode, and each thread keeps its own connection. Every call can
+wait up to 10 seconds on another process's write lock, so async code makes
+them in a thread (asyncio.to_thread), never on the event loop.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+SHARED_STORE_PATH = os.getenv(
+    "DOCUGENIUS_SHARED_STORE",
+    os.path.join(tempfile.gettempdir(), "docugenius_shared.sqlite3")
+)
+RATE_LIMIT_PREFIX = "ratelimit:"
+BUDGET_PREFIX = "budget:"
+# Windowed counters are bookkeeping, not metrics
+WINDOW_PREFIXES = (RATE_LIMIT_PREFIX, BUDGET_PREFIX)
+
+def like_prefix(prefix: str) -> str:
+    """LIKE pattern (with ESCAPE '\\') matching names that start with prefix literally"""
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+class SharedStore:
+    """Key/value entries with optional expiry, plus atomic counters"""
+
+    def __init__(self, path: str = SHARED_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        connection = self.connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS kv_updated ON kv (namespace, updated_at);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            );
+        """)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit; every statement below is a single atomic write
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # Key/value entries
+
+    def get_entry(self, namespace: str, key: str) -> Optional[Tuple[bytes, float, Optional[float]]]:
+        """(value, updated_at, expires_at) for a key, including expired entries"""
+        return self.connection().execute(
+            "SELECT value, updated_at, expires_at FROM kv WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        entry = self.get_entry(namespace, key)
+        if entry is None:
+            return None
+        value, _, expires_at = entry
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return value
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        now = time.time()
+        self.connection().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, value, now, now + ttl if ttl is not None else None)
+        )
+
+    def delete(self, namespace: str, key: str):
+        self.connection().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def acquire(self, namespace: str, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew a lease held in key; True when owner holds it afterwards"""
+        now = time.time()
+        self.connection().execute(
+            """INSERT INTO kv (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(namespace, key) DO UPDATE SET
+                   value = excluded.value, updated_at = excluded.updated_at, expires_at = excluded.expires_at
+               WHERE kv.value = excluded.value OR kv.expires_at < excluded.updated_at""",
+            (namespace, key, owner.encode("utf-8"), now, now + ttl)
+        )
+        return self.get(namespace, key) == owner.encode("utf-8")
+
+    def prune(self, namespace: str, max_entries: int):
+        """Drop the least recently written entries beyond max_entries"""
+        self.connection().execute(
+            """DELETE FROM kv WHERE namespace = ? AND key IN (
+                   SELECT key FROM kv WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+               )""",
+            (namespace, namespace, max_entries)
+        )
+
+    # Counters
+
+    def increment(self, name: str, value: float = 1) -> float:
+        rows = self.connection().execute(
+            """INSERT INTO counters (name, value) VALUES (?, ?)
+               ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+               RETURNING value""",
+            (name, value)
+        ).fetchall()
+        return rows[0][0]
+
+    def increment_many(self, values: Dict[str, float]):
+        """Add to several counters in a single transaction"""
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                """INSERT INTO counters (name, value) VALUES (?, ?)
+                   ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""",
+                list(values.items())
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def counter(self, name: str) -> float:
+        row = self.connection().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def counters(self) -> Dict[str, float]:
+        excluded = " AND ".join("name NOT LIKE ? ESCAPE '\\'" for _ in WINDOW_PREFIXES)
+        rows = self.connection().execute(
+            f"SELECT name, value FROM counters WHERE {excluded} ORDER BY name",
+            tuple(like_prefix(prefix) for prefix in WINDOW_PREFIXES)
+        )
+        return dict(rows.fetchall())
+
+    def reset_counters(self):
+        self.connection().execute("DELETE FROM counters")
+
+    # Fixed-window counters (rate limits, token budgets)
+
+    def add_to_window(self, prefix: str, key: str, value: float = 1, window_seconds: float = 60) -> float:
+        """Add value to key's counter for the current fixed window and return the window total"""
+        window = int(time.time() // window_seconds)
+        count = self.increment(f"{prefix}{key}:{window}", value)
+        if count == value:
+            # First write of a new window: clear this key's older windows (and only this key's:
+            # "%" and "_" in a key must not match other keys)
+            self.connection().execute(
+                "DELETE FROM counters WHERE name LIKE ? ESCAPE '\\' AND name != ?",
+                (like_prefix(f"{prefix}{key}:"), f"{prefix}{key}:{window}")
+            )
+        return count
+
+    def window_total(self, prefix: str, key: str, window_seconds: float = 60) -> float:
+        """Current fixed-window total for key (a single primary-key lookup)"""
+        return self.counter(f"{prefix}{key}:{int(time.time() // window_seconds)}")
+
+    def hit_window(self, key: str, window_seconds: float = 60) -> int:
+        """Count a hit in the current fixed window for key and return the window total"""
+        return int(self.add_to_window(RATE_LIMIT_PREFIX, key, 1, window_seconds))
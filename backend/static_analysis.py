@@ -0,0 +1,211 @@
+"""
+Static Analysis - Deterministic facts about submitted Python code
+
+Computed locally with ``ast`` so the model only has to write the narrative:
+function/class inventory, call graph, loop nesting, cyclomatic complexity and
+a time-complexity hint. The hint only counts loop nesting and self-calls, so
+it is passed on as a starting point for the model's own complexity analysis,
+never as a result.
+"""
+
+import ast
+from typing import Dict, List, Optional
+
+# Nodes that add a decision point to cyclomatic complexity
+_BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler, ast.Assert) + (
+    (ast.match_case,) if hasattr(ast, "match_case") else ()
+)
+_LOOP_NODES = (ast.For, ast.AsyncFor, ast.While)
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+# Decorators that cache results, turning branching recursion into one call per distinct argument
+_MEMOIZERS = {"cache", "lru_cache", "cached"}
+
+def _call_name(node: ast.Call) -> Optional[str]:
+    func = node.func
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+def _walk_scope(node: ast.AST):
+    """Yield descendants of node without entering nested functions or classes"""
+    for child in ast.iter_child_nodes(node):
+        yield child
+        if not isinstance(child, _SCOPE_NODES):
+            yield from _walk_scope(child)
+
+def _constant_bound(loop: ast.AST) -> bool:
+    """True for ``for ... in range(<literals>)`` and loops over literal sequences"""
+    if not isinstance(loop, (ast.For, ast.AsyncFor, ast.comprehension)):
+        return False
+    bound = loop.iter
+    if isinstance(bound, ast.Call) and _call_name(bound) == "range":
+        return all(isinstance(arg, ast.Constant) for arg in bound.args)
+    return isinstance(bound, (ast.Tuple, ast.List, ast.Set)) and all(
+        isinstance(element, ast.Constant) for element in bound.elts)
+
+def _loop_depth(node: ast.AST, depth: int = 0, scaling_only: bool = False) -> int:
+    """Deepest loop nesting; with scaling_only, loops with a constant bound are not counted"""
+    deepest = depth
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, _SCOPE_NODES):
+            continue
+        if isinstance(child, _LOOP_NODES):
+            step = 0 if scaling_only and _constant_bound(child) else 1
+            deepest = max(deepest, _loop_depth(child, depth + step, scaling_only))
+        elif isinstance(child, _COMPREHENSIONS):
+            generators = [g for g in child.generators if not (scaling_only and _constant_bound(g))]
+            deepest = max(deepest, _loop_depth(child, depth + len(generators), scaling_only))
+        else:
+            deepest = max(deepest, _loop_depth(child, depth, scaling_only))
+    return deepest
+
+def _memoized(node) -> bool:
+    for decorator in node.decorator_list:
+        target = decorator.func if isinstance(decorator, ast.Call) else decorator
+        name = target.id if isinstance(target, ast.Name) else getattr(target, "attr", None)
+        if name in _MEMOIZERS:
+            return True
+    return False
+
+def _cyclomatic_complexity(node: ast.AST) -> int:
+    complexity = 1
+    for child in _walk_scope(node):
+        if isinstance(child, _BRANCH_NODES):
+            complexity += 1
+        elif isinstance(child, ast.BoolOp):
+            complexity += len(child.values) - 1
+        elif isinstance(child, ast.comprehension):
+            complexity += 1 + len(child.ifs)
+    return complexity
+
+def _estimate_time_complexity(loop_depth: int, self_calls: int, memoized: bool = False) -> str:
+    """Rough bound from loop nesting and self-calls; blind to data-dependent bounds and callee cost"""
+    if self_calls >= 2 and not memoized:
+        return "O(2^n) (branching recursion)"
+    if self_calls >= 1 and memoized:
+        return "O(n) calls (memoized recursion)"
+    if self_calls == 1:
+        return "O(n) (linear recursion)" if loop_depth == 0 else f"O(n^{loop_depth + 1}) (recursion with loops)"
+    if loop_depth == 0:
+        return "O(1)"
+    if loop_depth == 1:
+        return "O(n)"
+    return f"O(n^{loop_depth})"
+
+def _analyze_function(node, qualified_name: str) -> Dict:
+    calls = []
+    for child in _walk_scope(node):
+        if isinstance(child, ast.Call):
+            name = _call_name(child)
+            if name and name not in calls:
+                calls.append(name)
+    self_calls = sum(
+        1 for child in _walk_scope(node)
+        if isinstance(child, ast.Call) and _call_name(child) == node.name
+    )
+    loop_depth = _loop_depth(node)
+    scaling_depth = _loop_depth(node, scaling_only=True)
+    return {
+        "name": qualified_name,
+        "lines": f"{node.lineno}-{getattr(node, 'end_lineno', node.lineno)}",
+        "args": [arg.arg for arg in node.args.posonlyargs + node.args.args + node.args.kwonlyargs],
+        "is_async": isinstance(node, ast.AsyncFunctionDef),
+        "calls": calls,
+        "recursive": self_calls > 0,
+        "loop_depth": loop_depth,
+        "cyclomatic_complexity": _cyclomatic_complexity(node),
+        "time_complexity": _estimate_time_complexity(scaling_depth, self_calls, _memoized(node))
+    }
+
+def analyze_python(source: str) -> Optional[Dict]:
+    """Static facts about a Python snippet, or None when it does not parse"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    functions = []
+    classes = []
+    imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append(_analyze_function(node, node.name))
+        elif isinstance(node, ast.ClassDef):
+            methods = [child for child in node.body if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            classes.append({
+                "name": node.name,
+                "lines": f"{node.lineno}-{getattr(node, 'end_lineno', node.lineno)}",
+                "bases": [ast.unparse(base) for base in node.bases],
+                "methods": [method.name for method in methods]
+            })
+            functions.extend(_analyze_function(method, f"{node.name}.{method.name}") for method in methods)
+        elif isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append(node.module or ".")
+
+    defined = {function["name"].rsplit(".", 1)[-1] for function in functions}
+    call_graph = {
+        function["name"]: [name for name in function["calls"] if name in defined]
+        for function in functions
+    }
+
+    return {
+        "language": "python",
+        "lines_of_code": len([line for line in source.splitlines() if line.strip()]),
+        "imports": imports,
+        "classes": classes,
+        "functions": functions,
+        "call_graph": call_graph,
+        "max_loop_depth": max([_loop_depth(tree)] + [function["loop_depth"] for function in functions]),
+        "cyclomatic_complexity": _cyclomatic_complexity(tree) + sum(
+            function["cyclomatic_complexity"] - 1 for function in functions
+        )
+    }
+
+def format_code_analysis(analysis: Dict) -> List[str]:
+    """Deterministic code_analysis entries for the response"""
+    entries = [
+        f"Static analysis: {analysis['lines_of_code']} lines of code, "
+        f"{len(analysis['functions'])} functions, {len(analysis['classes'])} classes, "
+        f"total cyclomatic complexity {analysis['cyclomatic_complexity']}, "
+        f"max loop nesting {analysis['max_loop_depth']}"
+    ]
+    if analysis["imports"]:
+        entries.append("Imports: " + ", ".join(analysis["imports"]))
+    for cls in analysis["classes"]:
+        bases = f"({', '.join(cls['bases'])})" if cls["bases"] else ""
+        entries.append(f"class {cls['name']}{bases} (lines {cls['lines']}): methods {', '.join(cls['methods']) or 'none'}")
+    for function in analysis["functions"]:
+        calls = ", ".join(function["calls"]) or "nothing"
+        entries.append(
+            f"{'async ' if function['is_async'] else ''}def {function['name']}({', '.join(function['args'])}) "
+            f"(lines {function['lines']}): cyclomatic complexity {function['cyclomatic_complexity']}, "
+            f"loop nesting {function['loop_depth']}, "
+            f"{'recursive, ' if function['recursive'] else ''}"
+            f"time hint {function['time_complexity']} (heuristic); calls {calls}"
+        )
+    return entries
+
+def summarize_for_prompt(analysis: Dict, include_lines: bool = True) -> str:
+    """Compact, token-cheap summary of the analysis for the user prompt"""
+    lines = [
+        f"loc={analysis['lines_of_code']} cc={analysis['cyclomatic_complexity']} "
+        f"max_loop_depth={analysis['max_loop_depth']}"
+    ]
+    if analysis["imports"]:
+        lines.append("imports: " + ", ".join(analysis["imports"]))
+    for cls in analysis["classes"]:
+        lines.append(f"class {cls['name']}" + (f" L{cls['lines']}" if include_lines else ""))
+    for function in analysis["functions"]:
+        callees = analysis["call_graph"].get(function["name"])
+        lines.append(
+            f"def {function['name']}({', '.join(function['args'])}) "
+            + (f"L{function['lines']} " if include_lines else "")
+            + f"cc={function['cyclomatic_complexity']} time_hint={function['time_complexity']}"
+            + (f" -> {', '.join(callees)}" if callees else "")
+        )
+    return "\n".join(lines)
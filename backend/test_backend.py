@@ -0,0 +1,1200 @@
+#!/usr/bin/env python3
+"""
+Test script for DocuGenius backend helpers
+Run this to verify the local (non-LLM) processing stages work correctly
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import zipfile
+
+# The app tests import main, which opens the shared store; keep them away from the real one
+os.environ.setdefault("DOCUGENIUS_SHARED_STORE", os.path.join(tempfile.mkdtemp(), "test.sqlite3"))
+os.environ.setdefault("DOCUGENIUS_PREWARM", "false")
+os.environ.setdefault("DOCUGENIUS_RAG_SOURCES", "")
+# Keys the app tests send; any other X-API-Key is billed to the client address
+os.environ.setdefault("DOCUGENIUS_API_KEYS", json.dumps(
+    ["usage-fallback", "walks-away", "repo-owner", "uploader", "spent-uploader"]))
+
+from static_analysis import analyze_python, format_code_analysis, summarize_for_prompt
+from compaction import compact_code, remap_line_references
+from shared_store import RATE_LIMIT_PREFIX, SharedStore
+from metrics import Metrics
+from encoding import CompressionMiddleware, compress, etag_matches, negotiate_encoding
+from usage import UsageLedger, tenant_id
+from routing import ModelRouter
+from prewarm import Prewarmer
+from repo_docs import RepositoryDocumenter, collect_units
+from retrieval import IndexSnapshot, RAGEngine, format_context, tokenize
+from vectors import HashingEmbedder, VectorIndex, write_vectors
+from sessions import Session, SessionStore
+from tracing import Tracer, end_span, span, start_span
+from profiling import ProfilerBusy, SamplingProfiler, token_valid
+import uploads
+from uploads import UploadTooLarge, receive_upload
+from cassettes import CassetteMiss, RecordingClient, ReplayClient, _assemble, _split, request_key
+from language_detection import detect_language
+from examples import EXAMPLES
+from exporters import PDFExporter, render_pdf, stream_zip
+
+def check(label, condition):
+    """Print one check; tests collect them and assert all(results) so every check is reported"""
+    print(f"{'✅' if condition else '❌'} {label}")
+    return condition
+
+def test_language_detection():
+    """Test that short everyday snippets are recognized as code, and prose is not"""
+    print("\n🔍 Testing language detection...")
+    streamlit_example = next(example["prompt"] for example in EXAMPLES if example["title"] == "Streamlit Code")
+    cases = [
+        ("import numpy as np\nnp.zeros(3)", "python"),
+        ("for i in range(10):\n    print(i)", "python"),
+        (streamlit_example, "python"),
+        ("function greet() {\n    console.log('hi');\n}", "javascript"),
+        ("For each item in the list:\nwith the following steps, print the result.", "text"),
+        ("What are React hooks and why are they useful?", "text"),
+    ]
+    results = [check(f"{snippet.splitlines()[0][:30]!r} -> {expected}", detect_language(snippet) == expected)
+               for snippet, expected in cases]
+    assert all(results)
+
+def test_static_analysis():
+    """Test the local Python pre-analysis"""
+    print("\n🔍 Testing static analysis...")
+
+    source = (
+        "def fibonacci(n):\n"
+        "    if n <= 1:\n"
+        "        return n\n"
+        "    return fibonacci(n-1) + fibonacci(n-2)\n"
+        "\n"
+        "class Grid:\n"
+        "    def cells(self, rows):\n"
+        "        return [(r, c) for r in rows for c in rows if r != c]\n"
+        "\n"
+        "@functools.lru_cache(maxsize=None)\n"
+        "def ways(n):\n"
+        "    return 1 if n < 2 else ways(n - 1) + ways(n - 2)\n"
+        "\n"
+        "def board():\n"
+        "    for row in range(8):\n"
+        "        for col in range(8):\n"
+        "            print(row, col)\n"
+    )
+    analysis = analyze_python(source)
+    functions = {function["name"]: function for function in analysis["functions"]}
+
+    results = [
+        check("functions and methods inventoried", set(functions) == {"fibonacci", "Grid.cells", "ways", "board"}),
+        check("branching recursion hinted", functions["fibonacci"]["time_complexity"].startswith("O(2^n)")),
+        check("memoized recursion is not exponential", not functions["ways"]["time_complexity"].startswith("O(2^n)")),
+        check("constant-bound loops do not scale", functions["board"]["loop_depth"] == 2
+              and functions["board"]["time_complexity"] == "O(1)"),
+        check("hint labelled in the prompt summary", "time_hint=" in summarize_for_prompt(analysis)),
+        check("comprehension loop nesting", functions["Grid.cells"]["loop_depth"] == 2),
+        check("cyclomatic complexity", functions["fibonacci"]["cyclomatic_complexity"] == 2),
+        check("call graph", analysis["call_graph"]["fibonacci"] == ["fibonacci"]),
+        check("code_analysis entries", len(format_code_analysis(analysis)) == 6),
+        check("prose is not analyzed", analyze_python("What is a closure?") is None),
+    ]
+    assert all(results)
+
+def test_compaction():
+    """Test prompt compaction and the line-number map"""
+    print("\n🔍 Testing prompt compaction...")
+
+    source = (
+        "# Copyright (c) Example Corp.\n"
+        "# Licensed under the MIT License\n"
+        "\n"
+        "\n"
+        "def greet(name):  # say hello\n"
+        "    return \"# not a comment \" + name   \n"
+    )
+    compaction = compact_code(source, "python")
+    javascript = compact_code("/* header */\nconst url = 'http://x//y'; // note\n", "javascript")
+
+    results = [
+        check("comments and license header removed", "#" not in compaction.text.replace("\"# not", "")),
+        check("string contents preserved", "\"# not a comment \"" in compaction.text),
+        check("line map points at original lines", compaction.line_map == [5, 6]),
+        check("line references remapped", remap_line_references("See line 2.", compaction.line_map) == "See line 6."),
+        check("savings reported", compaction.stats()["chars_saved"] > 0),
+        check("C-like comments removed, strings kept", javascript.text == "const url = 'http://x//y';"),
+        check("unknown languages left alone", compact_code("SELECT 1 -- note", "text") is None),
+    ]
+    assert all(results)
+
+def test_shared_store():
+    """Test cache entries, leases, window counters and batched metrics in the shared store"""
+    print("\n🔍 Testing shared store...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = SharedStore(os.path.join(directory, "store.sqlite3"))
+        store.set("ask", "fresh", b"answer", ttl=60)
+        store.set("ask", "expired", b"old", ttl=-1)
+        other_worker = SharedStore(store.path)
+        leased = store.acquire("lease", "job", "a", ttl=60)
+        taken = other_worker.acquire("lease", "job", "b", ttl=60)
+
+        # A key containing LIKE wildcards must not clear other keys' windows
+        store.add_to_window(RATE_LIMIT_PREFIX, "10.0.0.1", 3, window_seconds=3600)
+        store.increment(f"{RATE_LIMIT_PREFIX}a_b:1")
+        store.add_to_window(RATE_LIMIT_PREFIX, "%", 1, window_seconds=3600)
+        store.add_to_window(RATE_LIMIT_PREFIX, "a%", 1, window_seconds=3600)
+        hits = [other_worker.hit_window("10.0.0.2", window_seconds=3600) for _ in range(3)]
+        window_counters_hidden = store.counters() == {}
+
+        metrics = Metrics(store)
+        metrics.increment("cache_hits")
+        metrics.increment("cache_hits", 2)
+        before_flush = store.counter("cache_hits")
+        visible = metrics.get("cache_hits")
+        metrics.flush()
+        results = [
+            check("fresh entry read by another connection", other_worker.get("ask", "fresh") == b"answer"),
+            check("expired entry hidden from get, kept by get_entry",
+                  store.get("ask", "expired") is None and store.get_entry("ask", "expired") is not None),
+            check("lease held by one owner at a time", leased and not taken),
+            check("window totals per key", store.window_total(RATE_LIMIT_PREFIX, "10.0.0.1", 3600) == 3
+                  and hits == [1, 2, 3]),
+            check("wildcards in keys are escaped", store.counter(f"{RATE_LIMIT_PREFIX}a_b:1") == 1),
+            check("window counters hidden from metrics", window_counters_hidden),
+            check("metrics buffered until flushed", before_flush == 0 and visible == 3
+                  and store.counter("cache_hits") == 3 and metrics.snapshot()["counters"] == {"cache_hits": 3}),
+        ]
+    assert all(results)
+
+def test_usage_ledger():
+    """Test token accounting and budget windows"""
+    print("\n🔍 Testing usage ledger...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SharedStore(os.path.join(directory, "store.sqlite3"))
+        ledger = UsageLedger(store, default_budget=1000, budgets={"ip:batch": 0}, warn_ratio=0.5)
+        usage = types.SimpleNamespace(prompt_tokens=300, completion_tokens=200, total_tokens=500)
+        keys = ["secret-key"]
+        tenant = tenant_id("secret-key", "10.0.0.1", keys)
+
+        fresh = ledger.check(tenant)
+        ledger.record(tenant, usage, "gpt-4o", "explain_code", "beginner", "python")
+        warned = ledger.check(tenant)
+        ledger.record(tenant, usage, "gpt-4o", "explain_concept", "beginner", "text")
+        ledger.record("ip:batch", usage, "gpt-4o", "explain_code", "expert", "python")
+
+        results = [
+            check("API keys are not stored in clear", tenant.startswith("key:") and "secret" not in tenant),
+            check("unknown and missing keys billed to the client address",
+                  tenant_id("made-up-key", "10.0.0.1", keys) == tenant_id(None, "10.0.0.1", keys) == "ip:10.0.0.1"),
+            check("mapped keys named after their tenant", tenant_id("secret-key", None, {"secret-key": "team-a"})
+                  == "key:team-a"),
+            check("fresh tenant is within budget", not fresh.warning and not fresh.exceeded),
+            check("soft warning at the warn ratio", warned.warning and not warned.exceeded),
+            check("hard cut-off at the budget", ledger.check(tenant).exceeded),
+            check("per-tenant override (0 = unlimited)", not ledger.check("ip:batch").exceeded),
+            check("ledger grouped by tenant", ledger.summary()[0] == {
+                "tenant": tenant, "requests": 2, "prompt_tokens": 600, "completion_tokens": 400, "total_tokens": 1000}),
+            check("ledger grouped by mode", len(ledger.summary("mode")) == 2),
+            check("budget counters hidden from metrics", store.counters() == {}),
+        ]
+    assert all(results)
+
+def test_model_router():
+    """Test tier selection and failover away from a degraded tier"""
+    print("\n🔍 Testing model routing...")
+
+    router = ModelRouter()
+    short = router.choose("explain_concept", "beginner", 40, "text")
+    large = router.choose("explain_code", "beginner", 5000, "python")
+    expert = router.choose("explain_code", "expert", 200, "python")
+    forced = router.choose("explain_concept", "beginner", 40, "text", forced="standard")
+    for _ in range(5):
+        router.record("fast", 1.0, ok=False)
+    failover = router.choose("explain_concept", "beginner", 40, "text")
+
+    results = [
+        check("short beginner question uses the fast tier", short.tier == "fast"),
+        check("large input uses the standard tier", large.tier == "standard"),
+        check("expert audience uses the standard tier", expert.tier == "standard"),
+        check("explicit tier is honored", forced.tier == "standard" and forced.reason == "requested"),
+        check("degraded tier is avoided", failover.tier == "standard" and "degraded" in failover.reason),
+        check("profile reports the error rate", router.snapshot()["fast"]["error_rate"] == 1.0),
+    ]
+    assert all(results)
+
+def test_prewarmer():
+    """Test that prewarming fills missing entries, skips warm ones and reports progress"""
+    print("\n🔍 Testing cache prewarming...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SharedStore(os.path.join(directory, "store.sqlite3"))
+        warmed = {"closure"}
+
+        async def warm(query):
+            if query == "broken":
+                raise RuntimeError("upstream error")
+            warmed.add(query)
+
+        prewarmer = Prewarmer(store, lambda: ["closure", "monad", "broken"], lambda query: query in warmed,
+                              warm, interval=0, pause=0)
+        other = Prewarmer(store, lambda: [], lambda query: True, warm)
+        store.acquire("prewarm", "lease", other.owner, 60)
+        blocked = asyncio.run(prewarmer.run_round())
+        store.delete("prewarm", "lease")
+        progress = asyncio.run(prewarmer.run_round())
+
+        results = [
+            check("one worker prewarms at a time", blocked is None),
+            check("missing entries are warmed", "monad" in warmed and progress["completed"] == 1),
+            check("warm entries are skipped", progress["skipped"] == 1),
+            check("failures are counted", progress["failed"] == 1),
+            check("progress is shared", other.progress()["state"] == "done"),
+        ]
+    assert all(results)
+
+def test_repo_docs():
+    """Test that repository runs skip unchanged units and drop removed ones"""
+    print("\n🔍 Testing repository documentation...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "src")
+        os.makedirs(os.path.join(source, "node_modules"))
+        with open(os.path.join(source, "shapes.py"), "w") as handle:
+            handle.write("import math\n\ndef area(r):\n    return math.pi * r * r\n\nclass Square:\n    pass\n")
+        with open(os.path.join(source, "node_modules", "vendor.py"), "w") as handle:
+            handle.write("def vendored():\n    return 1\n")
+        explained = []
+
+        async def explain(unit, mode, audience):
+            explained.append(unit.unit_id)
+            return {"explanation": f"About {unit.symbol}", "breakdown": []}
+
+        documenter = RepositoryDocumenter(explain, os.path.join(directory, "out"), concurrency=2)
+        first = asyncio.run(documenter.run(collect_units(source, granularity="symbol")))
+        with open(os.path.join(source, "shapes.py"), "a") as handle:
+            handle.write("\ndef perimeter(r):\n    return 2 * math.pi * r\n")
+        second = asyncio.run(documenter.run(collect_units(source, granularity="symbol")))
+        third = asyncio.run(documenter.run(collect_units(source, granularity="symbol")[:1]))
+        with open(os.path.join(directory, "out", "shapes.py.md")) as handle:
+            page = handle.read()
+
+        results = [
+            check("top-level symbols become units", first["processed"] == 2),
+            check("skipped directories are not walked", not any("vendor" in unit for unit in explained)),
+            check("re-runs only explain changed units", second["reused"] == 2 and second["processed"] == 1),
+            check("removed units leave the manifest", third["removed"] == 2),
+            check("pages are rebuilt from the manifest", "About area" in page and "About Square" not in page),
+        ]
+    assert all(results)
+
+def test_retrieval():
+    """Test BM25 ranking, incremental segment updates, tombstones and merges"""
+    print("\n🔍 Testing retrieval index...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "docs")
+        os.makedirs(source)
+        with open(os.path.join(source, "guide.md"), "w") as handle:
+            handle.write("# Budgets\nSet the token budget per tenant.\n\n# Caching\nAnswers are cached for an hour.\n")
+        with open(os.path.join(source, "limits.py"), "w") as handle:
+            handle.write("def check_budget(tenant):\n    return tenant in BUDGETS\n")
+        store = SharedStore(os.path.join(directory, "store.sqlite3"))
+        index_dir = os.path.join(directory, "index")
+        engine = RAGEngine(store, index_dir, [source])
+        other = RAGEngine(store, index_dir, [source])
+        engine.ensure()
+        hits = engine.search("how long are answers cached?", 2)
+        other.refresh()
+        unchanged = engine.poll()
+
+        with open(os.path.join(source, "limits.py"), "w") as handle:
+            handle.write("def enforce_quota(tenant):\n    return tenant in QUOTAS\n")
+        os.remove(os.path.join(source, "guide.md"))
+        changed = engine.poll()
+        other.refresh()
+        for number in range(9):
+            with open(os.path.join(source, f"note{number}.md"), "w") as handle:
+                handle.write(f"# Note {number}\nRelease note number {number}.\n")
+            engine.poll()
+
+        freshness = other.freshness()
+
+        # The watcher survives a failing first build and retries it
+        flaky = RAGEngine(store, os.path.join(directory, "flaky"), [source], watch_interval=0,
+                          metrics=Metrics(store))
+        build = flaky.update
+        failures = []
+
+        def fail_once(full=False):
+            if not failures:
+                failures.append(True)
+                raise OSError("disk full")
+            return build(full)
+
+        async def watch_through_failure():
+            flaky.update = fail_once
+            flaky.start()
+            deadline = time.time() + 5
+            # Ready is visible before ensure() returns; the error is cleared once it has
+            while (not flaky.ready or flaky.last_error is not None) and time.time() < deadline:
+                await asyncio.sleep(0.05)
+            await flaky.stop()
+
+        asyncio.run(watch_through_failure())
+
+        results = [
+            check("identifiers are split into parts", {"check_budget", "check", "budget"} <= set(tokenize("checkBudget check_budget"))),
+            check("best passage ranks first", hits[0].passage.symbol == "Caching"),
+            check("context cites passages", format_context(hits).startswith("[1] docs/guide.md")),
+            check("unchanged files are not re-indexed", unchanged["passages"] == 0 and other.ready),
+            check("changes go to a new segment", changed["changed"] == 1 and changed["deleted"] == 1
+                  and changed["passages"] == 1),
+            check("dead segments are purged", changed["merged"]["passages"] == 0 and len(other.snapshot.segments) == 1),
+            check("tombstoned passages are not returned", not other.search("check_budget cached", 3)
+                  or all(hit.passage.symbol == "enforce_quota" for hit in other.search("check_budget cached", 3))),
+            check("changed code is searchable", other.search("enforce_quota", 1)[0].passage.symbol == "enforce_quota"),
+            check("segments are merged", len(engine.snapshot.segments) <= 8 and engine.stats()["tombstoned"] == 0),
+            check("freshness is shared", freshness["fresh"] and freshness["last_scan"]["added"] == 1),
+            check("failed build retried by the watcher", flaky.ready and flaky.last_error is None
+                  and flaky.metrics.get("rag_index_errors") == 1),
+        ]
+    assert all(results)
+
+def test_vector_index():
+    """Test hashing embeddings and that IVF search agrees with an exhaustive scan"""
+    print("\n🔍 Testing vector index...")
+
+    embedder = HashingEmbedder(tokenize)
+    texts = ["caching answers for an hour", "answers are cached", "rate limiting per client"]
+    embedded = embedder.embed(texts)
+
+    with tempfile.TemporaryDirectory() as directory:
+        flat_dir, ivf_dir = os.path.join(directory, "flat"), os.path.join(directory, "ivf")
+        os.makedirs(flat_dir)
+        os.makedirs(ivf_dir)
+        matrix = embedder.embed([f"function number {i} handles case {i % 7}" for i in range(500)])
+        write_vectors(flat_dir, [matrix[:250], matrix[250:]], embedder.dim, ivf_min=10 ** 9)
+        write_vectors(ivf_dir, [matrix], embedder.dim, ivf_min=1)
+        flat, ivf = VectorIndex(flat_dir), VectorIndex(ivf_dir)
+        query = embedder.embed(["which function handles case 3"])
+        exact = flat.search(query, 5)[0]
+        # Probing every list must reproduce the exhaustive result
+        approximate = ivf.search(query, 5, nprobe=ivf.lists)[0]
+        # Tombstone the eight best passages: the next five live ones must still come back
+        ranked = [number for number, _ in flat.search(query, 13)[0]]
+        class DenseSegment:
+            name, dense, by_file, total_length = "seg-1", flat, {"dead.py": ranked[:8]}, 500
+
+            def __len__(self):
+                return len(self.dense)
+
+        segment = DenseSegment()
+        snapshot = IndexSnapshot({"version": 1, "sources": [], "updated_at": 0,
+                                  "segments": [{"name": "seg-1", "tombstones": ["dead.py"]}]}, {"seg-1": segment})
+        live = [number for _, number, _ in snapshot.rank_dense(query, 5)]
+
+        results = [
+            check("embeddings are unit length", abs(float((embedded ** 2).sum(axis=1)[0]) - 1) < 1e-5),
+            check("inflections land close together", embedded[0] @ embedded[1] > embedded[0] @ embedded[2]),
+            check("exhaustive search finds the stored row", flat.search(matrix[42:43], 1)[0][0][0] == 42),
+            check("IVF groups rows into lists", ivf.lists > 1),
+            check("IVF with every list matches exhaustive",
+                  [round(score, 5) for _, score in approximate] == [round(score, 5) for _, score in exact]),
+            check("k live hits despite more tombstones than k", live == ranked[8:13]),
+        ]
+    assert all(results)
+
+def test_lazy_dense_import():
+    """Test that starting the backend without retrieval sources does not load NumPy"""
+    print("\n🔍 Testing lazy dense index import...")
+    import subprocess
+    env = {**os.environ, "DOCUGENIUS_RAG_SOURCES": ""}
+    probe = subprocess.run([sys.executable, "-c", "import sys, main; print('numpy' in sys.modules)"],
+                           cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True)
+    results = [
+        check("numpy not imported without sources", probe.returncode == 0 and probe.stdout.strip() == "False"),
+    ]
+    assert all(results)
+
+def test_sessions():
+    """Test conversation session prompts, compaction split and persistence"""
+    print("\n🔍 Testing conversation sessions...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SessionStore(SharedStore(os.path.join(directory, "store.sqlite3")))
+        session = Session.create("explain_code", "beginner", "python", "SYSTEM", "CONTEXT")
+        first = session.prompt()
+        session.add_turn(None, "answer 1")
+        for number in range(2, 5):
+            session.add_turn(f"question {number}", f"answer {number}")
+        followup = session.prompt("question 5")
+        upto = session.fold_point(keep_turns=2)
+        folded_away = session.messages[:upto]
+        session.apply_summary("  earlier turns  ", upto)
+        store.save(session)
+        resumed = store.get(session.session_id)
+
+        results = [
+            check("first turn answers the context", [m["content"] for m in first] == ["SYSTEM", "CONTEXT"]),
+            check("follow-ups keep the context prefix", [m["content"] for m in followup[:2]] == ["SYSTEM", "CONTEXT"]
+                  and followup[-1] == {"role": "user", "content": "question 5"}),
+            check("oldest turns folded, last two kept", [m["content"] for m in folded_away] ==
+                  ["answer 1", "question 2", "answer 2"] and session.messages[0]["content"] == "question 3"),
+            check("summary follows the context", session.prompt("q")[2]["content"].endswith("earlier turns")),
+            check("nothing to fold with fewer turns", Session.create("m", "a", "text", "S", "C").fold_point() == 0),
+            check("session resumed from the store", resumed.to_dict() == session.to_dict() and resumed.turns == 4),
+            check("unknown sessions are None", store.get("missing") is None),
+        ]
+    assert all(results)
+
+def test_tracing():
+    """Test span nesting, Server-Timing and the trace buffer"""
+    print("\n🔍 Testing request tracing...")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traces.jsonl")
+        tracer = Tracer(buffer_size=2, path=path)
+        with span("outside") as outside:
+            pass
+        with tracer.trace("POST /ask/", status=200) as trace:
+            with span("upstream", model="gpt-4o"):
+                with span("retry"):
+                    pass
+            parsing = start_span("parse")
+            end_span(parsing)
+            with span("upstream"):
+                pass
+        for name in ("GET /a", "GET /b"):
+            with tracer.trace(name):
+                pass
+        header = trace.server_timing()
+        with open(path) as handle:
+            exported = [line for line in handle]
+
+        results = [
+            check("spans are no-ops outside a trace", outside is None),
+            check("nested span keeps its parent", [s.parent_id for s in trace.spans] == [None, 0, 1, 0, 0]),
+            check("Server-Timing sums top-level stages", [metric.split(";")[0] for metric in header.split(", ")]
+                  == ["upstream", "parse", "total"]),
+            check("ring buffer keeps the newest traces", [t["name"] for t in tracer.recent()] == ["GET /b", "GET /a"]),
+            check("every trace exported as a JSON line", len(exported) == 3 and '"model": "gpt-4o"' in exported[0]),
+            check("disabled tracer records nothing", Tracer(enabled=False).recent() == []),
+        ]
+    assert all(results)
+
+def test_profiling():
+    """Test the sampling profiler's collapsed stacks, exclusivity and token check"""
+    print("\n🔍 Testing sampling profiler...")
+
+    stop = threading.Event()
+
+    def spin_for_profile():
+        while not stop.is_set():
+            sum(i * i for i in range(1000))
+
+    worker = threading.Thread(target=spin_for_profile, name="spinner-1", daemon=True)
+    worker.start()
+    profiler = SamplingProfiler(interval=0.002)
+    profiler.start()
+    try:
+        SamplingProfiler().start()
+        exclusive = False
+    except ProfilerBusy:
+        exclusive = True
+    time.sleep(0.3)
+    profile = profiler.stop()
+    stop.set()
+    worker.join()
+    try:
+        again = SamplingProfiler()
+        again.start()
+        again.stop()
+        released = True
+    except ProfilerBusy:
+        released = False
+    lines = profile.collapsed().splitlines()
+    spinner = [line for line in lines if line.startswith("spinner-N;")]
+
+    results = [
+        check("busy thread sampled", bool(spinner) and "spin_for_profile (test_backend.py)" in spinner[0]),
+        check("collapsed lines end in a count", all(line.rsplit(" ", 1)[1].isdigit() for line in lines)),
+        check("one profile at a time", exclusive),
+        check("profiler released after stop", released),
+        check("overhead within budget", profile.overhead < 0.05),
+        check("token compared exactly", token_valid("abc", "abc") and not token_valid("abd", "abc")
+              and not token_valid(None, "abc") and not token_valid("", "")),
+    ]
+    assert all(results)
+
+def test_uploads():
+    """Test streamed multipart uploads: spooling, name sanitizing, archives and limits"""
+    print("\n🔍 Testing streaming uploads...")
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as bundle:
+        bundle.writestr("pkg/shapes.py", "def area(r):\n    return 3.14 * r * r\n")
+        bundle.writestr("node_modules/vendor.js", "module.exports = 1;\n")
+    parts = [
+        b'--b0\r\nContent-Disposition: form-data; name="target"\r\n\r\ninspect\r\n',
+        b'--b0\r\nContent-Disposition: form-data; name="file"; filename="../../etc/passwd"\r\n\r\n',
+        b"root:x:0:0\r\n",
+        b'--b0\r\nContent-Disposition: form-data; name="file"; filename="proj.zip"\r\n\r\n',
+        archive.getvalue() + b"\r\n--b0--\r\n",
+    ]
+    headers = {"content-type": "multipart/form-data; boundary=b0"}
+
+    async def stream(chunks, size=7):
+        # Small chunks, so boundaries and headers straddle reads
+        body = b"".join(chunks)
+        for start in range(0, len(body), size):
+            yield body[start:start + size]
+
+    with tempfile.TemporaryDirectory() as directory:
+        upload = asyncio.run(receive_upload(headers, stream(parts), directory))
+        names = [spooled.name for spooled in upload.files]
+        spooled_inside = all(os.path.dirname(spooled.path) == upload.directory for spooled in upload.files)
+        inventory = upload.inventory()
+        upload.cleanup()
+        try:
+            asyncio.run(receive_upload(headers, stream(parts, 1024), directory, max_bytes=200))
+            limited = False
+        except UploadTooLarge:
+            limited = True
+
+        results = [
+            check("form fields parsed", upload.fields == {"target": "inspect"}),
+            check("file names reduced to a base name", names == ["passwd", "proj.zip"] and spooled_inside),
+            check("archive members listed with their language",
+                  {"path": "proj.zip/pkg/shapes.py", "bytes": 37, "language": "python"} in inventory["files"]),
+            check("skipped archive directories ignored", not any("vendor" in f["path"] for f in inventory["files"])),
+            check("oversized body rejected while streaming", limited),
+            check("spools removed", os.listdir(directory) == []),
+        ]
+    assert all(results)
+
+def test_cassettes():
+    """Test recording model calls to a cassette and replaying them, plain and streamed"""
+    print("\n🔍 Testing LLM cassettes...")
+
+    def completion(content):
+        message = types.SimpleNamespace(role="assistant", content=content)
+        usage = types.SimpleNamespace(prompt_tokens=50, completion_tokens=20, total_tokens=70)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(index=0, message=message)], usage=usage)
+
+    def create(**kwargs):
+        time.sleep(0.05)
+        if kwargs.get("stream"):
+            words = [types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=word))],
+                                           usage=None) for word in ("Binary ", "search")]
+            final = types.SimpleNamespace(choices=[], usage=types.SimpleNamespace(prompt_tokens=50, completion_tokens=2))
+            return iter(words + [final])
+        return completion("Explanation: " + kwargs["messages"][-1]["content"])
+
+    api = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    ask = [{"role": "user", "content": "What is a closure?"}]
+    follow_up = [{"role": "user", "content": "And binary search?"}]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.jsonl")
+        recorder = RecordingClient(api, path)
+        recorder.chat.completions.create(model="gpt-4o", messages=ask)
+        streamed = "".join(chunk.choices[0].delta.content
+                           for chunk in recorder.chat.completions.create(model="gpt-4o", messages=follow_up, stream=True)
+                           if chunk.choices)
+
+        replay = ReplayClient(path, time_scale=0)
+        started = time.perf_counter()
+        answer = replay.chat.completions.create(model="gpt-4o-mini", messages=ask)
+        instant = time.perf_counter() - started < 0.02
+        chunks = list(replay.chat.completions.create(model="gpt-4o", messages=follow_up, stream=True))
+        assembled = replay.chat.completions.create(model="gpt-4o", messages=follow_up)
+        timed = ReplayClient(path, time_scale=1)
+        started = time.perf_counter()
+        timed.chat.completions.create(model="gpt-4o", messages=ask)
+        original_timing = time.perf_counter() - started >= 0.05
+        try:
+            replay.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "Unrecorded"}])
+            missed = False
+        except CassetteMiss:
+            missed = True
+
+        results = [
+            check("recorded response replayed", answer.choices[0].message.content == "Explanation: What is a closure?"
+                  and answer.usage.total_tokens == 70),
+            check("stream passes through while recording", streamed == "Binary search"),
+            check("stream replayed chunk by chunk", [c.choices[0].delta.content for c in chunks if c.choices]
+                  == ["Binary ", "search"] and chunks[-1].usage.completion_tokens == 2),
+            check("stream served to a plain call", assembled.choices[0].message.content == "Binary search"),
+            check("time scale 0 skips latency, 1 keeps it", instant and original_timing),
+            check("unrecorded prompt raises", missed and replay.misses == 1),
+        ]
+    assert all(results)
+
+def test_cassette_replay():
+    """Test replaying a hand-written cassette, converting between streamed and plain recordings"""
+    print("\n🔍 Testing cassette replay...")
+    usage = {"prompt_tokens": 40, "completion_tokens": 3, "total_tokens": 43}
+    plain = {"model": "gpt-4o", "usage": usage,
+             "choices": [{"index": 0, "message": {"role": "assistant", "content": "Explanation: recursion"}}]}
+    chunks = [[0.0, {"model": "gpt-4o", "choices": [{"index": 0, "delta": {"content": "Binary "}}]}],
+              [0.01, {"model": "gpt-4o", "choices": [{"index": 0, "delta": {"content": "search"}}]}],
+              [0.02, {"model": "gpt-4o", "choices": [], "usage": usage}]]
+    ask = [{"role": "user", "content": "What is recursion?"}]
+    follow_up = [{"role": "user", "content": "And binary search?"}]
+    lines = [{"key": request_key(ask), "request": {"model": "gpt-4o", "messages": ask}, "response": plain, "latency": 0.05},
+             {"key": request_key(follow_up), "request": {"model": "gpt-4o", "messages": follow_up, "stream": True},
+              "chunks": chunks, "latency": 0.02}]
+
+    def deltas(stream):
+        return [chunk.choices[0].delta.content for chunk in stream if chunk.choices]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cassette.jsonl")
+        with open(path, "w") as handle:
+            handle.write("\n".join(json.dumps(line) for line in lines) + "\n\n")
+        replay = ReplayClient(path, time_scale=0)
+        plain_as_plain = replay.chat.completions.create(model="gpt-4o", messages=ask)
+        plain_as_stream = list(replay.chat.completions.create(model="gpt-4o", messages=ask, stream=True))
+        stream_as_stream = list(replay.chat.completions.create(model="gpt-4o", messages=follow_up, stream=True))
+        stream_as_plain = replay.chat.completions.create(model="gpt-4o", messages=follow_up)
+
+    results = [
+        check("both recordings loaded", len(replay.recordings) == 2),
+        check("plain recording served plain", plain_as_plain.choices[0].message.content == "Explanation: recursion"
+              and plain_as_plain.usage.total_tokens == 43),
+        check("plain recording streamed as one delta and a usage chunk",
+              deltas(plain_as_stream) == ["Explanation: recursion"] and plain_as_stream[-1].usage.total_tokens == 43),
+        check("streamed recording replayed chunk by chunk", deltas(stream_as_stream) == ["Binary ", "search"]
+              and stream_as_stream[-1].usage.completion_tokens == 3),
+        check("streamed recording assembled for a plain call", stream_as_plain.choices[0].message.content
+              == "Binary search" and stream_as_plain.usage.total_tokens == 43 and stream_as_plain.model == "gpt-4o"),
+        check("assemble and split round-trip", _assemble([[0, chunk] for chunk in _split(plain)])
+              == {"model": "gpt-4o", "usage": usage, "choices": plain["choices"]}),
+        check("split of an assembled stream keeps content and usage", _split(_assemble(chunks))
+              == [{"model": "gpt-4o", "choices": [{"index": 0, "delta": {"content": "Binary search"}}]},
+                  {"model": "gpt-4o", "choices": [], "usage": usage}]),
+        check("empty stream assembles to an empty answer", _assemble([])["choices"][0]["message"]["content"] == ""),
+        check("every call served", replay.served == 4 and replay.misses == 0),
+    ]
+    assert all(results)
+
+def test_pdf_export():
+    """Test PDF rendering and the shared-store cache of rendered reports"""
+    print("\n🔍 Testing PDF export...")
+    result = {"explanation": "A closure keeps <b>its</b> enclosing scope alive.", "breakdown": ["Define", "Return"],
+              "code_analysis": ["def outer():\n    x = 1\n    return lambda: x"], "external_resources": [],
+              "generation_time": 1.5, "language": "python"}
+
+    async def render_repeatedly(exporter):
+        # Concurrent requests share one render; a later one must be served from the store
+        first, concurrent = await asyncio.gather(exporter.render(result), exporter.render(result))
+        return first, concurrent, await exporter.render(result)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SharedStore(os.path.join(directory, "store.sqlite3"))
+        exporter = PDFExporter(store, max_entries=4, workers=1)
+        try:
+            (key, pdf), concurrent, (second_key, cached) = asyncio.run(render_repeatedly(exporter))
+        finally:
+            exporter.shutdown()
+        results = [
+            check("report renders as a PDF", pdf.startswith(b"%PDF")),
+            check("concurrent requests share a render", concurrent == (key, pdf)),
+            check("rendered report cached by result hash", key == second_key and cached == pdf
+                  and exporter.cached(key) == pdf),
+            check("no render left pending", not exporter._pending),
+        ]
+    assert all(results)
+
+def test_zip_export():
+    """Test the streamed zip export and that a disconnect cancels the renders still queued"""
+    print("\n🔍 Testing zip export...")
+    cancelled = []
+
+    class SlowExporter:
+        async def render(self, result):
+            if result["slow"]:
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(result["explanation"])
+                    raise
+            return "key", b"%PDF-stub"
+
+    loaded = []
+
+    def entries(slow):
+        return {f"r{i}": {"result_id": f"r{i}", "query": f"query {i}", "mode": "explain_code", "audience": "beginner",
+                          "created_at": 0, "result": {"explanation": f"answer {i}", "slow": slow and i > 0}}
+                for i in range(5)}
+
+    def loader(slow):
+        store = entries(slow)
+
+        def load(result_id):
+            loaded.append(result_id)
+            return store.get(result_id)
+        return load
+
+    async def export_all():
+        # r9 was pruned after the export was requested
+        ids = [f"r{i}" for i in range(5)] + ["r9"]
+        return b"".join([chunk async for chunk in stream_zip(ids, loader(False), ["markdown", "pdf"], SlowExporter(),
+                                                            concurrency=2)])
+
+    async def first_chunk():
+        stream = stream_zip([f"r{i}" for i in range(5)], loader(False), ["markdown"], SlowExporter(), concurrency=2)
+        await stream.__anext__()
+        await stream.aclose()
+
+    async def disconnect():
+        stream = stream_zip([f"r{i}" for i in range(5)], loader(True), ["markdown", "pdf"], SlowExporter(),
+                            concurrency=3)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        # Checked before asyncio.run cancels whatever is left on shutdown
+        return sorted(cancelled)
+
+    archive = zipfile.ZipFile(io.BytesIO(asyncio.run(export_all())))
+    loaded.clear()
+    asyncio.run(first_chunk())
+    loaded_before_first_chunk = list(loaded)
+    cancelled_on_close = asyncio.run(disconnect())
+    results = [
+        check("every entry exported in every format", sorted(archive.namelist()) == sorted(
+            ["index.json"] + [f"{fmt}/r{i}.{ext}" for i in range(5) for fmt, ext in (("markdown", "md"), ("pdf", "pdf"))])),
+        check("markdown member rendered", b"answer 3" in archive.read("markdown/r3.md")),
+        check("pruned entry left out of the index",
+              [entry["result_id"] for entry in json.loads(archive.read("index.json"))] == [f"r{i}" for i in range(5)]),
+        check("entries loaded only as their render starts", loaded_before_first_chunk == ["r0", "r1"]),
+        check("disconnect cancels queued renders", cancelled_on_close == ["answer 1", "answer 2"]),
+    ]
+    assert all(results)
+
+def test_compression():
+    """Test Accept-Encoding negotiation and the compression middleware"""
+    print("\n🔍 Testing response compression...")
+    from starlette.responses import Response, StreamingResponse
+    from starlette.testclient import TestClient
+
+    large = b'{"explanation": "' + b"closures keep their scope " * 100 + b'"}'
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/stream":
+            response = StreamingResponse(iter([large, large]), media_type="application/json")
+        else:
+            response = Response(large if scope["path"] == "/large" else b'{"ok": true}',
+                                media_type="application/json", headers={"ETag": '"abc"'})
+        await response(scope, receive, send)
+
+    client = TestClient(CompressionMiddleware(app, minimum_size=1024))
+    compressed = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    streamed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/large", headers={"Accept-Encoding": "identity"})
+    results = [
+        check("gzip negotiated, q=0 refused", negotiate_encoding("gzip, deflate") == "gzip"
+              and negotiate_encoding("gzip;q=0") is None and negotiate_encoding("") is None),
+        check("gzip output is stable", compress(large, "gzip") == compress(large, "gzip")),
+        check("large JSON compressed", compressed.headers.get("content-encoding") == "gzip"
+              and compressed.content == large and int(compressed.headers["content-length"]) < len(large)),
+        check("compressed response varies and has a weak ETag", "Accept-Encoding" in compressed.headers["vary"]
+              and compressed.headers["etag"] == 'W/"abc"'),
+        check("small and streamed responses untouched", "content-encoding" not in small.headers
+              and "content-encoding" not in streamed.headers and streamed.content == large * 2),
+        check("identity-only clients get the plain body", "content-encoding" not in identity.headers
+              and identity.headers["etag"] == '"abc"'),
+    ]
+    assert all(results)
+
+def test_etags():
+    """Test ETag matching, conditional GETs and that POST /ask/ never answers 304"""
+    print("\n🔍 Testing ETags and conditional requests...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER))
+    body = {"query": "What is a closure? (etag test)", "mode": "explain_concept", "audience": "beginner"}
+    with TestClient(backend.app) as client:
+        first = client.post("/ask/", json=body)
+        location = first.headers["content-location"]
+        entry = client.get(location)
+        etag = entry.headers["etag"]
+        revalidated = client.get(location, headers={"If-None-Match": etag})
+        changed = client.get(location, headers={"If-None-Match": '"other"'})
+        repeated = client.post("/ask/", json=body, headers={"If-None-Match": "*"})
+        modes = client.get("/ask/modes")
+        modes_revalidated = client.get("/ask/modes", headers={"If-None-Match": modes.headers["etag"]})
+    results = [
+        check("weak comparison and lists", etag_matches('W/"a", "b"', '"a"') and etag_matches("*", '"a"')
+              and not etag_matches('"c"', '"a"') and not etag_matches(None, '"a"')),
+        check("matching GET answered 304 without a body", revalidated.status_code == 304
+              and revalidated.content == b"" and revalidated.headers["etag"] == etag),
+        check("changed GET gets the full entry", changed.status_code == 200 and changed.json() == entry.json()),
+        check("modes revalidated", modes_revalidated.status_code == 304),
+        check("POST /ask/ ignores If-None-Match", repeated.status_code == 200 and repeated.json()["cached"]
+              and "etag" not in repeated.headers),
+    ]
+    assert all(results)
+
+def test_analysis_mode():
+    """Test that static analysis only shapes explain_code prompts"""
+    print("\n🔍 Testing static analysis by mode...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER))
+    query = "def cache(key):\n    return key  # (analysis mode test)"
+    with TestClient(backend.app) as client:
+        code = client.post("/ask/", json={"query": query, "mode": "explain_code", "language": "python"}).json()
+        concept = client.post("/ask/", json={"query": query, "mode": "explain_concept", "language": "python"}).json()
+    results = [
+        check("code explanations analyzed", code["static_analysis"] is not None),
+        check("concept questions not analyzed", concept["static_analysis"] is None),
+    ]
+    assert all(results)
+
+def test_readiness():
+    """Test that /health/ready passes its shared-store check once the startup imports are done"""
+    print("\n🔍 Testing readiness probe...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER))
+    with TestClient(backend.app) as client:
+        deadline = time.time() + 10
+        ready = client.get("/health/ready")
+        while ready.status_code != 200 and time.time() < deadline:
+            time.sleep(0.05)
+            ready = client.get("/health/ready")
+    results = [
+        check("shared store reachable from the probe", ready.json()["checks"]["shared_store"]),
+        check("ready without an API key", ready.status_code == 200 and ready.json()["status"] == "ready"),
+    ]
+    assert all(results)
+
+def test_ui_data_endpoints():
+    """Test the examples and language detection the UI fetches instead of importing backend modules"""
+    print("\n🔍 Testing UI data endpoints...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER))
+    with TestClient(backend.app) as client:
+        examples = client.get("/examples/")
+        revalidated = client.get("/examples/", headers={"If-None-Match": examples.headers["etag"]})
+        detected = client.post("/language/detect", json={"texts": ["def f(x):\n    return x", "Just some prose"]})
+    candidates = detected.json()["results"]
+    results = [
+        check("examples served", examples.json() == EXAMPLES),
+        check("examples revalidated", revalidated.status_code == 304),
+        check("one ranked candidate list per snippet", len(candidates) == 2
+              and candidates[0][0]["language"] == "python" and 0 < candidates[0][0]["confidence"] <= 1),
+        check("prose has no candidates", candidates[1] == []),
+    ]
+    assert all(results)
+
+def test_estimated_usage():
+    """Test that calls whose stream never reports usage are charged an estimate, not zero"""
+    print("\n🔍 Testing usage fallback...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER, usage=False))
+    before = backend.metrics.get("usage_estimated")
+    with TestClient(backend.app, headers={"X-API-Key": "usage-fallback"}) as client:
+        answer = client.post("/ask/", json={"query": "What is a closure? (no usage)", "mode": "explain_concept",
+                                            "audience": "beginner"}).json()
+        with client.websocket_connect("/ws/session") as websocket:
+            websocket.receive_json()
+            websocket.send_json({"query": "What is a generator? (no usage)"})
+            done = websocket.receive_json()
+            while done["type"] == "delta":
+                done = websocket.receive_json()
+    tenant = tenant_id("usage-fallback", None)
+    charged = {group["tenant"]: group for group in backend.usage_ledger.summary("tenant")}.get(tenant, {})
+    results = [
+        check("/ask/ charged an estimate", answer["usage"]["prompt_tokens"] > 0
+              and answer["usage"]["completion_tokens"] > 0),
+        check("session turn charged an estimate", done["type"] == "done" and done["usage"]["total_tokens"] > 0),
+        check("ledger holds both calls", charged.get("requests") == 2
+              and charged.get("total_tokens") == answer["usage"]["total_tokens"] + done["usage"]["total_tokens"]),
+        check("estimates counted", backend.metrics.get("usage_estimated") - before == 2),
+    ]
+    assert all(results)
+
+def test_ask_disconnect():
+    """Test that a client disconnecting mid-answer gets 499, stops the upstream call and is still charged"""
+    print("\n🔍 Testing client disconnects...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(" ".join([ANSWER] * 20), delay=0.01))
+    body = json.dumps({"query": "What is a closure? (disconnect test)", "mode": "explain_concept"}).encode("utf-8")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": "/ask/", "raw_path": b"/ask/", "query_string": b"", "root_path": "", "client": ("127.0.0.1", 1),
+             "server": ("testserver", 80), "headers": [(b"content-type", b"application/json"),
+                                                       (b"host", b"testserver"), (b"x-api-key", b"walks-away")]}
+    before = {name: backend.metrics.get(name) for name in ("ask_client_disconnects", "upstream_cancelled")}
+
+    async def ask_then_leave():
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # Leave once the answer is streaming, long before it would finish
+            await asyncio.sleep(0.2)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        started = time.perf_counter()
+        await backend.app(scope, receive, send)
+        return sent[0]["status"], time.perf_counter() - started
+
+    with TestClient(backend.app):
+        status, elapsed = asyncio.run(ask_then_leave())
+    charged = {group["tenant"]: group for group in backend.usage_ledger.summary("tenant")}.get(
+        tenant_id("walks-away", None), {})
+    results = [
+        check("disconnect answered with 499", status == 499),
+        check("answer abandoned early", elapsed < 1.0),
+        check("disconnect and upstream cancel counted", all(backend.metrics.get(name) - count == 1
+                                                           for name, count in before.items())),
+        check("partial call charged an estimate", charged.get("requests") == 1 and charged.get("total_tokens", 0) > 0),
+    ]
+    assert all(results)
+
+def test_stale_answers():
+    """Test serving expired answers while they are refreshed, and the cooldown after a failed refresh"""
+    print("\n🔍 Testing stale-while-revalidate...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER))
+    body = {"query": "What is a closure? (stale test)", "mode": "explain_concept", "audience": "beginner"}
+    key = backend.request_cache_key(backend.DocuGeniusRequest(**body), "text")
+    calls = []
+
+    def unavailable(**kwargs):
+        calls.append(kwargs)
+        raise RuntimeError("upstream unavailable")
+
+    def expire():
+        stored = backend.shared_store.get(backend.ASK_CACHE_NAMESPACE, key)
+        backend.shared_store.set(backend.ASK_CACHE_NAMESPACE, key, stored, ttl=-60)
+
+    def settle():
+        deadline = time.time() + 5
+        while backend.revalidations and time.time() < deadline:
+            time.sleep(0.01)
+
+    with TestClient(backend.app) as client:
+        client.post("/ask/", json=body)
+        expire()
+        backend._client = types.SimpleNamespace(
+            chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=unavailable)))
+        outage = []
+        for _ in range(3):
+            outage.append(client.post("/ask/", json=body))
+            settle()
+        cooling_down = backend.shared_store.get("revalidate_failed", key) is not None
+
+        backend.shared_store.delete("revalidate_failed", key)
+        backend._client = fake_model(ANSWER)
+        client.post("/ask/", json=body)
+        settle()
+        refreshed_response = client.post("/ask/", json=body)
+        refreshed = refreshed_response.json()
+        # The refreshed answer was generated internally but is served from the cache, so its ID must resolve
+        refreshed_entry = client.get(refreshed_response.headers["content-location"])
+        exported = client.post("/export/", json={"result_ids": [refreshed["result_id"]], "formats": ["json"]})
+        unknown = client.post("/export/", json={"result_ids": [refreshed["result_id"], "no-such-result"],
+                                                "formats": ["json"]})
+        searched = client.post("/export/", json={"query": body["query"][:20], "formats": ["json"]})
+    results = [
+        check("expired answer served stale with Age", all(r.status_code == 200 and r.json()["stale"]
+                                                          and "age" in r.headers for r in outage)),
+        check("failed refresh not retried within the cooldown", len(calls) == 1 and cooling_down),
+        check("successful refresh replaces the stale answer", refreshed["cached"] and not refreshed["stale"]),
+        check("refreshed answer in the history", refreshed_entry.status_code == 200
+              and refreshed_entry.json()["result_id"] == refreshed["result_id"]),
+        check("refreshed answer exportable by ID", exported.status_code == 200
+              and f"json/{refreshed['result_id']}.json" in zipfile.ZipFile(io.BytesIO(exported.content)).namelist()),
+        check("unknown result IDs rejected before streaming", unknown.status_code == 404
+              and "no-such-result" in unknown.json()["detail"]),
+        check("search export streams the matching results", searched.status_code == 200
+              and f"json/{refreshed['result_id']}.json" in zipfile.ZipFile(io.BytesIO(searched.content)).namelist()),
+    ]
+    assert all(results)
+
+def test_repo_job_billing():
+    """Test that repository job units bill the caller, skip the rate limit and stay out of history and cache"""
+    print("\n🔍 Testing repository job accounting...")
+    from fastapi.testclient import TestClient
+    backend = load_app(fake_model(ANSWER))
+    saved = backend.REPO_ROOTS, backend.REPO_OUTPUT_DIR, backend.RATE_LIMIT_PER_MINUTE
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "project")
+        os.makedirs(source)
+        for name in ("alpha", "beta", "gamma"):
+            with open(os.path.join(source, f"{name}.py"), "w") as handle:
+                handle.write(f"def {name}(items):\n    return [item for item in items if item]\n")
+        backend.REPO_ROOTS = [os.path.realpath(directory)]
+        backend.REPO_OUTPUT_DIR = os.path.join(directory, "docs")
+        backend.RATE_LIMIT_PER_MINUTE = 1
+        history_before = len(backend.result_history)
+        cached_before = backend.shared_store.connection().execute(
+            "SELECT COUNT(*) FROM kv WHERE namespace = ?", (backend.ASK_CACHE_NAMESPACE,)).fetchone()[0]
+        try:
+            with TestClient(backend.app, headers={"X-API-Key": "repo-owner"}) as client:
+                oversubscribed = client.post("/repo/jobs", json={"source": source, "concurrency": 10000})
+                job = client.post("/repo/jobs", json={"source": source}).json()
+                deadline = time.time() + 10
+                while job["state"] == "running" and time.time() < deadline:
+                    time.sleep(0.05)
+                    job = client.get(f"/repo/jobs/{job['job_id']}").json()
+        finally:
+            backend.REPO_ROOTS, backend.REPO_OUTPUT_DIR, backend.RATE_LIMIT_PER_MINUTE = saved
+        cached_after = backend.shared_store.connection().execute(
+            "SELECT COUNT(*) FROM kv WHERE namespace = ?", (backend.ASK_CACHE_NAMESPACE,)).fetchone()[0]
+    charged = {group["tenant"]: group for group in backend.usage_ledger.summary("tenant")}
+    results = [
+        check("every unit documented despite the rate limit", job["state"] == "done"
+              and job["progress"]["processed"] == 3 and job["progress"]["failed"] == 0),
+        check("concurrency capped at DOCUGENIUS_REPO_CONCURRENCY", oversubscribed.status_code == 422),
+        check("units billed to the caller", charged.get(tenant_id("repo-owner", None), {}).get("requests") == 3
+              and "ip:repo" not in charged),
+        check("units kept out of history and the answer cache", len(backend.result_history) == history_before
+              and cached_after == cached_before),
+    ]
+    assert all(results)
+
+def test_upload_repo_jobs():
+    """Test that upload repository jobs are opt-in, budget-checked and billed to the uploader; archive limits give 413"""
+    print("\n🔍 Testing upload repository jobs...")
+    from fastapi.testclient import TestClient
+    from shared_store import BUDGET_PREFIX
+    backend = load_app(fake_model(ANSWER))
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as bundle:
+        bundle.writestr("pkg/shapes.py", "def area(r):\n    return 3.14 * r * r\n")
+    form = {"target": "repo", "granularity": "file"}
+    upload = {"file": ("shapes.zip", archive.getvalue(), "application/zip")}
+    spent = tenant_id("spent-uploader", None)
+    saved = backend.UPLOAD_REPO_JOBS, backend.REPO_OUTPUT_DIR, backend.usage_ledger.budgets
+    saved_members = uploads.UPLOAD_MAX_MEMBERS
+    with tempfile.TemporaryDirectory() as directory:
+        backend.REPO_OUTPUT_DIR = os.path.join(directory, "docs")
+        try:
+            with TestClient(backend.app) as client:
+                backend.UPLOAD_REPO_JOBS = False
+                disabled = client.post("/upload/", data=form, files=upload, headers={"X-API-Key": "uploader"})
+                backend.UPLOAD_REPO_JOBS = True
+                backend.usage_ledger.budgets = {**saved[2], spent: 10}
+                backend.shared_store.add_to_window(BUDGET_PREFIX, spent, 10, backend.usage_ledger.window_seconds)
+                refused = client.post("/upload/", data=form, files=upload, headers={"X-API-Key": "spent-uploader"})
+                started = client.post("/upload/", data=form, files=upload, headers={"X-API-Key": "uploader"})
+                job = started.json()
+                deadline = time.time() + 10
+                while job.get("state") == "running" and time.time() < deadline:
+                    time.sleep(0.05)
+                    job = client.get(f"/repo/jobs/{job['job_id']}").json()
+                many = io.BytesIO()
+                with zipfile.ZipFile(many, "w") as bundle:
+                    for number in range(10):
+                        bundle.writestr(f"pkg/module_{number}.py", f"VALUE = {number}\n")
+                uploads.UPLOAD_MAX_MEMBERS = 3
+                too_many = client.post("/upload/", data={"target": "inspect"},
+                                       files={"file": ("many.zip", many.getvalue(), "application/zip")})
+        finally:
+            uploads.UPLOAD_MAX_MEMBERS = saved_members
+            backend.UPLOAD_REPO_JOBS, backend.REPO_OUTPUT_DIR, backend.usage_ledger.budgets = saved
+    charged = {group["tenant"]: group for group in backend.usage_ledger.summary("tenant")}
+    results = [
+        check("archive jobs refused unless enabled", disabled.status_code == 403),
+        check("exhausted budget refused before the job starts", refused.status_code == 429
+              and "retry-after" in refused.headers and spent not in charged),
+        check("enabled job accepted and finished", started.status_code == 202 and job.get("state") == "done"),
+        check("oversized archive inspected as 413", too_many.status_code == 413
+              and "more than 3 files" in too_many.text),
+        check("units billed to the uploader", charged.get(tenant_id("uploader", None), {}).get("requests") == 1
+              and "ip:repo" not in charged),
+    ]
+    assert all(results)
+
+def fake_model(answer, delay=0.0, usage=True, calls=None):
+    """Stand-in OpenAI client streaming answer word by word, optionally without the usage chunk"""
+    def create(**kwargs):
+        if calls is not None:
+            calls.append(kwargs)
+        words = answer.split(" ")
+
+        def chunks():
+            for i, word in enumerate(words):
+                time.sleep(delay)
+                delta = types.SimpleNamespace(content=word + (" " if i < len(words) - 1 else ""))
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+            if usage:
+                yield types.SimpleNamespace(choices=[], usage=types.SimpleNamespace(
+                    prompt_tokens=100, completion_tokens=len(words), total_tokens=100 + len(words)))
+        return chunks()
+
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+
+ANSWER = "Explanation: A closure keeps its enclosing scope alive.\nBreakdown:\n1. Define outer\n2. Return inner"
+
+def load_app(client):
+    """The backend module, answering from client instead of the OpenAI API"""
+    import main
+    main._client = client
+    return main
+
+def main():
+    """Run all tests"""
+    print("🚀 DocuGenius Backend - Component Test")
+    print("=" * 50)
+
+    tests = [
+        test_language_detection,
+        test_static_analysis,
+        test_compaction,
+        test_shared_store,
+        test_usage_ledger,
+        test_model_router,
+        test_prewarmer,
+        test_repo_docs,
+        test_retrieval,
+        test_vector_index,
+        test_lazy_dense_import,
+        test_sessions,
+        test_tracing,
+        test_profiling,
+        test_uploads,
+        test_cassettes,
+        test_cassette_replay,
+        test_pdf_export,
+        test_zip_export,
+        test_compression,
+        test_etags,
+        test_analysis_mode,
+        test_readiness,
+        test_ui_data_endpoints,
+        test_estimated_usage,
+        test_ask_disconnect,
+        test_stale_answers,
+        test_repo_job_billing,
+        test_upload_repo_jobs,
+    ]
+    results = []
+    for test in tests:
+        try:
+            test()
+            results.append(True)
+        except AssertionError:
+            results.append(False)
+
+    print("\n" + "=" * 50)
+    if all(results):
+        print("🎉 All tests passed!")
+    else:
+        print("⚠️  Some tests failed.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Request Tracing - Lightweight spans across the request lifecycle
+
+Every HTTP request (and every WebSocket session turn) is one trace; code marks
+its stages with `with span("upstream"):` or `start_span("parse")`. Spans nest
+through a context variable, so they follow the request into
+asyncio.to_thread workers. Finished traces go to an in-memory ring buffer
+served at /debug/traces and, when DOCUGENIUS_TRACE_FILE is set, are appended
+to that file as JSON lines. TracingMiddleware reports the time per stage in a
+Server-Timing header.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from starlette.datastructures import MutableHeaders
+
+TRACING_ENABLED = os.getenv("DOCUGENIUS_TRACING", "true").lower() == "true"
+# Finished traces kept in memory per worker
+TRACE_BUFFER_SIZE = int(os.getenv("DOCUGENIUS_TRACE_BUFFER", "200"))
+# JSON-lines file every finished trace is appended to (empty = memory only)
+TRACE_FILE = os.getenv("DOCUGENIUS_TRACE_FILE", "")
+# Paths that are never traced (the trace viewer itself, probes)
+UNTRACED_PREFIXES = ("/debug/", "/health/")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("docugenius_span", default=None)
+_METRIC_NAME = re.compile(r"[^A-Za-z0-9_-]")
+
+class Span:
+    """One timed stage; end() is idempotent"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end_time", "attributes")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[int], attributes: Dict):
+        self.trace = trace
+        self.span_id = len(trace.spans)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end_time: Optional[float] = None
+        self.attributes = attributes
+        trace.spans.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, **attributes):
+        self.attributes.update(attributes)
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time if self.end_time is not None else time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes
+        }
+
+class Trace:
+    """The spans of one request; spans[0] is the root covering the whole request"""
+
+    def __init__(self, name: str, attributes: Optional[Dict] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.root = Span(self, name, None, dict(attributes or {}))
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Seconds per stage name over the root's direct children, in order of first appearance"""
+        totals: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            if span.parent_id == 0 and span.end_time is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: one metric per stage, then the total so far"""
+        metrics = [f"{_METRIC_NAME.sub('_', name)};dur={seconds * 1000:.1f}"
+                   for name, seconds in self.stage_totals().items()]
+        metrics.append(f"total;dur={self.root.duration * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.root.duration * 1000, 3),
+            "attributes": self.root.attributes,
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stage_totals().items()},
+            "spans": [span.to_dict() for span in self.spans[1:]]
+        }
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Open a child of the current span (None outside a trace); close it with end()
+
+    Unlike span(), this does not make the new span current, so stages started
+    this way are siblings; use it for long stretches of straight-line code.
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+def end_span(stage: Optional[Span], **attributes):
+    if stage is not None:
+        stage.end(**attributes)
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set(error=type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+class Tracer:
+    """Starts traces and keeps the finished ones in a ring buffer and, optionally, a JSON-lines file"""
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, buffer_size: int = TRACE_BUFFER_SIZE,
+                 path: str = TRACE_FILE):
+        self.enabled = enabled
+        self.path = path
+        self.finished: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Make a new trace current for the block and record it when the block exits"""
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(name, attributes)
+        token = _current.set(trace.root)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.root.set(error=type(e).__name__)
+            raise
+        finally:
+            _current.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace: Trace):
+        trace.root.end()
+        self.finished.append(trace)
+        if self.path:
+            line = json.dumps(trace.to_dict(), default=str) + "\n"
+            with self._lock, open(self.path, "a") as handle:
+                handle.write(line)
+
+    def recent(self, limit: int = 50, name: Optional[str] = None, min_ms: float = 0) -> List[Dict]:
+        """Finished traces, newest first, optionally filtered by name substring and duration"""
+        traces = []
+        for trace in reversed(self.finished):
+            if name and name not in trace.root.name:
+                continue
+            if trace.root.duration * 1000 < min_ms:
+                continue
+            traces.append(trace.to_dict())
+            if len(traces) >= limit:
+                break
+        return traces
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        for trace in self.finished:
+            if trace.trace_id == trace_id:
+                return trace.to_dict()
+        return None
+
+class TracingMiddleware:
+    """Trace every HTTP request and add Server-Timing and X-Trace-Id headers to its response
+
+    Stages that finish after the response headers are sent (streamed exports)
+    are missing from Server-Timing but present in the recorded trace, together
+    with a "send" span covering the body transfer.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not self.tracer.enabled
+                or scope["path"].startswith(UNTRACED_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        with self.tracer.trace(f"{scope['method']} {scope['path']}") as trace:
+            sending: Optional[Span] = None
+
+            async def send_traced(message):
+                nonlocal sending
+                if message["type"] == "http.response.start":
+                    trace.root.set(status=message["status"])
+                    headers = MutableHeaders(raw=message["headers"])
+                    headers["Server-Timing"] = trace.server_timing()
+                    headers["X-Trace-Id"] = trace.trace_id
+                    sending = Span(trace, "send", trace.root.span_id, {"bytes": 0})
+                elif message["type"] == "http.response.body" and sending is not None:
+                    sending.attributes["bytes"] += len(message.get("body", b""))
+                    if not message.get("more_body", False):
+                        sending.end()
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
@@ -0,0 +1,242 @@
+"""
+Streaming Uploads - Source files and archives spooled to disk as they arrive
+
+Multipart bodies are parsed straight from the request stream with
+python-multipart's push parser. Each file part is written to its own file in
+a per-upload spool directory, chunk by chunk, so memory use is bounded by the
+chunk size rather than the upload size. Limits are enforced while the body
+streams in (declared length, bytes received, parts and form fields), and the
+upload is abandoned and its spool removed as soon as one is crossed.
+
+Archives (zip, tar, tar.gz/bz2/xz) are never extracted: their members are
+read one at a time from the spooled archive, with limits on the member count
+and the expanded size against archive bombs.
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from typing import AsyncIterator, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from language_detection import detect_language
+from repo_docs import MAX_FILE_BYTES, ArchiveTooLarge, decode_source, is_archive, iter_archive_files
+
+UPLOAD_DIR = os.getenv("DOCUGENIUS_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "docugenius_uploads"))
+# Whole request body, and files per upload
+UPLOAD_MAX_BYTES = int(os.getenv("DOCUGENIUS_UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_MAX_FILES = int(os.getenv("DOCUGENIUS_UPLOAD_MAX_FILES", "100"))
+# Archive bomb limits: files inside each archive, and their total uncompressed size
+UPLOAD_MAX_MEMBERS = int(os.getenv("DOCUGENIUS_UPLOAD_MAX_MEMBERS", "20000"))
+UPLOAD_MAX_EXPANDED_BYTES = int(os.getenv("DOCUGENIUS_UPLOAD_MAX_EXPANDED_BYTES", str(1024 * 1024 * 1024)))
+# Spool directories older than this are removed at startup (uploads that fed a finished job)
+UPLOAD_SPOOL_TTL = float(os.getenv("DOCUGENIUS_UPLOAD_SPOOL_TTL", "86400"))
+MAX_FIELDS = 20
+MAX_FIELD_BYTES = 4096
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+
+class UploadError(ValueError):
+    status_code = 400
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+class SpooledFile(NamedTuple):
+    name: str  # Client file name, reduced to a safe base name
+    path: str
+    size: int
+    content_type: str
+
+    @property
+    def archive(self) -> bool:
+        return is_archive(self.path)
+
+class Upload:
+    """Spooled files and form fields of one upload; cleanup() removes the spool"""
+
+    def __init__(self, upload_id: str, directory: str):
+        self.upload_id = upload_id
+        self.directory = directory
+        self.files: List[SpooledFile] = []
+        self.fields: Dict[str, str] = {}
+        self.received = 0
+
+    def iter_files(self) -> Iterator[Tuple[str, str]]:
+        """(path, text) for every readable text file, archive members included
+
+        Member paths are prefixed with their archive's name when the upload has
+        more than one part, so files from different parts cannot collide.
+        """
+        for spooled in self.files:
+            if spooled.archive:
+                prefix = f"{spooled.name}/" if len(self.files) > 1 else ""
+                try:
+                    for path, text in iter_archive_files(spooled.path, UPLOAD_MAX_MEMBERS, UPLOAD_MAX_EXPANDED_BYTES):
+                        yield prefix + path, text
+                except ArchiveTooLarge as e:
+                    raise UploadTooLarge(f"{spooled.name}: {e}")
+            elif spooled.size <= MAX_FILE_BYTES:
+                with open(spooled.path, "rb") as handle:
+                    text = decode_source(handle.read())
+                if text is not None:
+                    yield spooled.name, text
+
+    def inventory(self, limit: int = 1000) -> Dict:
+        """Per-file language detection, with totals by language"""
+        files = []
+        languages: Dict[str, int] = {}
+        count = 0
+        for path, text in self.iter_files():
+            language = detect_language(text)
+            languages[language] = languages.get(language, 0) + 1
+            count += 1
+            if len(files) < limit:
+                files.append({"path": path, "bytes": len(text.encode("utf-8")), "language": language})
+        return {"files": files, "file_count": count, "truncated": count > len(files), "languages": languages}
+
+    def describe(self) -> Dict:
+        return {
+            "upload_id": self.upload_id,
+            "received_bytes": self.received,
+            "parts": [{"name": f.name, "bytes": f.size, "content_type": f.content_type, "archive": f.archive}
+                      for f in self.files],
+            "fields": self.fields
+        }
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+async def receive_upload(headers: Mapping[str, str], stream: AsyncIterator[bytes], directory: str = UPLOAD_DIR,
+                         max_bytes: int = UPLOAD_MAX_BYTES, max_files: int = UPLOAD_MAX_FILES) -> Upload:
+    """Parse a multipart/form-data body from stream into a new spool directory under directory"""
+    content_type, options = parse_options_header(headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data body")
+    declared = headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+
+    upload = Upload(uuid.uuid4().hex, os.path.join(directory, uuid.uuid4().hex))
+    os.makedirs(upload.directory)
+    state: Dict = {"header_field": b"", "header_value": b"", "headers": {}, "handle": None, "field": None}
+    # (file index, handle, chunk or None to close) waiting to be written off the event loop
+    pending: List[Tuple[int, object, Optional[bytes]]] = []
+    names = set()
+
+    def on_part_begin():
+        state.update(header_field=b"", header_value=b"", headers={}, handle=None, field=None)
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        field = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if filename is None:
+            if len(upload.fields) >= MAX_FIELDS:
+                raise UploadError(f"More than {MAX_FIELDS} form fields")
+            state["field"] = [field, b""]
+            return
+        if len(upload.files) >= max_files:
+            raise UploadTooLarge(f"More than {max_files} files in one upload")
+        # Only the base name is kept, so a crafted file name cannot escape the spool directory
+        name = _UNSAFE_NAME.sub("_", os.path.basename(filename.decode("utf-8", "replace").replace("\\", "/")))
+        name = name.lstrip(".") or "upload"
+        while name in names:
+            name = f"_{name}"
+        names.add(name)
+        path = os.path.join(upload.directory, name)
+        content = state["headers"].get(b"content-type", b"application/octet-stream").decode("latin-1")
+        state["handle"] = open(path, "wb")
+        upload.files.append(SpooledFile(name, path, 0, content))
+
+    def on_part_data(data, start, end):
+        if state["handle"] is not None:
+            pending.append((len(upload.files) - 1, state["handle"], bytes(data[start:end])))
+        elif state["field"] is not None:
+            state["field"][1] += data[start:end]
+            if len(state["field"][1]) > MAX_FIELD_BYTES:
+                raise UploadError(f"Form field {state['field'][0]!r} exceeds {MAX_FIELD_BYTES} bytes")
+
+    def on_part_end():
+        if state["handle"] is not None:
+            pending.append((len(upload.files) - 1, state["handle"], None))
+            state["handle"] = None
+        elif state["field"] is not None:
+            name, value = state["field"]
+            upload.fields[name] = value.decode("utf-8", "replace")
+
+    def flush(writes):
+        for index, handle, data in writes:
+            if data is None:
+                upload.files[index] = upload.files[index]._replace(size=handle.tell())
+                handle.close()
+            else:
+                handle.write(data)
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end
+    })
+    try:
+        async for chunk in stream:
+            upload.received += len(chunk)
+            if upload.received > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            parser.write(chunk)
+            if pending:
+                # File writes happen off the event loop, one batch per received chunk
+                writes, pending[:] = list(pending), []
+                await asyncio.to_thread(flush, writes)
+        parser.finalize()
+        if pending:
+            await asyncio.to_thread(flush, list(pending))
+        if state["handle"] is not None:
+            raise UploadError("Upload ended in the middle of a file")
+    except BaseException:
+        if state["handle"] is not None:
+            state["handle"].close()
+        for _, handle, _ in pending:
+            handle.close()
+        upload.cleanup()
+        raise
+    if not upload.files:
+        upload.cleanup()
+        raise UploadError("No files in the upload")
+    return upload
+
+def sweep_spool(directory: str = UPLOAD_DIR, max_age: float = UPLOAD_SPOOL_TTL) -> int:
+    """Remove spool directories older than max_age; returns how many were removed"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    return removed
@@ -0,0 +1,146 @@
+"""
+Token Usage - Per-request token ledger and per-tenant budgets
+
+Every model call is written to a ledger table with its prompt/completion
+token counts, so usage can be broken down by tenant, mode, audience or
+model. Budgets are enforced from a fixed-window counter per tenant, which
+takes a single primary-key lookup on the request path.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Union
+
+from shared_store import BUDGET_PREFIX, SharedStore
+
+# Default tokens per tenant per window (0 = unlimited); per-tenant overrides as JSON
+TOKEN_BUDGET = int(os.getenv("DOCUGENIUS_TOKEN_BUDGET", "0"))
+TENANT_BUDGETS = json.loads(os.getenv("DOCUGENIUS_TENANT_BUDGETS", "{}"))
+# Accepted X-API-Key values: a JSON list (tenant named by the key's hash) or a {key: tenant name} map.
+# Any other key is billed to the client address, so a made-up key cannot buy a fresh budget
+API_KEYS = json.loads(os.getenv("DOCUGENIUS_API_KEYS", "[]"))
+BUDGET_WINDOW_SECONDS = float(os.getenv("DOCUGENIUS_BUDGET_WINDOW", "86400"))
+# Fraction of the budget after which responses carry a warning
+BUDGET_WARN_RATIO = float(os.getenv("DOCUGENIUS_BUDGET_WARN_RATIO", "0.8"))
+LEDGER_RETENTION_DAYS = float(os.getenv("DOCUGENIUS_LEDGER_RETENTION_DAYS", "30"))
+# Ledger rows older than the retention period are pruned every this many records
+PRUNE_EVERY = 1000
+
+LEDGER_GROUPS = ("tenant", "mode", "audience", "language", "model")
+
+def tenant_id(api_key: Optional[str], client_host: Optional[str],
+              api_keys: Optional[Union[List[str], Dict[str, str]]] = None) -> str:
+    """Tenant for a request: its configured API key, or the client address for a missing or unknown key"""
+    keys = API_KEYS if api_keys is None else api_keys
+    if api_key and api_key in keys:
+        if isinstance(keys, dict) and keys[api_key]:
+            return f"key:{keys[api_key]}"
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return f"ip:{client_host or 'unknown'}"
+
+class BudgetStatus(NamedTuple):
+    tenant: str
+    used: float
+    limit: int  # 0 = unlimited
+    warning: bool
+    exceeded: bool
+
+    @property
+    def remaining(self) -> Optional[float]:
+        return max(self.limit - self.used, 0) if self.limit else None
+
+    def to_dict(self) -> Dict:
+        return {
+            "tenant": self.tenant,
+            "used": self.used,
+            "limit": self.limit or None,
+            "remaining": self.remaining,
+            "warning": self.warning,
+            "window_seconds": BUDGET_WINDOW_SECONDS
+        }
+
+class UsageLedger:
+    """Token accounting persisted in the shared store, with per-tenant budget windows"""
+
+    def __init__(self, store: SharedStore, default_budget: int = TOKEN_BUDGET,
+                 budgets: Optional[Dict[str, int]] = None, window_seconds: float = BUDGET_WINDOW_SECONDS,
+                 warn_ratio: float = BUDGET_WARN_RATIO):
+        self.store = store
+        self.default_budget = default_budget
+        self.budgets = TENANT_BUDGETS if budgets is None else budgets
+        self.window_seconds = window_seconds
+        self.warn_ratio = warn_ratio
+        self._records = 0
+        self.store.connection().executescript("""
+            CREATE TABLE IF NOT EXISTS usage_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                tenant TEXT NOT NULL,
+                result_id TEXT,
+                mode TEXT NOT NULL,
+                audience TEXT NOT NULL,
+                language TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS usage_ledger_created ON usage_ledger (created_at);
+        """)
+
+    def budget_for(self, tenant: str) -> int:
+        return int(self.budgets.get(tenant, self.default_budget))
+
+    def check(self, tenant: str) -> BudgetStatus:
+        """Budget state before a model call; exceeded means the call must be refused"""
+        limit = self.budget_for(tenant)
+        if not limit:
+            return BudgetStatus(tenant, 0, 0, False, False)
+        used = self.store.window_total(BUDGET_PREFIX, tenant, self.window_seconds)
+        return BudgetStatus(tenant, used, limit, used >= limit * self.warn_ratio, used >= limit)
+
+    def record(self, tenant: str, usage, model: str, mode: str, audience: str,
+               language: str, result_id: Optional[str] = None) -> Dict:
+        """Write one model call to the ledger and charge it to the tenant's window"""
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        total_tokens = getattr(usage, "total_tokens", 0) or prompt_tokens + completion_tokens
+        now = time.time()
+        connection = self.store.connection()
+        connection.execute(
+            """INSERT INTO usage_ledger (created_at, tenant, result_id, mode, audience, language, model,
+                                         prompt_tokens, completion_tokens, total_tokens)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (now, tenant, result_id, mode, audience, language, model,
+             prompt_tokens, completion_tokens, total_tokens)
+        )
+        if total_tokens:
+            self.store.add_to_window(BUDGET_PREFIX, tenant, total_tokens, self.window_seconds)
+        self._records += 1
+        if self._records % PRUNE_EVERY == 0:
+            connection.execute("DELETE FROM usage_ledger WHERE created_at < ?",
+                               (now - LEDGER_RETENTION_DAYS * 86400,))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "model": model
+        }
+
+    def summary(self, group_by: str = "tenant", since: Optional[float] = None) -> List[Dict]:
+        """Token totals grouped by a ledger column, largest first"""
+        if group_by not in LEDGER_GROUPS:
+            raise ValueError(f"Unsupported group_by: {group_by} (use one of {', '.join(LEDGER_GROUPS)})")
+        rows = self.store.connection().execute(
+            f"""SELECT {group_by}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(total_tokens)
+                FROM usage_ledger WHERE created_at >= ?
+                GROUP BY {group_by} ORDER BY SUM(total_tokens) DESC""",
+            (since or 0,)
+        ).fetchall()
+        return [
+            {group_by: key, "requests": requests, "prompt_tokens": prompt, "completion_tokens": completion,
+             "total_tokens": total}
+            for key, requests, prompt, completion, total in rows
+        ]
@@ -0,0 +1,184 @@
+"""
+Vector Index - Local hashing embeddings and a memory-mapped dense index
+
+Embeddings are computed locally, with no remote API: the terms, term bigrams
+and character trigrams of a text are hashed with random signs into a fixed
+number of dimensions (a sparse random projection of the bag of features) and
+L2-normalised. Character trigrams make inflections and compound identifiers
+overlap ("cached"/"caching", "rate_limit"/"limiter"), which keyword matching
+misses.
+
+Vectors are stored as one contiguous float32 matrix and memory-mapped for
+search. Small indexes are scanned exhaustively in blocks; above
+IVF_MIN_VECTORS an inverted-file quantizer (spherical k-means centroids, rows
+grouped by list) limits each query to the nprobe closest lists.
+"""
+
+import json
+import math
+import os
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+EMBEDDING_DIM = int(os.getenv("DOCUGENIUS_EMBEDDING_DIM", "256"))
+# Indexes with at least this many vectors get a coarse quantizer
+IVF_MIN_VECTORS = int(os.getenv("DOCUGENIUS_IVF_MIN_VECTORS", "200000"))
+IVF_NPROBE = int(os.getenv("DOCUGENIUS_IVF_NPROBE", "32"))
+KMEANS_ITERATIONS = 10
+# Training sample per list, and rows per block for exhaustive scans and list assignment
+KMEANS_SAMPLE_PER_LIST = 40
+BLOCK_ROWS = 65536
+FEATURE_WEIGHTS = {"term": 1.0, "bigram": 0.5, "trigram": 0.3}
+
+def _signed(feature: str, weight: float, dim: int) -> Tuple[int, float]:
+    digest = zlib.crc32(feature.encode("utf-8"))
+    return digest % dim, -weight if digest & 0x80000000 else weight
+
+@lru_cache(maxsize=1 << 16)
+def _term_features(term: str, dim: int) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """Hashed (indices, signed weights) of a term and its boundary-padded character trigrams"""
+    padded = f"<{term}>"
+    hashed = [_signed(term, FEATURE_WEIGHTS["term"], dim)]
+    hashed += [_signed("#" + padded[i:i + 3], FEATURE_WEIGHTS["trigram"], dim) for i in range(len(padded) - 2)]
+    return tuple(index for index, _ in hashed), tuple(weight for _, weight in hashed)
+
+@lru_cache(maxsize=1 << 16)
+def _bigram_feature(first: str, second: str, dim: int) -> Tuple[int, float]:
+    return _signed(f"{first} {second}", FEATURE_WEIGHTS["bigram"], dim)
+
+class HashingEmbedder:
+    """Deterministic feature-hashing embeddings; identical in every process"""
+
+    def __init__(self, tokenize, dim: int = EMBEDDING_DIM):
+        self.tokenize = tokenize
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 matrix of unit vectors (zero rows for texts with no terms)"""
+        return self.embed_terms([self.tokenize(text) for text in texts])
+
+    def embed_terms(self, documents: List[List[str]]) -> np.ndarray:
+        """embed() for already tokenized texts"""
+        rows, indices, weights, scales = [], [], [], []
+        for row, terms in enumerate(documents):
+            features = [(_term_features(term, self.dim), count) for term, count in Counter(terms).items()]
+            features += [(((index,), (weight,)), count) for (index, weight), count in
+                         Counter(_bigram_feature(first, second, self.dim)
+                                 for first, second in zip(terms, terms[1:])).items()]
+            for (feature_indices, feature_weights), count in features:
+                # Sublinear weighting so one repeated identifier does not dominate
+                size = len(feature_indices)
+                rows.extend([row] * size)
+                indices.extend(feature_indices)
+                weights.extend(feature_weights)
+                scales.extend([1.0 + math.log(count)] * size)
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + np.asarray(indices, dtype=np.int64)
+        values = np.asarray(weights, dtype=np.float64) * np.asarray(scales, dtype=np.float64)
+        matrix = np.bincount(flat, weights=values, minlength=len(documents) * self.dim)
+        matrix = matrix.reshape(len(documents), self.dim).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k columns of each row of scores, highest first"""
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        ids = np.take_along_axis(ids, keep, axis=1)
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+def train_ivf(vectors: np.ndarray, lists: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids from a sample of the (memory-mapped) vectors"""
+    generator = np.random.default_rng(seed)
+    sample_size = min(len(vectors), lists * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(generator.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[generator.choice(sample_size, lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty lists with random sample points
+        sums[empty] = sample[generator.choice(sample_size, int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+def write_vectors(directory: str, batches: Iterable[np.ndarray], dim: int = EMBEDDING_DIM,
+                  ivf_min: int = IVF_MIN_VECTORS):
+    """Stream embedding batches to a float32 matrix file, grouped by IVF list when large enough"""
+    path = os.path.join(directory, "vectors.f32")
+    count = 0
+    with open(path, "wb") as handle:
+        for batch in batches:
+            np.ascontiguousarray(batch, dtype=np.float32).tofile(handle)
+            count += len(batch)
+    meta = {"count": count, "dim": dim, "lists": 0}
+    if count and count >= ivf_min:
+        vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(count, dim))
+        lists = max(1, int(np.sqrt(count)))
+        centroids = train_ivf(vectors, lists)
+        assignment = np.concatenate([np.argmax(np.asarray(vectors[start:start + BLOCK_ROWS]) @ centroids.T, axis=1)
+                                     for start in range(0, count, BLOCK_ROWS)])
+        order = np.argsort(assignment, kind="stable").astype(np.uint32)
+        offsets = np.searchsorted(assignment[order], np.arange(lists + 1)).astype(np.int64)
+        # Rewrite the matrix list by list so each list is one contiguous slice
+        with open(os.path.join(directory, "vectors.ivf.f32"), "wb") as handle:
+            for start in range(0, count, BLOCK_ROWS):
+                np.asarray(vectors[order[start:start + BLOCK_ROWS]]).tofile(handle)
+        del vectors
+        os.replace(os.path.join(directory, "vectors.ivf.f32"), path)
+        np.save(os.path.join(directory, "centroids.npy"), centroids)
+        np.save(os.path.join(directory, "list_offsets.npy"), offsets)
+        np.save(os.path.join(directory, "rows.npy"), order)
+        meta["lists"] = lists
+    with open(os.path.join(directory, "vectors.json"), "w") as handle:
+        json.dump(meta, handle)
+
+class VectorIndex:
+    """Read-only dense index over one generation's passages (row i = passage i without IVF)"""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "vectors.json")) as handle:
+            meta = json.load(handle)
+        self.count, self.dim, self.lists = meta["count"], meta["dim"], meta["lists"]
+        self.vectors = (np.memmap(os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r",
+                                  shape=(self.count, self.dim))
+                        if self.count else np.zeros((0, self.dim), dtype=np.float32))
+        if self.lists:
+            self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+            self.offsets = np.load(os.path.join(directory, "list_offsets.npy"))
+            self.rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = IVF_NPROBE) -> List[List[Tuple[int, float]]]:
+        """(passage number, cosine similarity) pairs, best first, for each query row"""
+        if not self.count or k <= 0:
+            return [[] for _ in range(len(queries))]
+        if self.lists:
+            return [self._search_lists(query, k, nprobe) for query in queries]
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count, BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + BLOCK_ROWS])
+            scores = queries @ block.T
+            ids = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_ids = _top_k(np.concatenate([best_scores, scores], axis=1),
+                                           np.concatenate([best_ids, ids], axis=1), k)
+        return [list(zip(row_ids.tolist(), row_scores.tolist())) for row_ids, row_scores in zip(best_ids, best_scores)]
+
+    def _search_lists(self, query: np.ndarray, k: int, nprobe: int) -> List[Tuple[int, float]]:
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        spans = [(int(self.offsets[n]), int(self.offsets[n + 1])) for n in sorted(nearest)]
+        positions = np.concatenate([np.arange(start, end) for start, end in spans])
+        if not len(positions):
+            return []
+        block = np.concatenate([np.asarray(self.vectors[start:end]) for start, end in spans])
+        scores, ids = _top_k((block @ query)[None, :], positions[None, :], k)
+        return [(int(self.rows[position]), float(score)) for position, score in zip(ids[0], scores[0])]
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Hot Path Benchmark - per-call cost of the backend's CPU-bound helpers, checked against stored baselines
+Run: python benchmarks/bench_hot_paths.py [--save-baseline] [--threshold 0.3] [--filter parse]
+
+Every helper runs in-process over small, medium and pathological inputs (very
+long code, responses with hundreds of code blocks). Each timing is the best of
+several auto-sized batches. Baselines live in benchmarks/baselines/hot_paths.json
+together with the time of a fixed pure-Python calibration workload, and are
+rescaled by the calibration ratio so they carry over between machines. The run
+exits non-zero when a benchmark is slower than its baseline by more than its
+threshold (per-benchmark overrides in the baseline file, else --threshold).
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "hot_paths.json")
+# Default allowed slowdown over the baseline, as a fraction
+THRESHOLD = float(os.getenv("DOCUGENIUS_BENCH_THRESHOLD", "0.3"))
+# Slowdowns below this many microseconds are timer noise, whatever the ratio
+NOISE_FLOOR_US = 1.0
+REPEATS = 5
+
+sys.path.append(os.path.join(ROOT, "backend"))
+# Importing the app opens the shared store; keep it away from the real one
+os.environ.setdefault("DOCUGENIUS_SHARED_STORE", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+os.environ.setdefault("DOCUGENIUS_RAG_SOURCES", "")
+
+SMALL_QUERY = "def fibonacci(n):\n    if n <= 1:\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)"
+MEDIUM_QUERY = "\n\n".join(
+    f"class Repository{i}:\n"
+    f"    def __init__(self, session):\n"
+    f"        self.session = session\n\n"
+    f"    def find(self, key):\n"
+    f"        for row in self.session.query(Model{i}).filter_by(key=key):\n"
+    f"            if row.active:\n"
+    f"                return row\n"
+    f"        return None"
+    for i in range(10)
+)
+# ~200 KB: the largest file repository jobs accept
+PATHOLOGICAL_QUERY = "\n\n".join(
+    f"function handler{i}(request, retries = 3) {{\n"
+    f"    for (let attempt = 0; attempt < retries; attempt++) {{\n"
+    f"        if (request.id === {i} && attempt > 0) {{ return {{ status: 'retry', attempt }}; }}\n"
+    f"    }}\n"
+    f"    return null;\n"
+    f"}}"
+    for i in range(1400)
+)
+
+def model_response(steps, code_blocks, block_lines, prose):
+    """A model answer in the shape the section parser expects"""
+    parts = ["Explanation: This code memoizes a recursive Python function so repeated calls are served "
+             "from a dictionary instead of recomputing them. " * prose, "", "Breakdown:"]
+    parts.extend(f"{i}. Step {i} checks the cache, computes the value when missing and stores it "
+                 f"for the JavaScript and React examples below." for i in range(1, steps + 1))
+    parts.append("Code analysis:")
+    for block in range(code_blocks):
+        parts.append("```python")
+        parts.extend(f"    value_{block}_{line} = cache.get(key_{line}) or compute(key_{line})"
+                     for line in range(block_lines))
+        parts.append("```")
+    parts.append("See the Python Documentation, MDN Web Docs, Real Python and Stack Overflow for the API "
+                 "and DOM details.")
+    return "\n".join(parts)
+
+QUERIES = {"small": SMALL_QUERY, "medium": MEDIUM_QUERY, "pathological": PATHOLOGICAL_QUERY}
+RESPONSES = {
+    "small": model_response(steps=5, code_blocks=1, block_lines=4, prose=1),
+    "medium": model_response(steps=15, code_blocks=6, block_lines=12, prose=4),
+    "pathological": model_response(steps=400, code_blocks=300, block_lines=20, prose=60),
+}
+
+def calibration():
+    """Fixed pure-Python workload (string building, dict and list churn) used to rescale baselines"""
+    counts = {}
+    for i in range(2000):
+        word = f"token{i % 97}"
+        counts[word] = counts.get(word, 0) + len(word.upper())
+    return sorted(counts.items(), key=lambda item: -item[1])
+
+def benchmarks():
+    """Name -> zero-argument callable; imports the backend lazily so --help stays fast"""
+    import main as backend
+    from exporters import render_pdf
+    from language_detection import detect_language
+
+    cases = {
+        "create_system_prompt": lambda: backend.create_system_prompt("explain_code", "intermediate"),
+        "create_user_prompt/plain": lambda: backend.create_user_prompt(MEDIUM_QUERY, language="python"),
+        "create_user_prompt/analysis+context": lambda: backend.create_user_prompt(
+            MEDIUM_QUERY, language="python", analysis_summary="Functions: find (lines 5-9, O(n))",
+            context="[1] docs/repository.md: Repositories wrap a session. " * 20),
+    }
+    for size, query in QUERIES.items():
+        cases[f"detect_language/{size}"] = lambda query=query: detect_language(query)
+    results = {}
+    for size, content in RESPONSES.items():
+        explanation, breakdown, code_analysis = backend.parse_sections(content)
+        results[size] = backend.DocuGeniusResponse(
+            explanation=explanation, breakdown=breakdown, code_analysis=code_analysis, generation_time=3.2,
+            external_resources=backend.extract_external_resources(content), result_id="0" * 32,
+            language="python", language_candidates=[{"language": "python", "confidence": 0.97}])
+    for size, content in RESPONSES.items():
+        cases[f"parse_sections/{size}"] = lambda content=content: backend.parse_sections(content)
+    for size, content in RESPONSES.items():
+        cases[f"extract_external_resources/{size}"] = (
+            lambda content=content: backend.extract_external_resources(content))
+    for size, response in results.items():
+        cases[f"response_json/{size}"] = lambda response=response: response.model_dump_json()
+    for size, response in results.items():
+        cases[f"render_pdf/{size}"] = lambda result=response.model_dump(): render_pdf(result)
+    return cases
+
+def measure(function, repeats=REPEATS):
+    """Best per-call time in microseconds over repeats batches sized to ~0.2 s each"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / number * 1e6
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+def main():
+    parser = argparse.ArgumentParser(description="DocuGenius hot path benchmark")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, help=f"Allowed slowdown fraction (default {THRESHOLD})")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    print("🔥 DocuGenius Hot Path Benchmark")
+    print("=" * 78)
+    calibration_us = measure(calibration)
+    scale = calibration_us / baseline["calibration_us"] if baseline else 1.0
+    print(f"calibration {calibration_us:.1f} µs" + (f" ({scale:.2f}x baseline machine)" if baseline else ""))
+
+    results = {}
+    failures = []
+    for name, function in benchmarks().items():
+        if args.filter not in name:
+            continue
+        elapsed = results[name] = measure(function)
+        line = f"   {name:<42} {elapsed:12.1f} µs"
+        if baseline and not args.save_baseline and name in baseline["results"]:
+            default = args.threshold if args.threshold is not None else baseline.get("threshold", THRESHOLD)
+            threshold = baseline.get("thresholds", {}).get(name, default)
+            expected = baseline["results"][name] * scale
+            change = elapsed / expected - 1
+            regressed = change > threshold and elapsed - expected > NOISE_FLOOR_US
+            line += f"   {change:+7.1%} (limit +{threshold:.0%}){'  ❌' if regressed else ''}"
+            if regressed:
+                failures.append(name)
+        print(line)
+
+    if args.save_baseline:
+        stored = baseline or {"threshold": THRESHOLD if args.threshold is None else args.threshold, "thresholds": {}}
+        if baseline and args.filter:
+            # A filtered run only replaces its own entries, rescaled to the stored calibration
+            results = {**baseline["results"], **{name: elapsed / scale for name, elapsed in results.items()}}
+        else:
+            stored["calibration_us"] = calibration_us
+        stored["results"] = results
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as handle:
+            json.dump(stored, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+        print(f"📝 Baseline written to {args.baseline}")
+
+    print("=" * 78)
+    if failures:
+        print(f"❌ Slower than baseline: {', '.join(failures)}")
+        sys.exit(1)
+    print("✅ No hot path regressed" if baseline and not args.save_baseline else "✅ Done")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Language Detection Benchmark - accuracy on a labeled corpus and throughput on large inputs
+Run: python benchmarks/bench_language_detection.py
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from language_detection import detect_language, detect_languages
+
+# Labeled snippets, including the cases the old first-match detector got wrong
+CORPUS = [
+    ("python", "def fibonacci(n):\n    if n <= 1:\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)"),
+    ("python", "import os\nfrom typing import List\n\nclass Loader:\n    def __init__(self, path):\n        self.path = path\n"),
+    ("python", "result = [x * 2 for x in items if x is not None]\nprint(len(result))\nsquare = lambda v: v * v\n"),
+    ("python", "try:\n    value = int(raw)\nexcept ValueError:\n    value = None\nelif_count = 0\n"),
+    ("python", "import numpy as np\nnp.zeros(3)"),
+    ("python", "for i in range(10):\n    print(i)"),
+    ("python", "col1, col2, col3 = st.columns(3)\nwith col1:\n    st.metric('Generation Time', '3.4s')\nwith col2:\n    st.metric('Confidence', '90%')"),
+    ("javascript", "function processData(data, callback) {\n    console.log('Processing:', data);\n    callback(data);\n}"),
+    ("javascript", "const express = require('express');\nconst app = express();\napp.get('/', (req, res) => res.send('ok'));\n"),
+    ("javascript", "let total = 0;\nfor (const item of items) {\n  if (item.price !== undefined) total += item.price;\n}\n"),
+    ("javascript", "document.getElementById('btn').addEventListener('click', function () {\n  window.alert('hi');\n});\n"),
+    ("typescript", "interface User {\n  id: number;\n  name: string;\n}\n\nconst users: User[] = [];\n"),
+    ("typescript", "type Handler = (event: string) => void;\nexport function on(name: string, handler: Handler): void {}\n"),
+    ("typescript", "class Service {\n  private readonly cache: Map<string, number> = new Map();\n  constructor(private http: HttpClient) {}\n}\n"),
+    ("typescript", "import { Component } from '@angular/core';\nlet count: number = 0;\nfunction add(a: number, b: number): number { return a + b; }\n"),
+    ("java", "public class Main {\n    public static void main(String[] args) {\n        System.out.println(\"Hello\");\n    }\n}"),
+    ("java", "package com.example;\n\nimport java.util.List;\n\npublic class Repo implements Store {\n    @Override\n    public void save() {}\n}\n"),
+    ("java", "List<String> names = new ArrayList<>();\nfor (String name : names) {\n    System.out.printf(\"%s%n\", name);\n}\n"),
+    ("csharp", "using System;\n\nnamespace Demo\n{\n    public class Program\n    {\n        public static void Main(string[] args)\n        {\n            Console.WriteLine(\"Hi\");\n        }\n    }\n}"),
+    ("csharp", "public class Person\n{\n    public string Name { get; set; }\n    public int Age { get; private set; }\n}\n"),
+    ("csharp", "public async Task<int> LoadAsync()\n{\n    var client = new HttpClient();\n    foreach (var item in items) { }\n    return 0;\n}\n"),
+    ("rust", "fn main() {\n    let mut count = 0;\n    println!(\"{}\", count);\n}"),
+    ("rust", "use std::collections::HashMap;\n\nimpl Cache {\n    pub fn get(&self, key: &str) -> Option<&String> {\n        self.map.get(key)\n    }\n}\n"),
+    ("rust", "let values: Vec<i32> = vec![1, 2, 3];\nmatch values.first() {\n    Some(v) => println!(\"{}\", v),\n    None => {}\n}\n"),
+    ("go", "package main\n\nimport \"fmt\"\n\nfunc main() {\n    fmt.Println(\"hello\")\n}"),
+    ("go", "type Server struct {\n    addr string\n}\n\nfunc (s *Server) Start() error {\n    conn, err := net.Listen(\"tcp\", s.addr)\n    if err != nil {\n        return err\n    }\n    return nil\n}\n"),
+    ("go", "ch := make(chan int)\ngo func() { ch <- 1 }()\nvalue := <-ch\n"),
+    ("cpp", "#include <iostream>\n\nint main() {\n    std::cout << \"Hello\" << std::endl;\n    return 0;\n}"),
+    ("cpp", "template <typename T>\nclass Stack {\n    std::vector<T> items;\npublic:\n    void push(const T& item) { items.push_back(item); }\n};\n"),
+    ("cpp", "auto ptr = std::make_unique<Node>();\nptr->next = nullptr;\n"),
+    ("text", "What is DOM manipulation and how does it work?"),
+    ("text", "What are React hooks and why are they useful?"),
+    ("text", "Explain the difference between a process and a thread in simple terms."),
+    ("text", "For each item in the list:\nwith the following steps, print the result."),
+]
+
+def legacy_detect_language(text):
+    """The original UI detector: first loose match wins, patterns recompiled per call"""
+    patterns = {
+        'python': [r'def\s+\w+\s*\(', r'import\s+\w+', r'from\s+\w+\s+import', r'class\s+\w+'],
+        'javascript': [r'function\s+\w+\s*\(', r'const\s+\w+\s*=', r'let\s+\w+\s*=', r'var\s+\w+\s*='],
+        'java': [r'public\s+class', r'import\s+java', r'System\.out\.println'],
+        'typescript': [r'interface\s+\w+', r'type\s+\w+', r'const\s+\w+:\s*\w+'],
+        'rust': [r'fn\s+\w+\s*\(', r'let\s+\w+:\s*\w+'],
+        'go': [r'func\s+\w+\s*\(', r'package\s+main'],
+        'cpp': [r'#include', r'int\s+main\s*\('],
+        'csharp': [r'using\s+System', r'public\s+class'],
+    }
+    for lang, patterns_list in patterns.items():
+        for pattern in patterns_list:
+            if re.search(pattern, text, re.IGNORECASE):
+                return lang
+    return 'text'
+
+def accuracy(detector):
+    misses = [(label, detector(code), code) for label, code in CORPUS if detector(code) != label]
+    return 1 - len(misses) / len(CORPUS), misses
+
+def throughput(detector, text, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        detector(text)
+    elapsed = (time.perf_counter() - started) / repeat
+    return elapsed, len(text) / elapsed / 1e6
+
+def main():
+    print("🔍 Language Detection Benchmark")
+    print("=" * 60)
+
+    for name, detector in (("legacy", legacy_detect_language), ("compiled", detect_language)):
+        score, misses = accuracy(detector)
+        print(f"{name:>9} accuracy: {score:.1%} ({len(CORPUS) - len(misses)}/{len(CORPUS)})")
+        for label, detected, code in misses:
+            print(f"           ❌ expected {label}, got {detected}: {code.splitlines()[0][:50]!r}")
+
+    print("-" * 60)
+    for language in ("python", "typescript", "csharp"):
+        snippets = [code for label, code in CORPUS if label == language]
+        large = "\n".join(snippets * (5000 // sum(code.count("\n") + 1 for code in snippets) + 1))
+        lines = large.count("\n") + 1
+        for name, detector in (("legacy", legacy_detect_language), ("compiled", detect_language)):
+            elapsed, mb_per_s = throughput(detector, large)
+            print(f"{language:>10} {lines} lines {name:>9}: {elapsed * 1000:7.1f} ms  ({mb_per_s:.1f} MB/s)"
+                  f"  -> {detector(large)}")
+        print(f"{'':>10} ranked: {detect_languages(large)}")
+
+if __name__ == "__main__":
+    main()
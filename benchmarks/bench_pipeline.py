@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Pipeline Benchmark - the whole /ask/ path replayed offline from recorded model responses
+Run: python benchmarks/bench_pipeline.py [--record] [--time-scale 0] [--rounds 5] [--update-expected]
+
+--record sends the corpus to the real API once (OPENAI_API_KEY required) and
+writes the cassette plus the parsed answers. Without it, every request is
+answered from the cassette, so the run is deterministic and free: per-stage
+timings come from the Server-Timing header, and the run exits non-zero when a
+parsed answer differs from the recorded one (parser regressions) or a prompt
+has no recording (prompt construction changed; record again).
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASSETTE_DIR = os.path.join(ROOT, "benchmarks", "cassettes")
+CASSETTE = os.path.join(CASSETTE_DIR, "pipeline.jsonl")
+EXPECTED = os.path.join(CASSETTE_DIR, "pipeline.expected.json")
+# Parsed fields compared against the recording
+COMPARED_FIELDS = ("explanation", "breakdown", "code_analysis", "external_resources")
+
+sys.path.append(os.path.join(ROOT, "backend"))
+
+LONG_MODULE = "\n\n".join(
+    f"def handler_{i}(request, retries=3):\n"
+    f"    for attempt in range(retries):\n"
+    f"        if request.get('id') == {i} and attempt > 0:\n"
+    f"            return {{'status': 'retry', 'attempt': attempt}}\n"
+    f"    return None"
+    for i in range(150)
+)
+
+def corpus():
+    """(name, /ask/ body) pairs: the preset examples for every audience, plus one very long input"""
+    from examples import EXAMPLES
+    cases = []
+    for example in EXAMPLES:
+        mode = "explain_concept" if example["category"] == "Concept Explanation" else "explain_code"
+        for audience in ("beginner", "intermediate", "expert"):
+            cases.append((f"{example['title']} / {audience}",
+                          {"query": example["prompt"], "mode": mode, "audience": audience}))
+    cases.append(("Long module / expert", {"query": LONG_MODULE, "mode": "explain_code", "audience": "expert"}))
+    return cases
+
+def configure(mode, time_scale):
+    """Environment for an isolated backend; must run before main is imported"""
+    os.environ.update({
+        "DOCUGENIUS_LLM_CASSETTE_MODE": mode,
+        "DOCUGENIUS_LLM_CASSETTE": CASSETTE,
+        "DOCUGENIUS_REPLAY_TIME_SCALE": str(time_scale),
+        "DOCUGENIUS_SHARED_STORE": os.path.join(tempfile.mkdtemp(), "bench.sqlite3"),
+        # Every request must reach the model client, and prompts must not depend on local docs
+        "DOCUGENIUS_CACHE_TTL": "0",
+        "DOCUGENIUS_PREWARM": "false",
+        "DOCUGENIUS_RAG_SOURCES": "",
+        "DOCUGENIUS_RATE_LIMIT_PER_MINUTE": "0",
+        "DOCUGENIUS_TRACING": "true",
+    })
+
+def parse_server_timing(header):
+    stages = {}
+    for metric in header.split(","):
+        name, _, duration = metric.strip().partition(";dur=")
+        if duration:
+            stages[name] = stages.get(name, 0.0) + float(duration)
+    return stages
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="DocuGenius replayed pipeline benchmark")
+    parser.add_argument("--record", action="store_true", help="Call the real API and write a new cassette")
+    parser.add_argument("--time-scale", type=float, default=0.0,
+                        help="Replay latency multiplier (1 = recorded timing, 0 = pipeline cost only)")
+    parser.add_argument("--rounds", type=int, default=5, help="Passes over the corpus when replaying")
+    parser.add_argument("--update-expected", action="store_true",
+                        help="Accept the replayed answers as the new expected output")
+    args = parser.parse_args()
+
+    if args.record:
+        if not os.getenv("OPENAI_API_KEY"):
+            sys.exit("❌ --record needs OPENAI_API_KEY")
+        os.makedirs(CASSETTE_DIR, exist_ok=True)
+        open(CASSETTE, "w").close()
+    elif not os.path.exists(CASSETTE):
+        sys.exit(f"❌ No cassette at {CASSETTE}; run with --record first")
+    configure("record" if args.record else "replay", args.time_scale)
+
+    from fastapi.testclient import TestClient
+    import main as backend
+
+    cases = corpus()
+    rounds = 1 if args.record else args.rounds
+    print(f"🎞️  DocuGenius Pipeline Benchmark ({'recording' if args.record else 'replay'}, "
+          f"{len(cases)} requests x {rounds} rounds, time scale {args.time_scale:g})")
+    print("=" * 60)
+
+    latencies = []
+    stages = {}
+    answers = {}
+    failures = []
+    # The backend logs every model response to stdout
+    with TestClient(backend.app) as client, open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+        for _ in range(rounds):
+            for name, body in cases:
+                started = time.perf_counter()
+                response = client.post("/ask/", json=body)
+                latencies.append(time.perf_counter() - started)
+                for stage, milliseconds in parse_server_timing(response.headers.get("Server-Timing", "")).items():
+                    stages.setdefault(stage, []).append(milliseconds)
+                result = response.json()
+                if not result.get("success"):
+                    failures.append(f"{name}: {result.get('message')}")
+                answers[name] = {field: result.get(field) for field in COMPARED_FIELDS}
+
+    print(f"/ask/ round trip: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms")
+    for stage, values in stages.items():
+        print(f"   {stage:<12} mean {statistics.mean(values):8.2f} ms   p95 {percentile(values, 0.95):8.2f} ms")
+
+    if args.record or args.update_expected:
+        with open(EXPECTED, "w") as handle:
+            json.dump(answers, handle, indent=2, sort_keys=True)
+        print(f"📝 Expected answers written to {EXPECTED}")
+    elif os.path.exists(EXPECTED):
+        with open(EXPECTED) as handle:
+            expected = json.load(handle)
+        failures.extend(f"{name}: parsed answer changed" for name, answer in answers.items()
+                        if name in expected and expected[name] != answer)
+
+    print("=" * 60)
+    if failures:
+        print("❌ " + "\n❌ ".join(failures))
+        sys.exit(1)
+    print("✅ All replayed answers match")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Response Encoding Benchmark - JSON serialization cost and bytes on the wire
+Run: python benchmarks/bench_responses.py
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from typing import List, Optional
+
+import encoding
+from encoding import compress, dumps
+
+# Mirrors DocuGeniusResponse without importing the app (and its shared store)
+class Response(BaseModel):
+    success: bool = True
+    explanation: str
+    breakdown: List[str]
+    code_analysis: List[str] = []
+    confidence: float = 0.9
+    generation_time: float
+    message: str = ""
+    external_resources: List[dict] = []
+    result_id: Optional[str] = None
+    language: str = "text"
+    language_candidates: List[dict] = []
+    static_analysis: Optional[dict] = None
+    prompt_compaction: Optional[dict] = None
+    cached: bool = False
+
+CODE_BLOCK = (
+    "```python\n"
+    "def merge_sort(items):\n"
+    "    if len(items) <= 1:\n"
+    "        return items\n"
+    "    middle = len(items) // 2\n"
+    "    left, right = merge_sort(items[:middle]), merge_sort(items[middle:])\n"
+    "    return merge(left, right)\n"
+    "```"
+)
+
+def make_response(code_blocks, breakdown_steps, functions):
+    return Response(
+        explanation="Merge sort splits the list in half, sorts each half recursively and merges them. " * 12,
+        breakdown=[f"Step {i}: the function compares the heads of both halves and appends the smaller one, "
+                   f"keeping the merge stable for equal keys." for i in range(breakdown_steps)],
+        code_analysis=[CODE_BLOCK] * code_blocks,
+        generation_time=3.2,
+        result_id="0" * 32,
+        language="python",
+        language_candidates=[{"language": "python", "confidence": 0.97}, {"language": "text", "confidence": 0.03}],
+        static_analysis={
+            "functions": [{"name": f"helper_{i}", "lineno": i * 7, "loop_depth": 2, "cyclomatic_complexity": 4,
+                           "time_complexity": "O(n^2) (nested loops)", "calls": ["merge", "len"]}
+                          for i in range(functions)],
+            "call_graph": {f"helper_{i}": ["merge", "len"] for i in range(functions)}
+        },
+        external_resources=[{"name": "Python Documentation", "url": "https://docs.python.org/3/"}] * 4
+    )
+
+CASES = {
+    "typical": make_response(code_blocks=4, breakdown_steps=8, functions=6),
+    "worst-case": make_response(code_blocks=120, breakdown_steps=200, functions=300),
+}
+
+def fastapi_default(model):
+    # What FastAPI does for an endpoint returning a model without response_model
+    return json.dumps(jsonable_encoder(model), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+def timed(function, *args, repeat=None):
+    repeat = repeat or 200
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return (time.perf_counter() - started) / repeat, result
+
+def main():
+    print("📦 Response Encoding Benchmark")
+    print(f"   orjson: {'yes' if encoding.orjson else 'no'}, brotli: {'yes' if encoding.brotli else 'no'}")
+    print("=" * 60)
+
+    for name, model in CASES.items():
+        payload = model.model_dump()
+        repeat = 500 if name == "typical" else 20
+        print(f"{name}:")
+        serializers = [
+            ("jsonable_encoder + json", fastapi_default, model),
+            ("model_dump_json", dumps, model),
+            ("dict via dumps()", dumps, payload),
+        ]
+        for label, function, argument in serializers:
+            elapsed, body = timed(function, argument, repeat=repeat)
+            print(f"   {label:<24} {elapsed * 1e6:9.1f} µs  {len(body):>9,} bytes")
+
+        body = dumps(model)
+        codings = ["gzip"] + (["br"] if encoding.brotli else [])
+        for coding in codings:
+            elapsed, compressed = timed(compress, body, coding, repeat=repeat)
+            print(f"   {coding + ' (wire)':<24} {elapsed * 1e6:9.1f} µs  {len(compressed):>9,} bytes"
+                  f"  ({len(compressed) / len(body):.1%} of identity)")
+        print()
+
+if __name__ == "__main__":
+    main()
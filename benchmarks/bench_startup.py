@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark - import-time profile, backend time-to-ready and UI time-to-first-render
+Run: python benchmarks/bench_startup.py [--report docs/import_profile.md]
+
+Exits non-zero when a startup budget is exceeded.
+"""
+
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+UI_DIR = os.path.join(ROOT, "streamlit-ui")
+
+# Default budgets in seconds
+READY_BUDGET = 5.0
+FIRST_RENDER_BUDGET = 5.0
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+def _top_level_imports(cwd, statement, level):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    imports = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 2 * level - 1:
+            imports.append((int(match.group(2)) / 1e6, match.group(4)))
+    return imports
+
+def import_profile(cwd, statement, level=1, top_n=10):
+    """Import time of a statement (excluding interpreter startup) and its slowest imports at a nesting level"""
+    startup = {module for _, module in _top_level_imports(cwd, "pass", 1)}
+    total = sum(seconds for seconds, module in _top_level_imports(cwd, statement, 1) if module not in startup)
+    imports = [entry for entry in _top_level_imports(cwd, statement, level) if entry[1] not in startup]
+    return total, sorted(imports, reverse=True)[:top_n]
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def backend_time_to_ready(timeout=30.0):
+    """Seconds from process start until /health/ready answers 200
+
+    /health/ is the liveness probe and answers at once; readiness also waits for
+    the background OpenAI import and the shared-store check.
+    """
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        delay = 0.01
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"backend exited with code {process.returncode}")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+        raise RuntimeError("backend did not become ready in time")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def ui_time_to_first_render():
+    """Seconds to run the Streamlit script once (default page) in a fresh process"""
+    script = (
+        "import time; started = time.perf_counter()\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        "app = AppTest.from_file('app.py', default_timeout=60).run()\n"
+        "assert not app.exception, app.exception\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=UI_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+def write_report(path, profiles):
+    lines = [
+        "# Import-Time Profile",
+        "",
+        "Generated by `python benchmarks/bench_startup.py --report docs/import_profile.md`",
+        "(`python -X importtime`, cumulative seconds, interpreter startup excluded).",
+        ""
+    ]
+    for name, (total, top) in profiles.items():
+        lines.extend([f"## {name}", "", f"Total: **{total:.3f}s**", "", "| Module | Cumulative (s) |", "|---|---|"])
+        lines.extend(f"| `{module}` | {seconds:.3f} |" for seconds, module in top)
+        lines.append("")
+    with open(path, "w") as report:
+        report.write("\n".join(lines))
+
+def main():
+    parser = argparse.ArgumentParser(description="DocuGenius startup benchmark")
+    parser.add_argument("--ready-budget", type=float, default=READY_BUDGET)
+    parser.add_argument("--render-budget", type=float, default=FIRST_RENDER_BUDGET)
+    parser.add_argument("--report", help="Write the import-time profile as Markdown to this path")
+    parser.add_argument("--skip-ui", action="store_true", help="Skip the Streamlit first-render check")
+    args = parser.parse_args()
+
+    print("⏱️  DocuGenius Startup Benchmark")
+    print("=" * 60)
+
+    profiles = {"Backend (`import main`)": import_profile(BACKEND_DIR, "import main", level=2)}
+    if not args.skip_ui:
+        profiles["Streamlit UI (module imports of `app.py`)"] = import_profile(
+            UI_DIR, "import ast, os; "
+            "tree = ast.parse(open('app.py').read()); "
+            "exec(compile(ast.Module([n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))], []), "
+            "'app.py', 'exec'), "
+            "{'__file__': os.path.abspath('app.py'), '__name__': 'app'})"
+        )
+    for name, (total, top) in profiles.items():
+        print(f"{name}: {total:.3f}s")
+        for seconds, module in top[:5]:
+            print(f"    {seconds:.3f}s  {module}")
+    if args.report:
+        write_report(args.report, profiles)
+        print(f"📝 Report written to {args.report}")
+
+    failures = []
+    ready = backend_time_to_ready()
+    print(f"Backend time-to-ready: {ready:.3f}s (budget {args.ready_budget:.1f}s)")
+    if ready > args.ready_budget:
+        failures.append("backend time-to-ready")
+
+    if not args.skip_ui:
+        render = ui_time_to_first_render()
+        print(f"UI time-to-first-render: {render:.3f}s (budget {args.render_budget:.1f}s)")
+        if render > args.render_budget:
+            failures.append("UI time-to-first-render")
+
+    print("=" * 60)
+    if failures:
+        print(f"❌ Budget exceeded: {', '.join(failures)}")
+        sys.exit(1)
+    print("✅ All startup budgets met")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 """
 Simple Backend Startup Script
-Run: python start_backend.py
+Run: python start_backend.py [--workers N]
 """
 
+import argparse
 import subprocess
 import sys
 import os
 
 def main():
+    parser = argparse.ArgumentParser(description="Start the DocuGenius backend")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("DOCUGENIUS_WORKERS", "1")),
+                        help="Number of uvicorn worker processes (default: 1)")
+    args = parser.parse_args()
+
     print("🚀 Starting DocuGenius Backend...")
     print("=" * 50)
     
@@ -37,7 +43,7 @@ def main():
     print("Press Ctrl+C to stop the server")
     print("-" * 50)
     
-    subprocess.run([sys.executable, "main.py"])
+    subprocess.run([sys.executable, "main.py"], env={**os.environ, "DOCUGENIUS_WORKERS": str(args.workers)})
 
 if __name__ == "__main__":
     main()
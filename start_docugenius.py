@@ -1,81 +1,196 @@
 #!/usr/bin/env python3
 """
 DocuGenius Master Startup Script
-Just run: python start_docugenius.py
+Just run: python start_docugenius.py [--workers N]
 
-This will start both the backend API and React frontend!
+Starts the backend API and the Streamlit UI in parallel as supervised
+subprocesses, waits for each one's readiness endpoint, restarts components
+that crash and stops everything cleanly on Ctrl+C.
 """
 
+import argparse
+import os
+import signal
+import socket
 import subprocess
 import sys
-import os
-import time
 import threading
-import socket
+import time
+
 import requests
 
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Readiness polling backoff, in seconds
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 1.0
+READY_TIMEOUT = 120.0
+# Crash handling
+MAX_RESTARTS = 5
+RESTART_WINDOW = 300.0  # Restart count resets after this long without a crash
+STOP_TIMEOUT = 10.0
+
 def is_port_in_use(port):
     """Check if a port is already in use"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('localhost', port)) == 0
 
-def start_backend():
-    """Start the backend API server"""
-    print("🚀 Starting DocuGenius Backend...")
-    backend_path = os.path.join(os.getcwd(), "backend")
-    os.chdir(backend_path)
-    subprocess.run([sys.executable, "main.py"])
+def wait_until_ready(url, process, stop_event, timeout=READY_TIMEOUT):
+    """Poll url with exponential backoff until it answers 200; False if the process dies or time runs out"""
+    deadline = time.monotonic() + timeout
+    delay = POLL_INITIAL_DELAY
+    while time.monotonic() < deadline and not stop_event.is_set():
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        stop_event.wait(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+    return False
+
+class Component:
+    """A child process with a readiness URL, restarted when it crashes"""
+
+    def __init__(self, name, command, cwd, port, ready_path, env=None):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.port = port
+        self.ready_url = f"http://localhost:{port}{ready_path}"
+        self.env = {**os.environ, **(env or {})}
+        self.process = None
+        self.restarts = []
+        self.failed = False
+
+    def start(self):
+        # Each child gets its own working directory; the launcher never chdirs
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env)
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"⚠️  {self.name} did not stop in {STOP_TIMEOUT:.0f}s, killing it")
+            self.process.kill()
+            self.process.wait()
 
-def start_frontend():
-    """Start the React frontend"""
-    print("🎨 Starting DocuGenius Frontend...")
-    frontend_path = os.path.join(os.getcwd(), "ui-react")
-    os.chdir(frontend_path)
-    subprocess.run(["npm", "run", "dev"])
+    def supervise(self, stop_event):
+        """Start, wait for readiness, and restart on crashes until stop_event is set"""
+        while not stop_event.is_set():
+            started = time.monotonic()
+            self.start()
+            if wait_until_ready(self.ready_url, self.process, stop_event):
+                print(f"✅ {self.name} ready in {time.monotonic() - started:.2f}s at http://localhost:{self.port}")
+            elif stop_event.is_set():
+                return
+            elif self.process.poll() is None:
+                print(f"❌ {self.name} not ready after {READY_TIMEOUT:.0f}s")
+                self.stop()
+
+            while not stop_event.is_set() and self.process.poll() is None:
+                stop_event.wait(0.5)
+            if stop_event.is_set():
+                return
+
+            now = time.monotonic()
+            self.restarts = [t for t in self.restarts if now - t < RESTART_WINDOW] + [now]
+            if len(self.restarts) > MAX_RESTARTS:
+                print(f"❌ {self.name} crashed {MAX_RESTARTS} times in {RESTART_WINDOW:.0f}s, giving up")
+                self.failed = True
+                stop_event.set()
+                return
+            backoff = min(2 ** (len(self.restarts) - 1), 30)
+            print(f"🔁 {self.name} exited with code {self.process.returncode}, restarting in {backoff}s...")
+            stop_event.wait(backoff)
 
 def main():
+    parser = argparse.ArgumentParser(description="Start DocuGenius")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("DOCUGENIUS_WORKERS", "1")),
+                        help="Number of backend worker processes (default: 1)")
+    parser.add_argument("--backend-only", action="store_true", help="Start only the backend API")
+    args = parser.parse_args()
+
     print("🌟 DocuGenius - AI-Powered Technical Documentation Generator")
     print("=" * 60)
-    
-    # Get the absolute path to the project root
-    project_root = os.path.dirname(os.path.abspath(__file__))
-    os.chdir(project_root)
-    
+
     # Check if we're in the right directory
-    if not os.path.exists("backend/main.py") or not os.path.exists("ui-react/package.json"):
+    backend_dir = os.path.join(PROJECT_ROOT, "backend")
+    ui_dir = os.path.join(PROJECT_ROOT, "streamlit-ui")
+    if not os.path.exists(os.path.join(backend_dir, "main.py")) or not os.path.exists(os.path.join(ui_dir, "app.py")):
         print("❌ Error: Required files not found!")
-        print(f"   Current directory: {os.getcwd()}")
-        print("   Required: backend/main.py and ui-react/package.json")
-        print("   Make sure you're in the DocuGenius root directory")
+        print("   Required: backend/main.py and streamlit-ui/app.py")
         sys.exit(1)
-    
-    print("🔑 OpenAI API Key: Already embedded in code!")
-    print("📦 Dependencies: Already installed!")
-    print(f"📁 Project root: {project_root}")
+
+    if not os.getenv("OPENAI_API_KEY"):
+        print("⚠️  OPENAI_API_KEY is not set; generation requests will fail")
+    print(f"📁 Project root: {PROJECT_ROOT}")
     print("=" * 60)
-    
-    # Check if backend is already running
-    if is_port_in_use(8000):
-        print("✅ Backend is already running on port 8000")
-        print("🌐 Backend available at: http://localhost:8000")
-    else:
-        # Start backend in a separate thread
-        print("🚀 Starting new backend instance...")
-        backend_thread = threading.Thread(target=start_backend, daemon=True)
-        backend_thread.start()
-        
-        # Wait a bit for backend to start
-        print("⏳ Waiting for backend to start...")
-        time.sleep(5)
-    
-    # Check if frontend is already running
-    if is_port_in_use(3000):
-        print("✅ Frontend is already running on port 3000")
-        print("🌐 Frontend available at: http://localhost:3000")
-    else:
-        # Start frontend in main thread
-        print("🎨 Starting React frontend...")
-        start_frontend()
+
+    components = [
+        Component("Backend", [sys.executable, "main.py"], backend_dir, 8000, "/health/ready",
+                  env={"DOCUGENIUS_WORKERS": str(args.workers)}),
+    ]
+    if not args.backend_only:
+        components.append(Component(
+            "Streamlit UI",
+            [sys.executable, "-m", "streamlit", "run", "app.py", "--server.port", "8501", "--server.headless", "true"],
+            ui_dir, 8501, "/_stcore/health"
+        ))
+
+    # Reuse components that are already running instead of starting a second copy
+    supervised = []
+    for component in components:
+        if is_port_in_use(component.port):
+            print(f"✅ {component.name} is already running on port {component.port}")
+        else:
+            supervised.append(component)
+    if not supervised:
+        return
+
+    stop_event = threading.Event()
+    # Stop on SIGTERM (containers, process managers) the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    launch_started = time.monotonic()
+    print(f"🚀 Starting {', '.join(component.name for component in supervised)}...")
+    threads = [threading.Thread(target=component.supervise, args=(stop_event,), daemon=True)
+               for component in supervised]
+    for thread in threads:
+        thread.start()
+
+    # Report once everything is up; startup takes as long as the slowest component
+    def report_ready():
+        for component in supervised:
+            while not stop_event.is_set() and component.process is None:
+                stop_event.wait(0.05)
+            if not wait_until_ready(component.ready_url, None, stop_event):
+                return
+        print(f"🎉 DocuGenius ready in {time.monotonic() - launch_started:.2f}s (Ctrl+C to stop)")
+    threading.Thread(target=report_ready, daemon=True).start()
+
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(0.5)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    print("\n🛑 Shutting down...")
+    # A second Ctrl+C must not abandon children mid-shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Supervisors exit first so nothing is restarted while we stop the children
+    for thread in threads:
+        thread.join(timeout=STOP_TIMEOUT)
+    for component in supervised:
+        component.stop()
+    print("👋 All components stopped")
+    if any(component.failed for component in supervised):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
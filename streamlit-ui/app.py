@@ -2,20 +2,13 @@ import streamlit as st
 import requests
 import json
 import time
-import re
 from datetime import datetime
 from typing import Dict, List, Optional
-import plotly.graph_objects as go
-import plotly.express as px
-from streamlit_ace import st_ace
 from streamlit_option_menu import option_menu
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-import io
+import hashlib
+
+# Heavy page-specific dependencies (streamlit_ace, plotly, pandas) are imported
+# inside the pages that use them, so most sessions never pay for them
 
 # Page configuration
 st.set_page_config(
@@ -124,6 +117,15 @@ st.markdown("""
 # API Configuration
 API_BASE_URL = "http://localhost:8000"
 
+def error_detail(response):
+    """The API's error detail, or the status line when the body is not JSON (proxy pages, bare 499s)"""
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    detail = body.get("detail") if isinstance(body, dict) else None
+    return str(detail) if detail else f"HTTP {response.status_code}"
+
 class DocuGeniusAPI:
     @staticmethod
     def health_check():
@@ -136,10 +138,44 @@ class DocuGeniusAPI:
     
     @staticmethod
     def get_modes():
-        """Get available documentation modes"""
+        """Get available documentation modes, revalidating the copy from earlier reruns by ETag"""
+        etag, modes = st.session_state.get("modes_cache", (None, None))
+        try:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = requests.get(f"{API_BASE_URL}/ask/modes", headers=headers, timeout=5)
+            if response.status_code == 304:
+                return modes
+            if response.status_code != 200:
+                return None
+            st.session_state.modes_cache = (response.headers.get("ETag"), response.json())
+            return st.session_state.modes_cache[1]
+        except requests.exceptions.RequestException:
+            return None
+    
+    @staticmethod
+    def get_examples():
+        """Get the preset prompts, revalidating the copy from earlier reruns by ETag"""
+        etag, examples = st.session_state.get("examples_cache", (None, None))
+        try:
+            headers = {"If-None-Match": etag} if etag else {}
+            response = requests.get(f"{API_BASE_URL}/examples/", headers=headers, timeout=5)
+            if response.status_code == 304:
+                return examples
+            if response.status_code != 200:
+                return None
+            st.session_state.examples_cache = (response.headers.get("ETag"), response.json())
+            return st.session_state.examples_cache[1]
+        except requests.exceptions.RequestException:
+            return None
+    
+    @staticmethod
+    def detect_languages(texts):
+        """Ranked language candidates for each snippet, from the backend's detector"""
         try:
-            response = requests.get(f"{API_BASE_URL}/ask/modes", timeout=5)
-            return response.json() if response.status_code == 200 else None
+            response = requests.post(f"{API_BASE_URL}/language/detect", json={"texts": texts}, timeout=5)
+            if response.status_code != 200:
+                return None
+            return response.json()["results"]
         except requests.exceptions.RequestException:
             return None
     
@@ -152,28 +188,42 @@ class DocuGeniusAPI:
                 json=request_data,
                 timeout=60
             )
-            return response.json() if response.status_code == 200 else None
+            if response.status_code != 200:
+                return {"error": error_detail(response)}
+            result = response.json()
+            # Per-stage server timings, and the round trip as the client saw it
+            result["server_timing"] = parse_server_timing(response.headers.get("Server-Timing", ""))
+            result["round_trip"] = response.elapsed.total_seconds()
+            return result
         except requests.exceptions.RequestException as e:
             return {"error": str(e)}
-
-def detect_language(text):
-    """Detect programming language from text"""
-    patterns = {
-        'python': [r'def\s+\w+\s*\(', r'import\s+\w+', r'from\s+\w+\s+import', r'class\s+\w+'],
-        'javascript': [r'function\s+\w+\s*\(', r'const\s+\w+\s*=', r'let\s+\w+\s*=', r'var\s+\w+\s*='],
-        'java': [r'public\s+class', r'import\s+java', r'System\.out\.println'],
-        'typescript': [r'interface\s+\w+', r'type\s+\w+', r'const\s+\w+:\s*\w+'],
-        'rust': [r'fn\s+\w+\s*\(', r'let\s+\w+:\s*\w+'],
-        'go': [r'func\s+\w+\s*\(', r'package\s+main'],
-        'cpp': [r'#include', r'int\s+main\s*\('],
-        'csharp': [r'using\s+System', r'public\s+class'],
-    }
     
-    for lang, patterns_list in patterns.items():
-        for pattern in patterns_list:
-            if re.search(pattern, text, re.IGNORECASE):
-                return lang
-    return 'text'
+    @staticmethod
+    def upload_sources(uploaded_file, target, mode, audience):
+        """Send a file or archive to /upload/ as multipart form data instead of a JSON string"""
+        try:
+            response = requests.post(
+                f"{API_BASE_URL}/upload/",
+                files={"file": (uploaded_file.name, uploaded_file, uploaded_file.type or "application/octet-stream")},
+                data={"target": target, "mode": mode, "audience": audience},
+                timeout=120
+            )
+            if response.status_code not in (200, 202):
+                return {"error": error_detail(response)}
+            result = response.json()
+            result["server_timing"] = parse_server_timing(response.headers.get("Server-Timing", ""))
+            result["round_trip"] = response.elapsed.total_seconds()
+            return result
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e)}
+    
+    @staticmethod
+    def export_pdf(result):
+        """Render a result as a PDF report on the backend"""
+        response = requests.post(f"{API_BASE_URL}/export/pdf", json=result, timeout=60, stream=True)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(error_detail(response), response=response)
+        return b"".join(response.iter_content(chunk_size=64 * 1024))
 
 def format_time(seconds):
     """Format time in a human-readable way"""
@@ -181,101 +231,61 @@ def format_time(seconds):
         return f"{int(seconds * 1000)}ms"
     return f"{seconds:.1f}s"
 
+def parse_server_timing(header):
+    """{metric: milliseconds} from a Server-Timing header"""
+    timings = {}
+    for metric in header.split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key == "dur":
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+def format_stage_timings(result):
+    """One-line summary of where a request's time went, or None without Server-Timing"""
+    timings = dict(result.get("server_timing") or {})
+    total = timings.pop("total", None)
+    if total is None:
+        return None
+    stages = [f"{name} {format_time(ms / 1000)}" for name, ms in sorted(timings.items(), key=lambda item: -item[1])
+              if ms >= 1]
+    if result.get("round_trip"):
+        # Whatever the server did not account for was spent on the network and in the client
+        stages.append(f"network/client {format_time(max(0.0, result['round_trip'] - total / 1000))}")
+    return "⏱️ " + " · ".join(stages) if stages else None
+
+def detect_languages(texts: List[str]) -> List[List[Dict]]:
+    """Language candidates per snippet, asking the backend once per snippet and session"""
+    known = st.session_state.setdefault("detected_languages", {})
+    keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+    missing = {key: text for key, text in zip(keys, texts) if key not in known}
+    if missing:
+        results = DocuGeniusAPI.detect_languages(list(missing.values()))
+        if results is None:
+            # Backend unreachable: highlight as plain text and ask again on the next rerun
+            return [known.get(key, []) for key in keys]
+        known.update(zip(missing, results))
+    return [known[key] for key in keys]
+
 def format_confidence(confidence):
     """Format confidence as percentage"""
     return f"{confidence * 100:.0f}%"
 
+def report_key(result: Dict) -> str:
+    """Session key of the PDF report for a result"""
+    return hashlib.sha256(json.dumps(result, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 def generate_pdf(result: Dict) -> bytes:
-    """Generate PDF from the explanation result"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    story = []
-    
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        textColor=colors.HexColor('#667eea')
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=20,
-        textColor=colors.HexColor('#4a5568')
-    )
-    normal_style = styles['Normal']
-    
-    # Title
-    story.append(Paragraph("DocuGenius - AI Explanation Report", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Metrics
-    story.append(Paragraph("📊 Generation Metrics", heading_style))
-    metrics_data = [
-        ["Metric", "Value"],
-        ["Generation Time", f"{result.get('generation_time', 0):.2f} seconds"],
-        ["Confidence", f"{result.get('confidence', 0):.1%}"],
-        ["Success", "✅" if result.get('success', False) else "❌"]
-    ]
-    metrics_table = Table(metrics_data, colWidths=[2*inch, 3*inch])
-    metrics_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#667eea')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    story.append(metrics_table)
-    story.append(Spacer(1, 20))
-    
-    # Main Explanation
-    if result.get('explanation'):
-        story.append(Paragraph("📝 Explanation", heading_style))
-        story.append(Paragraph(result['explanation'], normal_style))
-        story.append(Spacer(1, 20))
-    
-    # Breakdown
-    if result.get('breakdown'):
-        story.append(Paragraph("📋 Breakdown", heading_style))
-        for i, step in enumerate(result['breakdown'], 1):
-            story.append(Paragraph(f"{i}. {step}", normal_style))
-        story.append(Spacer(1, 20))
-    
-    # Code Analysis
-    if result.get('code_analysis'):
-        story.append(Paragraph("💻 Code Analysis", heading_style))
-        for i, code in enumerate(result['code_analysis'], 1):
-            story.append(Paragraph(f"Analysis {i}:", normal_style))
-            story.append(Paragraph(f"<code>{code}</code>", normal_style))
-            story.append(Spacer(1, 10))
-        story.append(Spacer(1, 20))
-    
-    # External Resources
-    if result.get('external_resources'):
-        story.append(Paragraph("🔗 External Resources", heading_style))
-        for resource in result['external_resources']:
-            if isinstance(resource, dict) and 'url' in resource:
-                story.append(Paragraph(f"📚 {resource['name']}: {resource['url']}", normal_style))
-            else:
-                story.append(Paragraph(f"📚 {resource}", normal_style))
-        story.append(Spacer(1, 20))
-    
-    # Message
-    if result.get('message'):
-        story.append(Paragraph("ℹ️ Additional Information", heading_style))
-        story.append(Paragraph(result['message'], normal_style))
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer.getvalue()
+    """Get the PDF report for a result, fetching it from the backend once per session"""
+    key = report_key(result)
+    reports = st.session_state.setdefault("pdf_reports", {})
+    if key not in reports:
+        reports[key] = DocuGeniusAPI.export_pdf(result)
+    return reports[key]
 
 def main():
     # Sidebar navigation
@@ -402,6 +412,8 @@ def show_generate_page():
             'diagram': 'Diagram'
         }
     
+    from streamlit_ace import st_ace
+    
     # Create two columns for input and output
     col1, col2 = st.columns([1, 1])
     
@@ -418,9 +430,12 @@ def show_generate_page():
         )
         
         # Detect language
-        detected_lang = detect_language(query) if query else 'text'
-        if detected_lang != 'text':
-            st.info(f"🔍 Detected language: {detected_lang}")
+        detected = detect_languages([query])[0] if query else []
+        detected_lang = detected[0]["language"] if detected else 'text'
+        if detected:
+            st.info("🔍 Detected language: " + ", ".join(
+                f"{candidate['language']} ({format_confidence(candidate['confidence'])})" for candidate in detected
+            ))
         
         # Mode selection
         selected_mode = st.selectbox(
@@ -446,7 +461,15 @@ def show_generate_page():
             if not query.strip():
                 st.warning("Please enter a query or paste some code.")
             else:
-                generate_documentation(query, selected_mode, audience, False, verify_code)
+                generate_documentation(query, selected_mode, audience, False, verify_code, detected_lang)
+        
+        # Large files and whole projects go to the streaming upload endpoint
+        uploaded_file = st.file_uploader(
+            "Or upload a source file or a project archive (.zip, .tar.gz)",
+            key="source_upload"
+        )
+        if uploaded_file is not None and st.button("📤 Upload and Explain", use_container_width=True):
+            upload_documentation(uploaded_file, selected_mode, audience)
     
     with col2:
         st.markdown("### 📊 Results")
@@ -455,7 +478,7 @@ def show_generate_page():
         if 'doc_result' in st.session_state:
             display_results(st.session_state.doc_result)
 
-def generate_documentation(query, mode, audience, with_diagram, verify_code):
+def generate_documentation(query, mode, audience, with_diagram, verify_code, language=None):
     """Generate documentation and display results"""
     with st.spinner("🤖 Generating documentation..."):
         # Prepare request data
@@ -464,7 +487,8 @@ def generate_documentation(query, mode, audience, with_diagram, verify_code):
             "mode": mode,
             "audience": audience,
             "withDiagram": with_diagram,
-            "verifyCode": verify_code
+            "verifyCode": verify_code,
+            "language": language if language != 'text' else None
         }
         
         # Call API
@@ -478,6 +502,20 @@ def generate_documentation(query, mode, audience, with_diagram, verify_code):
             error_msg = result.get('error', 'Unknown error occurred') if result else 'Failed to generate documentation'
             st.error(f"❌ Error: {error_msg}")
 
+def upload_documentation(uploaded_file, mode, audience):
+    """Explain an uploaded file, or start a documentation job for an uploaded archive"""
+    archive = uploaded_file.name.lower().endswith((".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"))
+    with st.spinner("📤 Uploading..."):
+        result = DocuGeniusAPI.upload_sources(uploaded_file, "repo" if archive else "ask", mode, audience)
+    if 'error' in result:
+        st.error(f"❌ Error: {result['error']}")
+    elif archive:
+        st.success(f"✅ Documentation job started: {result['job_id']}")
+        st.caption(f"Progress: {API_BASE_URL}/repo/jobs/{result['job_id']}")
+    else:
+        st.session_state.doc_result = result
+        st.rerun()
+
 def display_results(result):
     """Display the generated documentation results"""
     if not result:
@@ -487,10 +525,18 @@ def display_results(result):
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric("Generation Time", format_time(result.get('generation_time', 0)))
+        stage_timings = format_stage_timings(result)
+        if stage_timings:
+            st.caption(stage_timings)
     with col2:
         st.metric("Confidence", format_confidence(result.get('confidence', 0)))
     with col3:
         st.metric("Success", "✅" if result.get('success', False) else "❌")
+    if result.get('model_tier'):
+        tier = result['model_tier']
+        st.caption(f"🤖 {tier['model']} ({tier['tier']} tier: {tier['reason']})")
+    if result.get('stale'):
+        st.caption("⏳ Served from an earlier answer while a fresh one is generated")
     
     # Main Explanation
     st.markdown("### 📝 Explanation")
@@ -505,9 +551,10 @@ def display_results(result):
     # Code Analysis
     if result.get('code_analysis'):
         st.markdown("### 💻 Code Analysis")
-        for i, code in enumerate(result['code_analysis'], 1):
+        languages = detect_languages(result['code_analysis'])
+        for i, (code, candidates) in enumerate(zip(result['code_analysis'], languages), 1):
             st.markdown(f"**Analysis {i}:**")
-            st.code(code, language=detect_language(code))
+            st.code(code, language=candidates[0]["language"] if candidates else "text")
             
             # Copy button
             if st.button(f"📋 Copy Analysis {i}", key=f"copy_{i}"):
@@ -533,8 +580,12 @@ def display_results(result):
     
     # Removed diagram section
     
-    # Sources (removed since we're focusing on explanation)
-    pass
+    # Project passages the answer was grounded in
+    if result.get('sources'):
+        st.markdown("### 📎 Sources")
+        for source in result['sources']:
+            symbol = f" — `{source['symbol']}`" if source.get('symbol') else ""
+            st.markdown(f"[{source['id']}] `{source['file']}` lines {source['lines']}{symbol}")
     
     # Message
     if result.get('message'):
@@ -544,69 +595,33 @@ def display_results(result):
     st.markdown("---")
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        if st.button("📄 Download PDF Report", type="primary", use_container_width=True):
-            try:
-                pdf_bytes = generate_pdf(result)
-                st.download_button(
-                    label="⬇️ Click to Download PDF",
-                    data=pdf_bytes,
-                    file_name=f"docugenius_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
-                st.success("✅ PDF generated successfully! Click the download button above.")
-            except Exception as e:
-                st.error(f"❌ Error generating PDF: {str(e)}")
+        # The report is only rendered once asked for; afterwards the session copy is offered directly
+        key = report_key(result)
+        if key not in st.session_state.get("pdf_reports", {}):
+            if not st.button("📄 Prepare PDF Report", key=f"prepare_pdf_{key}", use_container_width=True):
+                return
+        try:
+            st.download_button(
+                label="📄 Download PDF Report",
+                data=generate_pdf(result),
+                file_name=f"docugenius_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                mime="application/pdf",
+                type="primary",
+                use_container_width=True,
+                key=f"download_pdf_{key}"
+            )
+        except Exception as e:
+            st.error(f"❌ Error generating PDF: {str(e)}")
 
 def show_examples_page():
     """Display example queries and prompts"""
     st.markdown("## 📚 Quick Examples")
     st.markdown("Get started quickly with these preset prompts. Click any example to auto-fill the search.")
     
-    examples = [
-        {
-            "title": "Python Function",
-            "description": "Explain this Python function in detail",
-            "prompt": "def fibonacci(n):\n    if n <= 1:\n        return n\n    return fibonacci(n-1) + fibonacci(n-2)",
-            "category": "Code Explanation",
-            "icon": "🐍"
-        },
-        {
-            "title": "Streamlit Code",
-            "description": "Explain this Streamlit code",
-            "prompt": "col1, col2, col3 = st.columns(3)\nwith col1:\n    st.metric('Generation Time', '3.4s')\nwith col2:\n    st.metric('Confidence', '90%')",
-            "category": "Code Explanation",
-            "icon": "📊"
-        },
-        {
-            "title": "JavaScript Function",
-            "description": "Explain this JavaScript function",
-            "prompt": "function processData(data, callback) {\n    console.log('Processing:', data);\n    callback(data);\n}",
-            "category": "Code Explanation",
-            "icon": "⚡"
-        },
-        {
-            "title": "DOM Concept",
-            "description": "Explain DOM manipulation in simple terms",
-            "prompt": "What is DOM manipulation and how does it work?",
-            "category": "Concept Explanation",
-            "icon": "🌳"
-        },
-        {
-            "title": "API Concept",
-            "description": "Explain REST APIs in simple terms",
-            "prompt": "What are REST APIs and how do they work?",
-            "category": "Concept Explanation",
-            "icon": "🔗"
-        },
-        {
-            "title": "React Hooks",
-            "description": "Explain React hooks concept",
-            "prompt": "What are React hooks and why are they useful?",
-            "category": "Concept Explanation",
-            "icon": "⚛️"
-        }
-    ]
+    examples = DocuGeniusAPI.get_examples()
+    if examples is None:
+        st.error("❌ Could not load the examples. Please make sure the backend is running.")
+        return
     
     # Category filter
     categories = list(set(ex['category'] for ex in examples))
@@ -669,6 +684,9 @@ def show_settings_page():
 
 def show_analytics_page():
     """Display usage analytics and statistics"""
+    import plotly.express as px
+    import pandas as pd
+    
     st.markdown("## 📊 Analytics")
     
     # Mock analytics data
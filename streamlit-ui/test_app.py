@@ -105,15 +105,27 @@ def test_language_detection():
         ("func main() {", "go"),
         ("#include <iostream>", "cpp"),
         ("using System;", "csharp"),
+        ("const total: number = items.length;", "typescript"),
+        ("type Handler = (event: string) => void;", "typescript"),
+        ("public string Name { get; set; }", "csharp"),
+        ("import numpy as np\nnp.zeros(3)", "python"),
+        ("for i in range(10):\n    print(i)", "python"),
+        ("col1, col2 = st.columns(2)\nwith col1:\n    st.metric('Time', '3.4s')", "python"),
         ("This is just text", "text")
     ]
     
-    # Import the detection function
-    sys.path.append(os.path.join(os.path.dirname(__file__)))
-    from app import detect_language
+    # Detection runs in the backend, which the UI asks for every snippet it highlights
+    try:
+        response = requests.post("http://localhost:8000/language/detect",
+                                 json={"texts": [code for code, _ in test_cases]}, timeout=5)
+        response.raise_for_status()
+        results = response.json()["results"]
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Language detection endpoint error: {str(e)}")
+        return
     
-    for code, expected in test_cases:
-        detected = detect_language(code)
+    for (code, expected), candidates in zip(test_cases, results):
+        detected = candidates[0]["language"] if candidates else "text"
         if detected == expected:
             print(f"✅ '{code[:20]}...' -> {detected}")
         else: